@@ -1,6 +1,7 @@
-from utils import get_completion_from_messages, probability_threshold
-import numpy as np
-import sys
+from utils import get_completion_from_messages, uses_model_routing, route_completion
+import json
+import math
+import re
 
 
 class Agent:
@@ -11,7 +12,7 @@ class Agent:
     age: age of the agent
     traits: Big Five personality traits of the agent
     location: flag for staying at home or going outside
-    health_condition: flag to say if Susceptible, To_Be_Infected, Infected, or Recovered
+    health_condition: flag to say if Susceptible, To_Be_Infected, Infected, or Recovered (or another compartment of the disease model)
     day_infected: agent attribute to count the number of days agent has spent infected
     '''
 
@@ -29,9 +30,10 @@ class Agent:
         self.location=location
         self.traits=traits
 
-        #Health initialization of agent
-        self.health_condition=health_condition
-        self.day_infected=day_infected
+        #Health initialization of agent (None: already set in the world's health arrays)
+        if health_condition is not None:
+            self.health_condition=health_condition
+            self.day_infected=day_infected
 
         #Creating list for agent interactions
         self.agent_interaction=[]
@@ -40,36 +42,54 @@ class Agent:
         #Used to save individual attributes for individual-level data analysis
         self.mems = {"name":name,"age":age,"traits":traits}
 
+        #Inputs and result of the last fresh LLM decision, used by World.agents_to_decide
+        self.last_fresh_decision = None
+
+        #Multi-day plan from the LLM when the world runs with plan_days (see get_plan_decision)
+        self.plan = None
+
     #########################################
     #             Health Feedback           #
     #########################################  
     def get_health_string(self):
         '''
-        This function is to get the relevant health string for the agent. 
-        There are 3 types of health feedback an agent has: it "feels normal", "has a cough", and "has a cough and a fever."
-        On day 0 to 2, the agent feels normal. On day 3, the agent has a cough. On day 4 and 5, the agent has a fever and a cough. On day 6, the fever subsides and the agent has a cough.
+        This function is to get the relevant health string for the agent.
+        The symptoms come from the world's disease model (see disease.DiseaseModel): with the default SIR model
+        the agent feels normal on days 1 and 2 of infection, has a cough on day 3, a fever and a cough on days 4 and 5,
+        and a cough again once the fever subsides. Susceptible and recovered agents feel normal.
         '''
-        # List of health status messages for the agent
-        Health_strings=[f"You feel normal.", # Normal health status
-                        f"You have a slight cough.", # Mild symptom: cough
-                        f"You have a cough and a fever." # Severe symptoms: cough and fever
-                        ]
-
-        # If the agent is susceptible, recovered, or within first 2 days of infection, they feel normal
-        if self.health_condition=="Susceptible" or self.health_condition=="Recovered" or self.day_infected<=2:
-            return Health_strings[0]
-        
-        # On the 3rd day of infection, agent has a slight cough
-        if self.day_infected==3:
-            return Health_strings[1]
-        
-        # On 4th and 5th days of infection, agent has both cough and fever
-        if self.day_infected==4 or self.day_infected==5:
-            return Health_strings[2]
+        return self.model.disease.symptom(self.model.health_state[self.unique_id], int(self.model.days_in_state[self.unique_id]))
+
+    @property
+    def health_condition(self):
+        '''
+        Name of the agent's compartment (e.g. Susceptible, To_Be_Infected, Infected or Recovered),
+        stored as an integer code in the world's health_state array
+        '''
+        return self.model.disease.names[self.model.health_state[self.unique_id]]
+
+    @health_condition.setter
+    def health_condition(self, value):
+        self.model.health_state[self.unique_id] = self.model.disease.codes[value]
 
-        # On the 6th day of infection, the fever subsides and the agent is left with a slight cough
-        if self.day_infected==6:
-            return Health_strings[1]
+    @property
+    def day_infected(self):
+        '''
+        Days spent in the current compartment while infected, None otherwise
+        '''
+        if not self.model.disease.infected[self.model.health_state[self.unique_id]]:
+            return None
+        return int(self.model.days_in_state[self.unique_id])
+
+    @day_infected.setter
+    def day_infected(self, value):
+        self.model.days_in_state[self.unique_id] = value or 0
+
+    def is_susceptible(self):
+        return self.model.disease.susceptible[self.model.health_state[self.unique_id]]
+
+    def is_infectious(self):
+        return self.model.disease.infectious[self.model.health_state[self.unique_id]]
 
 
     ########################################
@@ -80,17 +100,39 @@ class Agent:
         """
         1) Prompt ChatGPT for reasoning & response
         2) Parse them, fallback to yes/no if needed
-        3) Return final (reasoning, response)
+        3) Return final (reasoning, response, details)
+        details holds extra fields about how the decision was obtained (e.g. model tier) for today's mems entry.
+        They are returned rather than stored on the agent because the world may run several requests for
+        one agent at once (hedging, agreement samples) and only keeps one of them.
+        With plan_days, details["plan"] is the new plan, which World.apply_decisions gives to the agent.
         """
+        if self.model.plan_days is not None:
+            reasoning, response, plan = self.get_plan_decision()
+            return reasoning, response, {"plan": plan}
+        messages = self.build_messages()
+        details = {}
+        # API errors propagate to World.decide_locations, which applies the fallback policy
+        if uses_model_routing():
+            # Cheapest model tier first, escalating while check_output finds a problem
+            output, model_used, escalations = route_completion(messages, self.check_output, temperature=0)
+            details = {"model": model_used, "escalations": "; ".join(escalations)}
+        else:
+            output = get_completion_from_messages(messages, temperature=0)
+        return (*self.parse_decision(output), details)
 
+    def build_messages(self):
+        """
+        Build today's decision prompt in chat message format.
+        Split out of get_decision so the world can batch prompts for the local backend.
+        """
         #Prompt Asked to ChatGPT
         question_prompt = f"""
         You are {self.name}. You are {self.age} years old. You are a person who is {self.traits[0]}, {self.traits[1]}, {self.traits[2]}, {self.traits[3]}, and {self.traits[4]}.
-        You live in the town of Dewberry Hollow. You have a job and go to the office for work everyday.
+        You live in the town of {self.model.town_name}. You have a job and go to the office for work everyday.
         {self.get_health_string()}
         You go to work to earn money to support yourself.
         You know about the Catasat virus spreading across the country. It is an airborne virus causing an infectious disease that spreads from human to human. The deadliness of the virus is unknown. 
-        You check the newspaper and find that {(self.model.yesterday_day_4_infected*100)/self.model.population: .1f}% of Dewberry Hollow's population were diagnosed with new infections of the Catasat virus yesterday.
+        You check the newspaper and find that {(self.model.yesterday_day_4_infected*100)/self.model.population: .1f}% of {self.model.town_name}'s population were diagnosed with new infections of the Catasat virus yesterday.
         Should you stay at home for the entire day? Please provide your reasoning.
 
         If the answer is "Yes", please state your reasoning as "Reasoning: [explanation]." 
@@ -108,54 +150,245 @@ class Agent:
         """
         # Initialize a list containing a dictionary with a system role and the question prompt content.
         messages = [{"role": "developer", "content": question_prompt}]
+        del question_prompt
+        return messages
+
+    def build_plan_messages(self):
+        """
+        Build the prompt asking for a conditional plan covering up to model.plan_days days
+        instead of a single day's decision.
+        """
+        question_prompt = f"""
+        You are {self.name}. You are {self.age} years old. You are a person who is {self.traits[0]}, {self.traits[1]}, {self.traits[2]}, {self.traits[3]}, and {self.traits[4]}.
+        You live in the town of {self.model.town_name}. You have a job and go to the office for work everyday.
+        {self.get_health_string()}
+        You go to work to earn money to support yourself.
+        You know about the Catasat virus spreading across the country. It is an airborne virus causing an infectious disease that spreads from human to human. The deadliness of the virus is unknown. 
+        You check the newspaper and find that {(self.model.yesterday_day_4_infected*100)/self.model.population: .1f}% of {self.model.town_name}'s population were diagnosed with new infections of the Catasat virus yesterday.
+        Every morning you will read the newspaper again and notice whether you have symptoms (a cough or a fever).
+        Make a plan for the next {self.model.plan_days} days: when should you stay at home for the entire day? Please provide your reasoning.
+
+        Answer with only a JSON object in this format:
+        {{"reasoning": "<explanation>", "stay_home_if_symptoms": true or false, "stay_home_above_percent": <number or null>, "days": <number of days the plan holds>, "valid_below_percent": <number or null>}}
+
+        "stay_home_above_percent": you stay home on days when the newspaper reports more than this percentage of new infections (null = the newspaper does not make you stay home).
+        "valid_below_percent": you want to reconsider the plan if the newspaper reports more than this percentage (null = never).
+        "days" must be between 1 and {self.model.plan_days}.
+
+        Example of response format:
+        {{"reasoning": "You are careful but need the money.", "stay_home_if_symptoms": true, "stay_home_above_percent": 2.0, "days": 3, "valid_below_percent": 5.0}}
+        """
+        messages = [{"role": "developer", "content": question_prompt}]
+        del question_prompt
+        return messages
+
+    def parse_plan(self, output):
+        """
+        Parse a plan completion into a dict, or None if it is not a usable plan.
+        The plan records the day it was made and is cut to at most model.plan_days days.
+        """
+        if not output:
+            return None
+        start, end = output.find("{"), output.rfind("}")
+        if start == -1 or end <= start:
+            return None
         try:
-            output = get_completion_from_messages(messages, temperature=0)
-        except Exception as e:
-            print(f"Something unexpected happened: {e}")
-            sys.exit(e)
+            answer = json.loads(output[start:end + 1])
+            plan = {
+                "day": self.model.time_step,
+                "reasoning": str(answer.get("reasoning", "")).strip(),
+                "stay_home_if_symptoms": bool(answer.get("stay_home_if_symptoms", True)),
+                "stay_home_above_percent": None,
+                "days": min(max(int(answer.get("days", 1)), 1), self.model.plan_days),
+                "valid_below_percent": None,
+            }
+            for key in ["stay_home_above_percent", "valid_below_percent"]:
+                if answer.get(key) is not None:
+                    plan[key] = float(answer[key])
+        except (json.JSONDecodeError, AttributeError, TypeError, ValueError):
+            return None
+        return plan
+
+    def plan_valid(self):
+        """
+        Whether the agent's plan still covers today: it has not expired and the newspaper figure
+        has not gone past the level the plan was made for.
+        """
+        plan = getattr(self, "plan", None)
+        if plan is None or self.model.time_step - plan["day"] >= plan["days"]:
+            return False
+        if plan["valid_below_percent"] is not None and self.model.newspaper_percentage() > plan["valid_below_percent"]:
+            return False
+        return True
+
+    def plan_decision(self, plan=None):
+        """
+        Evaluate a plan (default: the agent's plan) for today without asking the LLM. Returns (reasoning, response).
+        """
+        plan = self.plan if plan is None else plan
+        symptoms = self.get_health_string() != "You feel normal."
+        newspaper = self.model.newspaper_percentage()
+        if symptoms and plan["stay_home_if_symptoms"]:
+            return f"Plan from day {plan['day']}: staying home with symptoms. {plan['reasoning']}", "yes"
+        if plan["stay_home_above_percent"] is not None and newspaper > plan["stay_home_above_percent"]:
+            return f"Plan from day {plan['day']}: {newspaper}% new infections is above {plan['stay_home_above_percent']}%. {plan['reasoning']}", "yes"
+        return f"Plan from day {plan['day']}: going to work. {plan['reasoning']}", "no"
+
+    def get_plan_decision(self):
+        """
+        Ask the LLM for a new plan and return (reasoning, response, plan) for today under it (see plan_from_output).
+        """
+        return self.plan_from_output(get_completion_from_messages(self.build_plan_messages(), temperature=0))
 
-        reasoning = ""
-        response  = ""
+    def plan_from_output(self, output):
+        """
+        Parse the plan from output and return (reasoning, response, plan) with today's decision under it.
+        The plan is not stored on the agent here: the world assigns it in apply_decisions once it knows
+        which request's answer it keeps. Split out of get_plan_decision so the world can batch plan
+        prompts for the local backend.
+        If the answer is not a usable plan, plan is None (the agent is asked again tomorrow)
+        and today's response defaults to a random yes/no like parse_decision.
+        """
+        plan = self.parse_plan(output)
+        if plan is None:
+            response = self.fallback_rng().choice(["yes", "no"])
+            print(f"Plan was not parsed correctly. Defaulting to: {response}")
+            return None, response, None
+        reasoning, response = self.plan_decision(plan)
+        print(f"\n{self.name}'s Plan: {plan}\n{self.name}'s response: {response}")
+        return reasoning, response, plan
+
+    @staticmethod
+    def extract_decision(output):
+        """
+        Split a completion into (reasoning, response) without any fallback.
+        Both are None if the format was not followed.
+        """
         try:
             intermediate = output.split("Reasoning:", 1)[1]
             reasoning, response = intermediate.split("Response:")
             reasoning = reasoning.strip()
             # Take everything up to the first period (or the entire string if no period)
             response = response.strip().split(".", 1)[0]
+            return reasoning, response
         except:
+            return None, None
+
+    def check_output(self, output, logprobs=None, confidence_threshold=None):
+        """
+        Reason to escalate a completion to a stronger model, or None if it is usable:
+         - "parse failure": no Reasoning/Response, or a response other than yes/no
+         - "contradiction": the reasoning concludes the opposite of the response
+         - "low confidence": the probability of the yes/no token is below confidence_threshold (needs logprobs)
+        """
+        reasoning, response = self.extract_decision(output)
+        if not response or response.lower() not in ["yes", "no"]:
+            return "parse failure"
+        response = response.lower()
+
+        # Look only at the last sentence of the reasoning, where the conclusion usually is
+        conclusion = re.split(r"(?<=[.!?])\s+", reasoning.strip())[-1].lower() if reasoning else ""
+        says_home = re.search(r"\b(should|will|decide to|better to|best to) stay (at )?home\b", conclusion)
+        says_out = re.search(r"\b(should|will|decide to|better to|best to) go (to work|outside|out|to the office)\b", conclusion)
+        if (says_home and not says_out and response == "no") or (says_out and not says_home and response == "yes"):
+            return "contradiction"
+
+        if confidence_threshold is not None and logprobs:
+            for token, logprob in reversed(logprobs):
+                if token.strip().lower() in ["yes", "no"]:
+                    if math.exp(logprob) < confidence_threshold:
+                        return "low confidence"
+                    break
+        return None
+
+    def fallback_rng(self):
+        """
+        Generator for the random yes/no of an unparseable answer; keyed by agent and day, so the
+        draw does not depend on which worker thread parses first.
+        """
+        return self.model.random.for_agent("fallback", self.unique_id, self.model.time_step)
+
+    def parse_decision(self, output):
+        """
+        Parse a completion into (reasoning, response), falling back to a random yes/no if needed.
+        """
+        reasoning, response = self.extract_decision(output)
+        if response is None:
             print("Reasoning or response were not parsed correctly.")
-            reasoning = None
-            response  = None
 
         # If response is None (failed parsing), or it's not 'yes'/'no', fallback to random:
         if not response:
-            response = np.random.choice(["yes", "no"], replace=False)
+            response = self.fallback_rng().choice(["yes", "no"])
             print(f"No valid response found. Defaulting to: {response}")
         else:
             response = response.lower()
             if response not in ["yes", "no"]:
-                response = np.random.choice(["yes", "no"], replace=False)
+                response = self.fallback_rng().choice(["yes", "no"])
                 print(f"Response was unexpected. Defaulting to: {response}")
 
         
         # Debug printing
         print(f"\n{self.name}'s Reasoning: {reasoning}\n{self.name}'s response: {response}")
 
-        del question_prompt
         return reasoning, response
 
 
+    ########################################
+    #      Fallback decision functions     #
+    ########################################
+
+    def stub_decision(self):
+        """
+        Rule-based stand-in used when no LLM decision is available:
+        stay home when showing symptoms, otherwise go to work.
+        """
+        if self.get_health_string() == "You feel normal.":
+            return "Stub policy: no symptoms, going to work.", "no"
+        return "Stub policy: showing symptoms, staying home.", "yes"
+
+    def previous_decision(self):
+        """
+        Return yesterday's (reasoning, response), or None if the agent has not decided yet.
+        """
+        yesterday = self.mems.get(self.model.time_step - 1)
+        if yesterday is None:
+            return None
+        return yesterday["reasoning"], yesterday["response"]
+
+    def fallback_decision(self, policy):
+        """
+        Return (reasoning, response, fallback) for an agent whose LLM decision is missing.
+        fallback names what was actually used: "previous" or "stub".
+        The "previous" and "retry" policies fall back to the stub when there is no earlier decision.
+        """
+        if policy in ["previous", "retry"]:
+            previous = self.previous_decision()
+            if previous is not None:
+                return previous[0], previous[1], "previous"
+        reasoning, response = self.stub_decision()
+        return reasoning, response, "stub"
+
+
     ########################################
     #      Decide Location functions       #
     ########################################
 
-    def decide_location(self):
+    def decide_location(self, decision=None, fallback=None, details=None):
         """
         Agents decide whether they want to stay home or go outside.
         We set location accordingly, then store the final location
         (and reasoning) in mems.
+        decision: (reasoning, response) already obtained by the world; asks the LLM if None
+        fallback: None for a fresh LLM decision, otherwise "previous" or "stub"
+        details: extra fields for today's mems entry (e.g. whether the decision came from a grouped prompt)
         """
-        reasoning, response = self.get_decision()
+        if decision is None:
+            reasoning, response, fresh_details = self.get_decision()
+            if "plan" in fresh_details:
+                self.plan = fresh_details.pop("plan")
+            details = {**fresh_details, **(details or {})}
+        else:
+            reasoning, response = decision
 
         # If agent wants to stay home
         if response == "yes":
@@ -173,8 +406,12 @@ class Agent:
             "reasoning": reasoning,
             "response": response,
             "health string": self.get_health_string(),
-            "location": self.location
+            "location": self.location,
+            "newspaper": self.model.newspaper_percentage(),
+            "fallback": fallback
         }
+        if details:
+            self.mems[self.model.time_step].update(details)
         del reasoning, response
 
 
@@ -221,24 +458,24 @@ class Agent:
         Used in self.interact()
         '''
         
-        #sets infection threshold
-        infection_rate = self.model.infection_rate
-
-
         #if self is sick and other is not
-        if self.health_condition=="Infected":
+        if self.is_infectious():
 
-            #See if there is a chance they get infected
-            if probability_threshold(infection_rate) and other.health_condition=="Susceptible":
+            #See if there is a chance they get infected (World.transmits rolls against the infection rate)
+            if self.model.transmits(self, other) and other.is_susceptible():
 
                 #Other is infected
                 other.health_condition="To_Be_Infected"
+                if self.model.transmission_log is not None:
+                    self.model.transmission_log.infection(self.model.time_step + 1, self.unique_id, other.unique_id)
 
         #if other is sick and self is not
-        elif other.health_condition=="Infected":
+        elif other.is_infectious():
 
             #See if there is a chance they get infected
-            if probability_threshold(infection_rate) and self.health_condition == "Susceptible":
+            if self.model.transmits(self, other) and self.is_susceptible():
 
                 #Self is infected
                 self.health_condition="To_Be_Infected"
+                if self.model.transmission_log is not None:
+                    self.model.transmission_log.infection(self.model.time_step + 1, other.unique_id, self.unique_id)
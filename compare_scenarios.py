@@ -0,0 +1,107 @@
+# Paired comparison of two scenarios with common random numbers, e.g.
+# python compare_scenarios.py --scenario_a infection_rate=0.1 --scenario_b infection_rate=0.2 --pairs 10 --compare_days 40
+# Each pair runs both scenarios from the same seed with --common_random_numbers, so the same agents
+# meet and roll the same transmission draws until the parameters make the runs differ. The per-pair
+# differences (B - A) of each outcome are reported with a 95% confidence interval, next to the interval
+# an unpaired comparison of the same runs would give.
+# LLM options of main.py apply; use --base_url with mock_server.py for a dry run.
+import contextlib
+import copy
+import io
+import math
+
+import numpy as np
+import pandas as pd
+
+from counterfactuals import parse_scenario
+from main import get_parser, configure_llm_from_args
+from utils import t_quantile, confidence_interval
+from world import World
+
+# Pairs needed for a usable interval: with fewer the standard deviation of the differences is too noisy
+MIN_PAIRS = 4
+
+
+def run_scenario(args, overrides, seed, days):
+    '''
+    Run one scenario from `seed` for up to `days` days (stopping early like run_model) and return its outcomes
+    '''
+    args = copy.copy(args)
+    args.seed = seed
+    args.common_random_numbers = True
+    model = World(args)
+    for key, value in overrides.items():
+        setattr(model, key, value)
+    days_without_infected = 0
+    peak = model.currently_infected
+    contacts = 0
+    home = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(days):
+            model.step()
+            peak = max(peak, model.currently_infected)
+            contacts += model.total_contacts_today
+            home.append(sum(agent.location == "home" for agent in model.schedule) / model.population)
+            days_without_infected = days_without_infected + 1 if model.currently_infected == 0 else 0
+            if days_without_infected == 2:
+                break
+    ever_infected = sum(agent.health_condition != "Susceptible" for agent in model.schedule)
+    return {
+        "attack rate": ever_infected / model.population,
+        "peak infected": peak,
+        "total contacts": contacts,
+        "share at home": float(np.mean(home)) if home else 0.0,
+        "days": model.time_step,
+    }
+
+
+def unpaired_half_width(a, b):
+    '''
+    Half width of the Welch 95% interval for mean(b) - mean(a), treating the runs as independent
+    '''
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    va, vb = a.var(ddof=1) / len(a), b.var(ddof=1) / len(b)
+    if va + vb == 0:
+        return 0.0
+    df = (va + vb) ** 2 / (va**2 / (len(a) - 1) + vb**2 / (len(b) - 1))
+    return t_quantile(df) * math.sqrt(va + vb)
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    parser.add_argument("--scenario_a", default="", help="Comma-separated attribute=value overrides of scenario A (default: unchanged).")
+    parser.add_argument("--scenario_b", required=True, help="Comma-separated attribute=value overrides of scenario B.")
+    parser.add_argument("--pairs", default=10, type=int, help="Number of seeds, each running both scenarios.")
+    parser.add_argument("--compare_days", default=40, type=int, help="Maximum days per run.")
+    parser.add_argument("--compare_output", default=None, help="Optional CSV with the outcomes of every run.")
+    args = parser.parse_args()
+    if args.pairs < MIN_PAIRS:
+        parser.error(f"--pairs must be at least {MIN_PAIRS}")
+    configure_llm_from_args(args)
+
+    # Values take the type of the matching command-line option (e.g. contact_rate is an int)
+    scenario_a = parse_scenario(args.scenario_a, args, parser) if args.scenario_a else {}
+    scenario_b = parse_scenario(args.scenario_b, args, parser)
+    first_seed = args.seed if args.seed is not None else 0
+
+    rows = []
+    for pair in range(args.pairs):
+        seed = first_seed + pair
+        for label, overrides in [("A", scenario_a), ("B", scenario_b)]:
+            outcome = run_scenario(args, overrides, seed, args.compare_days)
+            rows.append(dict(outcome, scenario=label, seed=seed))
+            print(f"seed {seed} scenario {label}: {outcome}")
+    table = pd.DataFrame(rows)
+    if args.compare_output:
+        table.to_csv(args.compare_output, index=False)
+
+    a = table[table["scenario"] == "A"].set_index("seed")
+    b = table[table["scenario"] == "B"].set_index("seed")
+    print(f"\nB - A over {args.pairs} pairs (A: {scenario_a or 'unchanged'}, B: {scenario_b})")
+    print("outcome | mean difference | paired 95% CI | unpaired 95% CI | variance reduction")
+    for outcome in ["attack rate", "peak infected", "total contacts", "share at home"]:
+        mean, half_width = confidence_interval(b[outcome] - a[outcome])
+        unpaired = unpaired_half_width(a[outcome], b[outcome])
+        reduction = f"{(unpaired / half_width) ** 2:.1f}x" if half_width > 0 else "-"
+        print(f"{outcome} | {mean:.4f} | [{mean - half_width:.4f}, {mean + half_width:.4f}] | "
+              f"[{mean - unpaired:.4f}, {mean + unpaired:.4f}] | {reduction}")
@@ -0,0 +1,121 @@
+import numpy as np
+
+# Edge layers, in priority order when two agents are tied in more than one way
+HOUSEHOLD, WORKPLACE, RANDOM = 0, 1, 2
+
+
+class ContactNetwork:
+    '''
+    Persistent contact network of a World, built once: households, workplaces and random ties,
+    stored as a compressed sparse row adjacency over agent unique_ids (both directions of every tie).
+     - indptr, indices: neighbors of agent i are indices[indptr[i]:indptr[i + 1]]
+     - layer: HOUSEHOLD, WORKPLACE or RANDOM for every stored edge
+    Daily contacts are sampled from it with whole-array operations (see sample), so a day costs
+    time linear in the number of edges.
+    '''
+
+    def __init__(self, population, indptr, indices, layer):
+        self.population = population
+        self.indptr = indptr
+        self.indices = indices
+        self.layer = layer
+        sources = np.repeat(np.arange(population, dtype=indices.dtype), np.diff(indptr))
+        # Each tie once (source < target) for sampling
+        upper = indices > sources
+        self.edge_sources = sources[upper]
+        self.edge_targets = indices[upper]
+        self.edge_household = layer[upper] == HOUSEHOLD
+        # Ties outside the household, which is what the daily contact rate is spread over
+        self.outside_degree = np.bincount(sources[layer != HOUSEHOLD], minlength=population)
+
+    @classmethod
+    def build(cls, population, rng, household_size=2.5, workplace_size=10.0, random_ties=2.0):
+        '''
+        Generate the network: households and workplaces partition the agents into groups with
+        sizes 1 + Poisson(mean - 1) (capped at three times the mean) whose members are all tied;
+        random_ties is the mean number of extra ties per agent to anyone in town.
+        '''
+        index_dtype = np.int32 if population < 2**31 else np.int64
+        sources, targets, layers = [], [], []
+        for layer, mean_size in [(HOUSEHOLD, household_size), (WORKPLACE, workplace_size)]:
+            group = _random_groups(population, mean_size, rng)
+            s, t = _group_pairs(group, max_size=int(3 * mean_size) + 1)
+            sources.append(s)
+            targets.append(t)
+            layers.append(np.full(len(s), layer, dtype=np.int8))
+        count = int(population * random_ties / 2)
+        s = rng.integers(population, size=count)
+        t = rng.integers(population, size=count)
+        keep = s != t
+        sources.append(s[keep])
+        targets.append(t[keep])
+        layers.append(np.full(int(keep.sum()), RANDOM, dtype=np.int8))
+
+        s = np.concatenate(sources)
+        t = np.concatenate(targets)
+        layer = np.concatenate(layers)
+        # Both directions, then one edge per (source, target) keeping the highest-priority layer
+        s, t, layer = np.concatenate([s, t]), np.concatenate([t, s]), np.concatenate([layer, layer])
+        key = s.astype(np.int64) * population + t
+        order = np.lexsort((layer, key))
+        key, layer = key[order], layer[order]
+        first = np.ones(len(key), dtype=bool)
+        first[1:] = key[1:] != key[:-1]
+        key, layer = key[first], layer[first]
+        s, t = key // population, key % population
+
+        indptr = np.zeros(population + 1, dtype=np.int64)
+        np.cumsum(np.bincount(s, minlength=population), out=indptr[1:])
+        return cls(population, indptr, t.astype(index_dtype), layer)
+
+    def neighbors(self, unique_id):
+        return self.indices[self.indptr[unique_id]:self.indptr[unique_id + 1]]
+
+    def sample(self, outside, contact_rate, rng, away=None):
+        '''
+        Today's contacts as (sources, targets) arrays of unique_ids, each contact once.
+         - household members always meet, wherever they spent the day, unless one of them is away
+         - any other tie between two agents who are both outside is used with probability
+           contact_rate / (mean outside-household degree of its two ends), so an agent with every
+           neighbor outside expects about contact_rate such contacts, and fewer as neighbors stay home
+        outside: boolean array over unique_ids
+        away: boolean array over unique_ids of agents out of town today (e.g. travellers), or None
+        '''
+        both_outside = outside[self.edge_sources] & outside[self.edge_targets]
+        degree = (self.outside_degree[self.edge_sources] + self.outside_degree[self.edge_targets]) / 2
+        probability = np.minimum(1.0, contact_rate / np.maximum(degree, 1))
+        household = self.edge_household
+        if away is not None:
+            household = household & ~(away[self.edge_sources] | away[self.edge_targets])
+        keep = household | (both_outside & (rng.random(len(degree)) < probability))
+        return self.edge_sources[keep], self.edge_targets[keep]
+
+
+def _random_groups(population, mean_size, rng):
+    '''
+    Group id of every agent for a random partition into groups of size 1 + Poisson(mean_size - 1)
+    '''
+    cap = int(3 * mean_size)
+    sizes = np.minimum(1 + rng.poisson(max(mean_size - 1, 0), size=population), cap)
+    group_ids = np.repeat(np.arange(population), sizes)[:population]
+    group = np.empty(population, dtype=np.int64)
+    group[rng.permutation(population)] = group_ids
+    return group
+
+
+def _group_pairs(group, max_size):
+    '''
+    Every pair (i, j), i before j, of agents in the same group; groups have at most max_size members
+    '''
+    order = np.argsort(group, kind="stable")
+    sorted_group = group[order]
+    sources, targets = [], []
+    for offset in range(1, min(max_size, len(group))):
+        same = sorted_group[:-offset] == sorted_group[offset:]
+        if not same.any():
+            break
+        sources.append(order[:-offset][same])
+        targets.append(order[offset:][same])
+    if not sources:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(sources), np.concatenate(targets)
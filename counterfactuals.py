@@ -0,0 +1,83 @@
+# Fork counterfactual continuations of one checkpoint, e.g. "what happens from day 12 if infection_rate doubles":
+# python counterfactuals.py --checkpoint checkpoint/run-1/GABM-12.pkl --fork_days 30 --seeds 8 \
+#     --scenario infection_rate=0.2 --scenario infection_rate=0.2,contact_rate=3
+# Every scenario (plus the unchanged baseline) runs once per seed; all branches run in parallel
+# through World.fork and their daily data is written to one table.
+# LLM options of main.py (--base_url, rate limits, ...) apply to the branches.
+from main import get_parser, configure_llm_from_args
+from world import World
+
+
+def parse_scenario(text, model, parser=None):
+    '''
+    "infection_rate=0.2,contact_rate=3" -> {"infection_rate": 0.2, "contact_rate": 3},
+    converting each value to the type the attribute has in model. Attributes that are None in model
+    (e.g. plan_days when plans are off) take the type of the command-line option of the same name in parser.
+    '''
+    option_types = {action.dest: action.type for action in parser._actions} if parser is not None else {}
+    overrides = {}
+    for assignment in text.split(","):
+        key, value = assignment.split("=", 1)
+        key = key.strip()
+        current = getattr(model, key, None)
+        overrides[key] = parse_value(key, value.strip(), current, option_types.get(key))
+    return overrides
+
+
+def parse_value(key, value, current, option_type=None):
+    '''
+    Convert value to the type of the attribute's current value (bools from true/false/1/0), or to
+    option_type if the current value is None; raises ValueError for values that do not parse and for
+    None-valued attributes without an option type
+    '''
+    if current is None:
+        if option_type is None:
+            raise ValueError(f"Cannot set {key}: it is None and no command-line option gives its type.")
+        target = option_type
+    elif isinstance(current, bool):
+        if value.lower() in ("true", "1"):
+            return True
+        if value.lower() in ("false", "0"):
+            return False
+        raise ValueError(f"Cannot set {key} to {value!r}: expected true/false/1/0.")
+    else:
+        target = type(current)
+    try:
+        return target(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Cannot set {key} to {value!r}: expected a {getattr(target, '__name__', target)}.") from None
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    parser.add_argument("--checkpoint", required=True, help="Checkpoint to fork from.")
+    parser.add_argument("--fork_days", default=30, type=int, help="Days to run each branch.")
+    parser.add_argument("--seeds", default=4, type=int, help="Seeds per scenario.")
+    parser.add_argument("--scenario", action="append", default=[], help="Comma-separated attribute=value overrides; repeat for more scenarios.")
+    parser.add_argument("--no_baseline", action="store_true", help="Do not run the unchanged baseline scenario.")
+    parser.add_argument("--processes", default=None, type=int, help="Parallel branches (default: number of CPUs).")
+    parser.add_argument("--fork_output", default="counterfactuals.csv", help="CSV file for the combined table.")
+    args = parser.parse_args()
+    configure_llm_from_args(args)
+
+    model = World.load_checkpoint(args.checkpoint)
+    scenarios = ([] if args.no_baseline else [{}]) + [parse_scenario(text, model, parser) for text in args.scenario]
+    branches = [dict(scenario, seed=seed) for scenario in scenarios for seed in range(args.seeds)]
+    print(f"Forking {len(branches)} branches from day {model.time_step} of {args.checkpoint}")
+
+    table = model.fork(branches, args.fork_days, args.processes)
+    table.to_csv(args.fork_output, index=False)
+
+    # Final state of each branch, averaged over seeds per scenario
+    override_columns = [column for column in table.columns if column not in ["branch", "seed", "Step"]
+                        and column not in model.datacollector.model_data]
+    final = table.groupby("branch").tail(1)
+    peaks = table.groupby("branch")["Infected"].max().rename("PeakInfected")
+    final = final.join(peaks, on="branch")
+    summary_columns = ["Step", "Susceptible", "Recovered", "PeakInfected"]
+    if override_columns:
+        summary = final.groupby(override_columns, dropna=False)[summary_columns].mean()
+    else:
+        summary = final[summary_columns].mean().to_frame("baseline").T
+    print(summary.to_string())
+    print(f"Table with {len(table)} rows written to {args.fork_output}")
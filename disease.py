@@ -0,0 +1,196 @@
+import json
+
+import numpy as np
+
+# Health strings shown to agents in their prompts
+NORMAL = "You feel normal."
+COUGH = "You have a slight cough."
+FEVER = "You have a cough and a fever."
+
+# Catasat symptoms by day in the Infected compartment: normal on days 1-2, a cough on day 3,
+# cough and fever on days 4-5, then the fever subsides (later days repeat the last entry)
+CATASAT_SYMPTOMS = [NORMAL, NORMAL, COUGH, FEVER, FEVER, COUGH]
+
+# State of an agent infected today; it enters the model's infection compartment at the end of the day
+PENDING = "To_Be_Infected"
+
+# Built-in models for --disease. Durations are days or the name of a parameter (e.g. --time_to_heal).
+# Transitions leaving the same compartment are branches: they share the duration and are chosen by probability.
+BUILTIN_MODELS = {
+    "SIR": {
+        "compartments": ["Susceptible", "Infected", "Recovered"],
+        "susceptible": ["Susceptible"],
+        "infectious": ["Infected"],
+        "infected": ["Infected"],
+        "infection": "Infected",
+        "initial": "Infected",
+        "transitions": [{"from": "Infected", "to": "Recovered", "days": "time_to_heal"}],
+        "symptoms": {"Infected": CATASAT_SYMPTOMS},
+        "diagnosis": {"compartment": "Infected", "day": 4},
+    },
+    "SEIR": {
+        "compartments": ["Susceptible", "Exposed", "Infected", "Recovered"],
+        "susceptible": ["Susceptible"],
+        "infectious": ["Infected"],
+        "infected": ["Exposed", "Infected"],
+        "infection": "Exposed",
+        "initial": "Infected",
+        "transitions": [{"from": "Exposed", "to": "Infected", "days": 2},
+                        {"from": "Infected", "to": "Recovered", "days": "time_to_heal"}],
+        "symptoms": {"Infected": CATASAT_SYMPTOMS},
+        "diagnosis": {"compartment": "Infected", "day": 4},
+    },
+    "SEIRS": {
+        "compartments": ["Susceptible", "Exposed", "Infected", "Recovered"],
+        "susceptible": ["Susceptible"],
+        "infectious": ["Infected"],
+        "infected": ["Exposed", "Infected"],
+        "infection": "Exposed",
+        "initial": "Infected",
+        "transitions": [{"from": "Exposed", "to": "Infected", "days": 2},
+                        {"from": "Infected", "to": "Recovered", "days": "time_to_heal"},
+                        {"from": "Recovered", "to": "Susceptible", "days": 60}],
+        "symptoms": {"Infected": CATASAT_SYMPTOMS},
+        "diagnosis": {"compartment": "Infected", "day": 4},
+    },
+    "SEIAR": {
+        "compartments": ["Susceptible", "Exposed", "Infected", "Asymptomatic", "Recovered"],
+        "susceptible": ["Susceptible"],
+        "infectious": ["Infected", "Asymptomatic"],
+        "infected": ["Exposed", "Infected", "Asymptomatic"],
+        "infection": "Exposed",
+        "initial": "Infected",
+        "transitions": [{"from": "Exposed", "to": "Infected", "days": 2, "probability": 0.6},
+                        {"from": "Exposed", "to": "Asymptomatic", "days": 2, "probability": 0.4},
+                        {"from": "Infected", "to": "Recovered", "days": "time_to_heal"},
+                        {"from": "Asymptomatic", "to": "Recovered", "days": "time_to_heal"}],
+        "symptoms": {"Infected": CATASAT_SYMPTOMS},
+        "diagnosis": {"compartment": "Infected", "day": 4},
+    },
+}
+
+
+class DiseaseModel:
+    '''
+    Compartment model compiled from a table (see BUILTIN_MODELS for the format):
+     - compartments: names of the states; every agent is in one of them, or PENDING
+     - susceptible / infectious / infected: compartments that can be infected, that transmit, and that
+       count towards World.currently_infected (early stopping)
+     - infection: compartment entered by PENDING agents at the end of the day; initial: compartment of
+       the initially infected agents
+     - transitions: {"from", "to", "days", "probability"} rows; an agent leaves "from" after "days" days in it
+     - symptoms: health strings by day in a compartment (day 1 first, later days repeat the last entry);
+       other compartments feel normal
+     - diagnosis: agents on this day of this compartment are the newspaper's new cases
+    Agents' states are integer codes in World.health_state with the days spent in the state in
+    World.days_in_state; progress() advances all of them by a day with whole-array operations.
+    '''
+
+    def __init__(self, config, parameters=None):
+        parameters = parameters or {}
+        self.names = list(config["compartments"]) + [PENDING]
+        self.codes = {name: code for code, name in enumerate(self.names)}
+        for key in ["infection", "initial"]:
+            self._code(config[key])
+        self.pending = self.codes[PENDING]
+        self.infection = self.codes[config["infection"]]
+        self.initial = self.codes[config["initial"]]
+        self.healthy = self.codes[config["susceptible"][0]]
+        self.susceptible = self._mask(config["susceptible"])
+        self.infectious = self._mask(config["infectious"])
+        self.infected = self._mask(config["infected"])
+
+        # Duration and branches of every compartment that progresses (duration 0 = stays)
+        self.duration = np.zeros(len(self.names), dtype=np.int64)
+        branches = {}
+        for transition in config["transitions"]:
+            source, target = self._code(transition["from"]), self._code(transition["to"])
+            days = transition["days"]
+            days = int(parameters[days]) if isinstance(days, str) else int(days)
+            if days < 1:
+                raise ValueError(f"Transition {transition['from']} -> {transition['to']} must last at least one day.")
+            if self.duration[source] and self.duration[source] != days:
+                raise ValueError(f"All transitions leaving {transition['from']} must have the same duration.")
+            self.duration[source] = days
+            branches.setdefault(source, []).append((target, float(transition.get("probability", 1.0))))
+        self.targets = {}
+        self.cumulative = {}
+        for source, rows in branches.items():
+            probabilities = np.array([probability for _, probability in rows])
+            if not np.isclose(probabilities.sum(), 1.0):
+                raise ValueError(f"Probabilities of the transitions leaving {self.names[source]} must add up to 1.")
+            self.targets[source] = np.array([target for target, _ in rows])
+            self.cumulative[source] = np.cumsum(probabilities)[:-1]
+
+        # Symptom lookup: symptom_index[code, min(day, last column)] indexes symptom_strings
+        schedules = {self._code(name): list(days) for name, days in config.get("symptoms", {}).items()}
+        self.symptom_strings = [NORMAL] + sorted({s for days in schedules.values() for s in days} - {NORMAL})
+        width = max([len(days) for days in schedules.values()] + [0]) + 1
+        self.symptom_index = np.zeros((len(self.names), width), dtype=np.int64)
+        for code, days in schedules.items():
+            row = [self.symptom_strings.index(s) for s in days]
+            self.symptom_index[code, 1:] = row + [row[-1]] * (width - 1 - len(row))
+            self.symptom_index[code, 0] = row[0]
+
+        diagnosis = config.get("diagnosis")
+        self.diagnosis = (self._code(diagnosis["compartment"]), int(diagnosis["day"])) if diagnosis else None
+
+    @classmethod
+    def load(cls, disease="SIR", **parameters):
+        '''
+        Built-in model by name, or a model from a JSON file with the same format
+        '''
+        if disease in BUILTIN_MODELS:
+            return cls(BUILTIN_MODELS[disease], parameters)
+        with open(disease) as file:
+            return cls(json.load(file), parameters)
+
+    def _code(self, name):
+        if name not in self.codes or name == PENDING:
+            raise ValueError(f"Unknown compartment: {name}")
+        return self.codes[name]
+
+    def _mask(self, names):
+        mask = np.zeros(len(self.names), dtype=bool)
+        mask[[self._code(name) for name in names]] = True
+        return mask
+
+    def symptom(self, code, days):
+        return self.symptom_strings[self.symptom_index[code, min(days, self.symptom_index.shape[1] - 1)]]
+
+    def count(self, state, name):
+        '''
+        Agents in the named compartment (0 if the model has no such compartment)
+        '''
+        code = self.codes.get(name)
+        return 0 if code is None else int(np.count_nonzero(state == code))
+
+    def progress(self, state, days, uniforms):
+        '''
+        End-of-day update of all agents in place: one more day in every progressing compartment, agents
+        past its duration move on (choosing a branch with uniforms(indices), one draw per agent), and
+        PENDING agents enter the infection compartment on day 1. Returns the number of new infections.
+        '''
+        new_cases = state == self.pending
+        days[self.duration[state] > 0] += 1
+        for source, targets in self.targets.items():
+            due = np.flatnonzero((state == source) & (days > self.duration[source]))
+            if len(due) == 0:
+                continue
+            if len(targets) == 1:
+                state[due] = targets[0]
+            else:
+                state[due] = targets[np.searchsorted(self.cumulative[source], uniforms(due), side="right")]
+            days[due] = 1
+        state[new_cases] = self.infection
+        days[new_cases] = 1
+        return int(np.count_nonzero(new_cases))
+
+    def diagnosed(self, state, days):
+        '''
+        Agents on the diagnosis day of the diagnosis compartment
+        '''
+        if self.diagnosis is None:
+            return 0
+        code, day = self.diagnosis
+        return int(np.count_nonzero((state == code) & (days == day)))
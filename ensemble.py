@@ -0,0 +1,95 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils import confidence_interval
+
+# Outcomes whose precision decides when an ensemble stops
+OUTCOMES = ["peak infected", "final cumulative infections", "peak home"]
+# Replicates needed before the precision test may stop an ensemble; the standard deviation of fewer
+# is too noisy (two equal replicates would look perfectly precise)
+MIN_REPLICATES = 4
+
+
+def ensemble_outcomes(model):
+    '''
+    Key outcomes of one finished replicate, from its collected data
+    '''
+    data = model.datacollector.get_model_vars_dataframe()
+    return {
+        "peak infected": int(data["Infected"].max()),
+        "final cumulative infections": int(model.population - data["Susceptible"].iloc[-1]),
+        "peak home": int(data["# Home"].max()),
+    }
+
+
+def _replicate_outcomes(job):
+    '''
+    Run one replicate (in the parent or a forked worker) and return its outcomes
+    '''
+    run_replicate, args, i = job
+    return dict(ensemble_outcomes(run_replicate(args, i)), run=i + 1)
+
+
+def relative_half_width(mean, half_width):
+    '''
+    Interval half width as a fraction of the mean (0 when every replicate agreed on 0)
+    '''
+    if np.isnan(half_width):
+        return np.inf
+    if mean == 0:
+        return 0.0 if half_width == 0 else np.inf
+    return half_width / abs(mean)
+
+
+def run_ensemble(args, run_replicate):
+    '''
+    Run replicates in waves of args.wave_size until the 95% interval of every outcome in OUTCOMES has a
+    half width below args.ensemble_precision times its mean (checked from MIN_REPLICATES replicates on),
+    or args.no_of_runs replicates have run.
+    Replicates of a wave run in args.ensemble_processes forked processes (1 = in this process).
+    Writes output/<name>-ensemble_replicates.csv (outcomes of every replicate) and
+    output/<name>-ensemble_summary.csv (running estimates after every wave, with the stopping reason).
+    run_replicate(args, i) runs replicate i and returns its model (main.run_replicate).
+    '''
+    if args.load_from_run >= args.no_of_runs:
+        raise ValueError("--no_of_runs leaves no replicates to run")
+    replicates = []
+    waves = []
+    next_run = args.load_from_run
+    stop = None
+    while stop is None:
+        wave_runs = range(next_run, min(next_run + args.wave_size, args.no_of_runs))
+        next_run = wave_runs.stop
+        jobs = [(run_replicate, args, i) for i in wave_runs]
+        if args.ensemble_processes > 1:
+            # One replicate per worker process, like World.fork
+            with multiprocessing.get_context("fork").Pool(args.ensemble_processes, maxtasksperchild=1) as pool:
+                replicates.extend(pool.map(_replicate_outcomes, jobs, chunksize=1))
+        else:
+            replicates.extend(_replicate_outcomes(job) for job in jobs)
+
+        wave = {"wave": len(waves) + 1, "replicates": len(replicates)}
+        precise = True
+        for outcome in OUTCOMES:
+            mean, half_width = confidence_interval([replicate[outcome] for replicate in replicates])
+            relative = relative_half_width(mean, half_width)
+            wave[f"{outcome} mean"] = mean
+            wave[f"{outcome} half width"] = half_width
+            wave[f"{outcome} relative half width"] = relative
+            precise = precise and relative <= args.ensemble_precision
+        if precise and len(replicates) >= MIN_REPLICATES:
+            stop = f"precision {args.ensemble_precision} reached"
+        elif next_run >= args.no_of_runs:
+            stop = f"run cap of {args.no_of_runs} (--no_of_runs) reached"
+        wave["stop"] = stop or ""
+        waves.append(wave)
+        print(f"Ensemble wave {wave['wave']}: {len(replicates)} replicates, " + ", ".join(
+            f"{outcome} = {wave[f'{outcome} mean']:.2f} ± {wave[f'{outcome} half width']:.2f}" for outcome in OUTCOMES))
+
+    pd.DataFrame(replicates).to_csv(os.path.join("output", f"{args.name}-ensemble_replicates.csv"), index=False)
+    pd.DataFrame(waves).to_csv(os.path.join("output", f"{args.name}-ensemble_summary.csv"), index=False)
+    print(f"Ensemble stopped after {len(replicates)} replicates: {stop}")
+    return waves
@@ -1,5 +1,5 @@
 from world import World
-from names_dataset import NameDataset
+from name_table import name_rank
 import ast
 import numpy as np
 import pandas as pd
@@ -28,7 +28,6 @@ df["Daily New Cases Day 4"] = model.day_infected_is_4[:len(df)]
 #save statistical data as a .csv file
 df.to_csv("stats_for_agents.csv")
 
-nd = NameDataset()
 df_full = pd.DataFrame()
 
 file_indiv = "responses_over_time.csv" #response file dir
@@ -115,27 +114,14 @@ s=2000 #Change for # of sampled names
 country_alpha2='US'
 if s % 2 == 1:
     s += 1
-male_names = nd.get_top_names(s//2, 'Male', country_alpha2)[country_alpha2]['M']
-female_names = nd.get_top_names(s//2, 'Female', country_alpha2)[country_alpha2]['F']
 
-
-# Store male and female names into dictionaries with their rank
-male_name_rank = {name: rank+1 for rank, name in enumerate(male_names)}
-female_name_rank = {name: rank+1 for rank, name in enumerate(female_names)}
-
-# Create new lists for gender and rank
+# Create new lists for gender and rank among the s//2 most popular names of each gender
 gender = []
 rank = []
 for name in data_name:
-    if name in male_name_rank:
-        rank.append(male_name_rank[name])
-        gender.append(1)
-    elif name in female_name_rank:
-        rank.append(female_name_rank[name])
-        gender.append(0)
-    else:
-        rank.append(None)
-        gender.append(None)
+    agent_gender, agent_rank = name_rank(name, country_alpha2, top=s//2)
+    gender.append(agent_gender)
+    rank.append(agent_rank)
 
 # Convert lists into Series
 gender = pd.Series(gender, name='gender')
@@ -66,6 +66,12 @@ def evaluate_simulation(model, args, run_number, output_path):
             response_str = daily_info.get("response", "").lower().strip()
             location_str = daily_info.get("location", "").lower().strip()
             health_str = daily_info.get("health condition", "")
+            fallback_str = daily_info.get("fallback") or ""
+            batched = daily_info.get("batched")
+            model_used = daily_info.get("model", "")
+            escalations = daily_info.get("escalations", "")
+            carried_forward = daily_info.get("carried forward")
+            replayed = daily_info.get("replayed")
 
             # Create binary flags for health conditions
             susceptible_flag = 1 if health_str == "Susceptible" else 0
@@ -92,7 +98,13 @@ def evaluate_simulation(model, args, run_number, output_path):
                 "response_str": response_str,
                 "response_flag": response_flag,
                 "location_str": location_str,
-                "location_flag": location_flag
+                "location_flag": location_flag,
+                "fallback": fallback_str,
+                "batched": "" if batched is None else int(batched),
+                "model": model_used,
+                "escalations": escalations,
+                "carried_forward": "" if carried_forward is None else int(carried_forward),
+                "replayed": "" if replayed is None else int(replayed)
             }
             expanded_rows.append(row)
     expanded_df = pd.DataFrame(expanded_rows)
@@ -147,7 +159,15 @@ def evaluate_simulation(model, args, run_number, output_path):
         "Cumulative Infections",
         "# Day 4 New Cases", 
         "# Contacts", 
-        "Max # of Potential Contact"
+        "Max # of Potential Contact",
+        "Fallbacks",
+        "Hedges",
+        "HedgesWon",
+        "ConcurrencyWindow",
+        "RequestsPerMinute",
+        "BatchAgreement",
+        "Escalations",
+        "CarriedForward"
     ]
     existing_order = [col for col in desired_order if col in pop_df.columns]
     pop_df = pop_df[existing_order]
@@ -0,0 +1,79 @@
+import json
+
+
+def persona_text(agent):
+    '''
+    The agent-specific lines of Agent.build_messages, in the same second-person wording
+    '''
+    return (f"You are {agent.name}. You are {agent.age} years old. You are a person who is {agent.traits[0]}, "
+            f"{agent.traits[1]}, {agent.traits[2]}, {agent.traits[3]}, and {agent.traits[4]}. {agent.get_health_string()}")
+
+
+def build_group_messages(agents, model):
+    '''
+    One prompt asking for the decisions of several agents at once.
+    The scenario and newspaper figure are stated once; each persona is listed under its unique_id,
+    and the answer must be a JSON array with one object per id.
+    '''
+    personas = "\n".join(f"        Person {agent.unique_id}: {persona_text(agent)}" for agent in agents)
+    question_prompt = f"""
+        You will answer separately for each of the {len(agents)} people described below, taking the role of each one in turn.
+        Every person lives in the town of {model.town_name}, has a job and goes to the office for work everyday, and goes to work to earn money to support themselves.
+        They all know about the Catasat virus spreading across the country. It is an airborne virus causing an infectious disease that spreads from human to human. The deadliness of the virus is unknown.
+        They check the newspaper and find that {(model.yesterday_day_4_infected*100)/model.population: .1f}% of {model.town_name}'s population were diagnosed with new infections of the Catasat virus yesterday.
+
+        The people (each description is addressed to that person):
+{personas}
+
+        For each person: should you stay at home for the entire day? Please provide your reasoning.
+
+        Answer with only a JSON array containing one object per person, in this format:
+        [{{"id": <person number>, "reasoning": "<explanation>", "response": "Yes" or "No"}}]
+
+        Example of response format:
+        [{{"id": 3, "reasoning": "You are tired.", "response": "Yes"}}]
+
+        The "response" of every person has to be a single word; it must be either "Yes" or "No".
+        """
+    return [{"role": "developer", "content": question_prompt}]
+
+
+def parse_group_output(output, agents):
+    '''
+    Map a JSON-array answer back to {unique_id: (reasoning, response)}.
+    Entries with an unknown or repeated id, or without a yes/no response, are skipped;
+    agents missing from the result have to be asked individually.
+    '''
+    expected = {agent.unique_id for agent in agents}
+    decisions = {}
+    if not output:
+        return decisions
+    start, end = output.find("["), output.rfind("]")
+    if start == -1 or end <= start:
+        return decisions
+    try:
+        entries = json.loads(output[start:end + 1])
+    except json.JSONDecodeError:
+        return decisions
+    if not isinstance(entries, list):
+        return decisions
+
+    seen = set()
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            unique_id = int(entry.get("id"))
+        except (TypeError, ValueError):
+            continue
+        response = str(entry.get("response", "")).strip().split(".", 1)[0].lower()
+        if unique_id not in expected or response not in ["yes", "no"]:
+            continue
+        if unique_id in seen:
+            # Contradicting duplicates: trust neither
+            decisions.pop(unique_id, None)
+            continue
+        seen.add(unique_id)
+        reasoning = entry.get("reasoning")
+        decisions[unique_id] = (str(reasoning).strip() if reasoning is not None else None, response)
+    return decisions
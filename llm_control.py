@@ -0,0 +1,382 @@
+import collections
+import math
+import re
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    '''
+    Raised instead of calling the API while the circuit breaker is open.
+    '''
+
+
+class CircuitBreaker:
+    '''
+    Stops sending requests to the API once it keeps failing.
+    closed: requests go through, consecutive failures are counted
+    open: after failure_threshold consecutive failures every call fails fast for cooldown seconds
+    half-open: after the cooldown a single trial request is let through;
+               success closes the circuit again, failure re-opens it
+    Shared by all decision threads, so every method takes the lock.
+    '''
+
+    def __init__(self, failure_threshold=10, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.times_opened = 0
+
+    def configure(self, failure_threshold=None, cooldown=None):
+        with self.lock:
+            if failure_threshold is not None:
+                self.failure_threshold = failure_threshold
+            if cooldown is not None:
+                self.cooldown = cooldown
+
+    def before_call(self):
+        '''
+        Called right before a request. Raises CircuitOpenError if the request must not be sent.
+        '''
+        with self.lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half-open"
+            if self.state == "half-open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return
+            raise CircuitOpenError(f"Circuit breaker is {self.state} after {self.consecutive_failures} consecutive failures.")
+
+    def record_success(self):
+        with self.lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.state == "half-open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        '''
+        End a call that was neither a success nor a failure (e.g. rate limited): the state is kept,
+        but a half-open trial gives its slot back so the next call can be the trial
+        '''
+        with self.lock:
+            self.trial_in_flight = False
+
+
+class LatencyTracker:
+    '''
+    Keeps the most recent request latencies (seconds) and reports percentiles over them.
+    Only touched from the thread that collects decision results, so it needs no lock
+    and can be pickled with the world.
+    '''
+
+    def __init__(self, window=500):
+        self.latencies = collections.deque(maxlen=window)
+
+    def record(self, latency):
+        self.latencies.append(latency)
+
+    def __len__(self):
+        return len(self.latencies)
+
+    def percentile(self, q):
+        '''
+        q-th percentile (0-100) of the recorded latencies, None if nothing was recorded yet.
+        '''
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(math.ceil(q / 100 * len(ordered))) - 1)
+        return ordered[max(index, 0)]
+
+
+def parse_reset_seconds(value):
+    '''
+    Convert a rate-limit reset header value to seconds.
+    Handles plain seconds ("1.5") and OpenAI durations ("20ms", "6s", "1m30s", "2h0m0s").
+    Returns None if the value cannot be parsed.
+    '''
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+def reset_delay_from_headers(headers):
+    '''
+    Seconds to wait before the next request according to response headers, or None if no wait is requested.
+    Uses retry-after-ms / retry-after when present, otherwise the x-ratelimit-reset-* header
+    of whichever x-ratelimit-remaining-* budget is exhausted.
+    '''
+    if not headers:
+        return None
+    if headers.get("retry-after-ms") is not None:
+        delay = parse_reset_seconds(headers.get("retry-after-ms"))
+        return None if delay is None else delay / 1000
+    if headers.get("retry-after") is not None:
+        return parse_reset_seconds(headers.get("retry-after"))
+    delays = []
+    for kind in ["requests", "tokens"]:
+        remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+        if remaining is not None and remaining.strip() in ["0", "0.0"]:
+            delays.append(parse_reset_seconds(headers.get(f"x-ratelimit-reset-{kind}")))
+    delays = [d for d in delays if d is not None]
+    return max(delays) if delays else None
+
+
+class AIMDController:
+    '''
+    Shared gate every LLM request passes through.
+    Concurrency: at most int(window) requests are in flight. Each success grows the window by
+    increase/window (about +increase per window of successes); a 429 multiplies it by decrease,
+    at most once per round of requests (429s from requests sent before the last cut are ignored).
+    Tokens: if tokens_per_minute is set, a token bucket refilled at that rate is debited by an
+    estimate before each request and corrected with the reported usage afterwards.
+    Reset headers: retry-after and exhausted x-ratelimit-remaining-* budgets pause all new
+    requests until the reported reset time.
+    '''
+
+    def __init__(self, initial_window=4, min_window=1, max_window=32, increase=1.0, decrease=0.5,
+                 tokens_per_minute=None):
+        self.min_window = min_window
+        self.max_window = max_window
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens_per_minute = tokens_per_minute
+        self.condition = threading.Condition()
+        self.window = float(min(max(initial_window, min_window), max_window))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.tokens = float(tokens_per_minute or 0)
+        self.last_refill = time.monotonic()
+        self.completions = collections.deque()
+        self.requests = 0
+        self.rate_limited = 0
+
+    def _refill(self, now):
+        if self.tokens_per_minute:
+            self.tokens = min(self.tokens_per_minute,
+                              self.tokens + (now - self.last_refill) * self.tokens_per_minute / 60)
+        self.last_refill = now
+
+    def acquire(self, estimated_tokens=0):
+        '''
+        Block until a request may be sent. Returns the send time, to be passed back to release().
+        '''
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.in_flight >= int(self.window):
+                    wait = None  # woken by release()
+                elif self.tokens_per_minute and self.tokens < min(estimated_tokens, self.tokens_per_minute):
+                    wait = (min(estimated_tokens, self.tokens_per_minute) - self.tokens) * 60 / self.tokens_per_minute
+                else:
+                    self.in_flight += 1
+                    self.requests += 1
+                    self.tokens -= estimated_tokens
+                    return now
+                self.condition.wait(timeout=wait)
+
+    def release(self, sent_at, rate_limited=False, failed=False, headers=None, estimated_tokens=0, used_tokens=None):
+        '''
+        Report the outcome of a request started with acquire().
+        Other failures (failed=True) free the slot without moving the window.
+        '''
+        with self.condition:
+            now = time.monotonic()
+            self.in_flight -= 1
+            if used_tokens is not None and self.tokens_per_minute:
+                self.tokens -= used_tokens - estimated_tokens
+            if rate_limited:
+                self.rate_limited += 1
+                if sent_at >= self.last_decrease:
+                    self.window = max(self.min_window, self.window * self.decrease)
+                    self.last_decrease = now
+            elif not failed:
+                self.window = min(self.max_window, self.window + self.increase / self.window)
+                self.completions.append(now)
+            delay = reset_delay_from_headers(headers)
+            if delay is not None:
+                self.paused_until = max(self.paused_until, now + delay)
+            self.condition.notify_all()
+
+    def stats(self):
+        '''
+        Current window, requests in flight and completed requests per minute over the last minute.
+        '''
+        with self.condition:
+            now = time.monotonic()
+            while self.completions and now - self.completions[0] > 60:
+                self.completions.popleft()
+            return {
+                "window": round(self.window, 2),
+                "in_flight": self.in_flight,
+                "requests_per_minute": len(self.completions),
+                "requests": self.requests,
+                "rate_limited": self.rate_limited,
+            }
+
+
+class Endpoint:
+    '''
+    One place decision requests can be sent: an OpenAI-compatible API (client) or a local model (local).
+    weight: share of traffic relative to other endpoints; max_concurrency: its own in-flight limit.
+    Each endpoint has its own circuit breaker, which is how unhealthy endpoints are ejected and re-admitted.
+    '''
+
+    def __init__(self, name, client=None, local=None, model=None, weight=1.0, max_concurrency=None,
+                 eject_after=3, readmit_after=30.0):
+        self.name = name
+        self.client = client
+        self.local = local
+        self.model = model
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.breaker = CircuitBreaker(failure_threshold=eject_after, cooldown=readmit_after)
+        self.outstanding = 0
+        self.paused_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.rate_limited = 0
+
+
+class EndpointPool:
+    '''
+    Spreads requests over several endpoints by least outstanding requests per unit of weight.
+    Skips endpoints that are at their concurrency limit, paused by a rate-limit reset header,
+    or ejected by their breaker (eject_after consecutive failures; one trial request after readmit_after seconds).
+    acquire() waits while every healthy endpoint is busy and raises CircuitOpenError when none is healthy.
+    '''
+
+    def __init__(self, endpoints):
+        if not endpoints:
+            raise ValueError("An endpoint pool needs at least one endpoint.")
+        self.endpoints = endpoints
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                healthy = []
+                for endpoint in self.endpoints:
+                    breaker = endpoint.breaker
+                    if breaker.state == "open" and now - breaker.opened_at < breaker.cooldown:
+                        continue
+                    if breaker.state != "closed" and breaker.trial_in_flight:
+                        continue
+                    healthy.append(endpoint)
+                if not healthy:
+                    raise CircuitOpenError("Every endpoint is ejected.")
+
+                ready = [endpoint for endpoint in healthy
+                         if now >= endpoint.paused_until
+                         and (endpoint.max_concurrency is None or endpoint.outstanding < endpoint.max_concurrency)]
+                for endpoint in sorted(ready, key=lambda e: (e.outstanding + 1) / e.weight):
+                    try:
+                        endpoint.breaker.before_call()
+                    except CircuitOpenError:
+                        continue
+                    endpoint.outstanding += 1
+                    endpoint.requests += 1
+                    return endpoint
+
+                # Everyone healthy is busy or paused: wait for a release or the earliest reset
+                pauses = [endpoint.paused_until - now for endpoint in healthy if endpoint.paused_until > now]
+                self.condition.wait(timeout=min(pauses) if pauses else 1.0)
+
+    def release(self, endpoint, failed=False, rate_limited=False, retry_after=None):
+        '''
+        Report the outcome of a request sent to endpoint. Rate limits pause the endpoint
+        (retry_after seconds, default 1s) without counting towards its ejection.
+        '''
+        with self.condition:
+            endpoint.outstanding -= 1
+            if rate_limited:
+                endpoint.rate_limited += 1
+                endpoint.paused_until = max(endpoint.paused_until, time.monotonic() + (retry_after or 1.0))
+                # Not a fault, but a half-open trial must give its slot back
+                endpoint.breaker.release_trial()
+            elif failed:
+                endpoint.failures += 1
+                endpoint.breaker.record_failure()
+            else:
+                endpoint.breaker.record_success()
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return [{"name": e.name, "state": e.breaker.state, "outstanding": e.outstanding, "requests": e.requests,
+                     "failures": e.failures, "rate_limited": e.rate_limited, "ejections": e.breaker.times_opened}
+                    for e in self.endpoints]
+
+
+class ModelRouter:
+    '''
+    Ordered model tiers, cheapest first. Records per tier the calls, latencies and how often
+    (and why) its answers were escalated to the next tier. The routing itself is utils.route_completion.
+    '''
+
+    def __init__(self, tiers, confidence_threshold=None):
+        if not tiers:
+            raise ValueError("Model routing needs at least one tier.")
+        self.tiers = tiers
+        self.confidence_threshold = confidence_threshold
+        self.lock = threading.Lock()
+        self.calls = {tier: 0 for tier in tiers}
+        self.total_latency = {tier: 0.0 for tier in tiers}
+        self.latencies = {tier: LatencyTracker() for tier in tiers}
+        self.escalations = {tier: collections.Counter() for tier in tiers}
+
+    def record(self, tier, latency, escalation_reason=None):
+        with self.lock:
+            self.calls[tier] += 1
+            self.total_latency[tier] += latency
+            self.latencies[tier].record(latency)
+            if escalation_reason is not None:
+                self.escalations[tier][escalation_reason] += 1
+
+    def summary(self):
+        '''
+        One dict per tier: calls, mean and 95th percentile latency (recent calls), escalation rate and reasons.
+        '''
+        with self.lock:
+            rows = []
+            for tier in self.tiers:
+                calls = self.calls[tier]
+                escalated = sum(self.escalations[tier].values())
+                rows.append({
+                    "model": tier,
+                    "calls": calls,
+                    "mean_latency": self.total_latency[tier] / calls if calls else None,
+                    "p95_latency": self.latencies[tier].percentile(95),
+                    "escalation_rate": escalated / calls if calls else None,
+                    "escalation_reasons": dict(self.escalations[tier]),
+                })
+            return rows
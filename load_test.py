@@ -0,0 +1,71 @@
+# Measure decision-phase throughput of World.step against the mock OpenAI server, e.g.
+# python load_test.py --no_init_healthy 498 --load_days 3 --mock_rpm 600 --latency_median 0.8 --adaptive_concurrency
+# Starts the mock server in-process unless --base_url points at a running one (python mock_server.py).
+# Every simulation option of main.py (concurrency, hedging, deadlines, ...) applies.
+import contextlib
+import io
+import time
+
+import mock_server
+from main import get_parser, configure_llm_from_args
+from utils import llm_stats
+from world import World
+
+
+def timed_step(model):
+    '''
+    Run one day and return (decision phase seconds, whole step seconds)
+    '''
+    decide_locations = model.decide_locations
+    timing = {}
+
+    def timed_decide_locations():
+        begin = time.monotonic()
+        decide_locations()
+        timing["decisions"] = time.monotonic() - begin
+
+    model.decide_locations = timed_decide_locations
+    begin = time.monotonic()
+    try:
+        # Agents print every decision; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.step()
+    finally:
+        del model.decide_locations
+    return timing["decisions"], time.monotonic() - begin
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    mock_server.add_mock_arguments(parser)
+    parser.add_argument("--load_days", default=3, type=int, help="Days to simulate for the measurement.")
+    args = parser.parse_args()
+
+    server = None
+    state = None
+    if args.base_url is None:
+        state = mock_server.state_from_args(args)
+        server, args.base_url = mock_server.start_server(state)
+    configure_llm_from_args(args)
+
+    model = World(args)
+    print(f"{model.population} agents against {args.base_url}")
+    print("day | decisions (s) | step (s) | decisions/s | fallbacks | hedges (won) | window | 429s")
+    total_decision_time = 0.0
+    last_429 = 0
+    for day in range(args.load_days):
+        decision_time, step_time = timed_step(model)
+        total_decision_time += decision_time
+        stats = llm_stats()
+        window = stats["window"] if stats else "-"
+        rejected = "-"
+        if state is not None:
+            rejected = state.counts["429"] - last_429
+            last_429 = state.counts["429"]
+        print(f"{day + 1:3d} | {decision_time:13.2f} | {step_time:8.2f} | {model.population / decision_time:11.1f} | "
+              f"{model.fallbacks_today:9d} | {model.hedges_today:6d} ({model.hedges_won_today}) | {window} | {rejected}")
+
+    print(f"Mean decision throughput: {model.population * args.load_days / total_decision_time:.1f} decisions/s")
+    if state is not None:
+        print(f"Mock server counts: {state.counts}")
+        server.shutdown()
@@ -0,0 +1,116 @@
+import threading
+
+
+class LocalBackend:
+    '''
+    CPU-only stand-in for the OpenAI API using a small instruct model through transformers.
+    complete_batch() runs many prompts through one generate() call; the token prefix shared by
+    every prompt in the batch (chat template header plus the common opening of the prompt) is
+    encoded once and its key/value cache reused by every row.
+    Outputs are plain completion text, so Agent.parse_decision reads them exactly like API answers.
+    torch and transformers are only imported when the backend is created.
+    '''
+
+    def __init__(self, model_name="HuggingFaceTB/SmolLM2-360M-Instruct", max_new_tokens=120, batch_size=32, threads=None):
+        try:
+            import torch
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+        except ImportError as e:
+            raise ImportError("The local backend needs torch and transformers: pip install torch transformers") from e
+        self.torch = torch
+        if threads:
+            torch.set_num_threads(threads)
+        self.model_name = model_name
+        self.max_new_tokens = max_new_tokens
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32)
+        self.model.eval()
+        self.pad_token_id = self.tokenizer.pad_token_id
+        if self.pad_token_id is None:
+            self.pad_token_id = self.tokenizer.eos_token_id
+        # One generate() at a time; the decision threads queue here when used through get_completion_from_messages
+        self.lock = threading.Lock()
+
+    def encode(self, messages):
+        '''
+        Token ids of a chat in OpenAI message format, ending with the assistant turn prompt.
+        Most small chat templates have no "developer" role, and a prompt made only of a system
+        message gets no answer, so a lone developer/system message is sent as the user turn.
+        '''
+        roles = [message["role"] for message in messages]
+        chat = []
+        for message in messages:
+            role = message["role"]
+            if role == "developer":
+                role = "system"
+            if role == "system" and "user" not in roles:
+                role = "user"
+            chat.append({"role": role, "content": message["content"]})
+        text = self.tokenizer.apply_chat_template(chat, add_generation_prompt=True, tokenize=False)
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def complete_batch(self, messages_list, temperature=0):
+        '''
+        Completion text for each chat in messages_list, batch_size prompts per forward pass.
+        '''
+        encoded = [self.encode(messages) for messages in messages_list]
+        outputs = []
+        with self.lock:
+            for start in range(0, len(encoded), self.batch_size):
+                outputs.extend(self.generate(encoded[start:start + self.batch_size], temperature))
+        return outputs
+
+    def generate(self, token_lists, temperature=0):
+        '''
+        Generate for a batch of token id lists. Rows are laid out as [shared prefix | padding | own suffix]
+        with the padding masked out, so the prefix occupies the same positions in every row and its
+        cache, computed once, is valid for all of them.
+        '''
+        torch = self.torch
+        prefix_length = common_prefix_length(token_lists)
+        # Every row needs at least one uncached token to start generation from
+        prefix_length = min(prefix_length, min(len(tokens) for tokens in token_lists) - 1)
+        prefix = token_lists[0][:prefix_length]
+        suffixes = [tokens[prefix_length:] for tokens in token_lists]
+        width = max(len(suffix) for suffix in suffixes)
+
+        input_ids = []
+        attention_mask = []
+        for suffix in suffixes:
+            padding = width - len(suffix)
+            input_ids.append(prefix + [self.pad_token_id] * padding + suffix)
+            attention_mask.append([1] * prefix_length + [0] * padding + [1] * len(suffix))
+        input_ids = torch.tensor(input_ids)
+        attention_mask = torch.tensor(attention_mask)
+
+        sampling = {"do_sample": False}
+        if temperature > 0:
+            sampling = {"do_sample": True, "temperature": temperature}
+
+        with torch.no_grad():
+            cache = None
+            if prefix_length > 0:
+                cache = self.model(torch.tensor([prefix]), use_cache=True).past_key_values
+                cache.batch_repeat_interleave(len(token_lists))
+            generated = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=cache,
+                max_new_tokens=self.max_new_tokens,
+                pad_token_id=self.pad_token_id,
+                **sampling
+            )
+        return self.tokenizer.batch_decode(generated[:, input_ids.shape[1]:], skip_special_tokens=True)
+
+
+def common_prefix_length(token_lists):
+    '''
+    Number of leading tokens shared by every list
+    '''
+    shortest = min(len(tokens) for tokens in token_lists)
+    for i in range(shortest):
+        token = token_lists[0][i]
+        if any(tokens[i] != token for tokens in token_lists):
+            return i
+    return shortest
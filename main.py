@@ -6,10 +6,16 @@ import pandas as pd
 from matplotlib import pyplot as plt
 import sys
 import evaluation
+from utils import configure_llm
+from ensemble import run_ensemble
 
 
 
-if __name__ == "__main__":
+def get_parser():
+    '''
+    Command-line arguments of a simulation run
+    Also used by scripts that build a World the same way (e.g. load_test.py)
+    '''
     #Arguements for our code.
     parser = argparse.ArgumentParser()
     parser.add_argument("--name", default = "GABM", help = "Name of the run to save outputs.")
@@ -23,12 +29,125 @@ if __name__ == "__main__":
     parser.add_argument("--no_days", default=999, type=int,
                         help="Total maximum number of days the world would run.")
     parser.add_argument("--time_to_heal", default=6,type=int, help="Time taken to heal from infection.")
+    parser.add_argument("--disease", default="SIR", help="Compartment model: SIR, SEIR, SEIRS, SEIAR or a JSON file in the same format (see disease.py).")
     parser.add_argument("--no_of_runs", default = 1, type = int, help = "Total number of times you want to run this code.")
     parser.add_argument("--offset", default=0,type=int, help="offset is equal to number of days if you need to load a checkpoint")
     parser.add_argument("--load_from_run", default=0,type=int, help="equal to (run # - 1) if you need to load a checkpoint (e.g. if you want to load run 2 checkpoint 8, then offset = 8, load_from_run = 1)")
+    parser.add_argument("--decision_deadline", default=None, type=float, help="Seconds the daily decision phase may take before late agents fall back (default: no deadline).")
+    parser.add_argument("--fallback_policy", default="previous", choices=["previous", "stub", "retry"],
+                        help="Decision used for agents without an LLM answer: reuse yesterday's decision, use the symptom-based stub policy, or resubmit failed requests in another pass before falling back to yesterday's decision.")
+    parser.add_argument("--decision_retries", default=1, type=int, help="Extra decision passes for failed requests when --fallback_policy is retry.")
+    parser.add_argument("--request_timeout", default=None, type=float, help="Seconds a single LLM request may take before it is abandoned.")
+    parser.add_argument("--max_retry_time", default=None, type=float, help="Seconds backoff may keep retrying a single LLM request.")
+    parser.add_argument("--breaker_threshold", default=10, type=int, help="Consecutive LLM errors that open the circuit breaker.")
+    parser.add_argument("--breaker_cooldown", default=30, type=float, help="Seconds the circuit breaker stays open before a trial request.")
+    parser.add_argument("--hedge_percentile", default=None, type=float, help="Send a duplicate request for decisions outstanding longer than this percentile (0-100) of recent latencies (default: no hedging).")
+    parser.add_argument("--hedge_budget", default=0.1, type=float, help="Maximum hedged requests per day as a fraction of the population.")
+    parser.add_argument("--hedge_min_samples", default=20, type=int, help="Latencies to observe before hedging starts.")
+    parser.add_argument("--max_workers", default=4, type=int, help="Threads used for the daily decision phase.")
+    parser.add_argument("--adaptive_concurrency", action="store_true", help="Gate LLM calls with the AIMD rate controller driven by 429s and rate-limit headers.")
+    parser.add_argument("--max_concurrency", default=32, type=int, help="Upper bound of the adaptive concurrency window.")
+    parser.add_argument("--tokens_per_minute", default=None, type=int, help="Token budget per minute for the adaptive rate controller's token bucket, and for the shared budget with --rate_coordinator.")
+    parser.add_argument("--rate_coordinator", default=None, help="State file of a request/token budget shared by all simulation processes using the same file (e.g. /tmp/gabm_rate.json).")
+    parser.add_argument("--requests_per_minute", default=None, type=int, help="Request budget per minute shared through --rate_coordinator.")
+    parser.add_argument("--backend", default="openai", choices=["openai", "local"], help="Answer decision prompts with the OpenAI API or a local CPU model (needs torch and transformers).")
+    parser.add_argument("--local_model", default=None, help="Hugging Face model name for the local backend (default: HuggingFaceTB/SmolLM2-360M-Instruct).")
+    parser.add_argument("--local_batch_size", default=32, type=int, help="Prompts per batched forward pass on the local backend.")
+    parser.add_argument("--local_max_new_tokens", default=120, type=int, help="Maximum tokens generated per answer on the local backend.")
+    parser.add_argument("--agents_per_request", default=1, type=int, help="Agents asked per request with a shared scenario prompt and a JSON array answer (1 = one request per agent).")
+    parser.add_argument("--agreement_sample", default=0.0, type=float, help="Fraction of agents also asked individually in grouped mode, to measure agreement with one-agent-per-request decisions.")
+    parser.add_argument("--base_url", default=None, help="Base URL of an OpenAI-compatible API, e.g. the mock server: http://127.0.0.1:8000/v1")
+    parser.add_argument("--endpoints", default=None, help="JSON file listing API keys/base URLs/local models to spread decision requests over (see utils.load_endpoints).")
+    parser.add_argument("--model_tiers", default=None, help="Comma-separated models from cheapest to strongest, e.g. gpt-4o-mini,gpt-4o. Answers that fail to parse, contradict themselves or have low confidence are re-asked one tier up.")
+    parser.add_argument("--confidence_threshold", default=None, type=float, help="With --model_tiers, escalate when the probability of the Yes/No token is below this (requests logprobs).")
+    parser.add_argument("--redecide_tolerance", default=None, type=float, help="Only re-ask agents whose health string changed or whose newspaper figure moved by more than this many percentage points; others keep their last decision (default: ask everyone daily).")
+    parser.add_argument("--max_staleness", default=None, type=int, help="With --redecide_tolerance, re-ask agents whose last fresh decision is this many days old.")
+    parser.add_argument("--plan_days", default=None, type=int, help="Ask agents for a conditional plan covering up to this many days instead of a daily decision; agents are asked again when the plan expires or the newspaper passes the level it was made for.")
+    parser.add_argument("--pipeline", action="store_true", help="Pickle and write each day's checkpoint in a forked background process while the next day's decisions are requested.")
+    parser.add_argument("--replay_from", default=None, help="Checkpoint of a prior run whose recorded decisions are replayed; the LLM is only asked about inputs that run never saw.")
+    parser.add_argument("--seed", default=None, type=int, help="Seed of all simulation randomness; each run derives its own streams from it (default: fresh entropy, printed at the start of each run).")
+    parser.add_argument("--common_random_numbers", action="store_true", help="Key contact and transmission draws by agent, pair and day, so scenarios run from the same --seed share them (see compare_scenarios.py).")
+    parser.add_argument("--ensemble_precision", default=None, type=float, help="Run replicates in waves until the 95%% interval half-width of every ensemble outcome is below this fraction of its mean; --no_of_runs becomes the cap (see ensemble.py).")
+    parser.add_argument("--wave_size", default=4, type=int, help="Replicates per wave in ensemble mode.")
+    parser.add_argument("--ensemble_processes", default=1, type=int, help="Replicates of a wave run in parallel in ensemble mode (forked processes).")
+    parser.add_argument("--network", action="store_true", help="Sample daily contacts from a persistent household/workplace/random-tie network built at the start of the run.")
+    parser.add_argument("--household_size", default=2.5, type=float, help="Mean household size of the contact network.")
+    parser.add_argument("--workplace_size", default=10.0, type=float, help="Mean workplace size of the contact network.")
+    parser.add_argument("--random_ties", default=2.0, type=float, help="Mean number of random ties per agent in the contact network.")
+    parser.add_argument("--spatial", action="store_true", help="Agents outside random-walk in a continuous town and only meet others within --contact_radius (at most --contact_rate contacts each).")
+    parser.add_argument("--grid_width", default=None, type=float, help="Width of the town in spatial mode (default: 20 * sqrt(population / 20), the density of 20 agents on 20 x 20).")
+    parser.add_argument("--grid_height", default=None, type=float, help="Height of the town in spatial mode (default: scaled like --grid_width).")
+    parser.add_argument("--contact_radius", default=2.0, type=float, help="Distance within which agents on the grid can meet in spatial mode.")
+    parser.add_argument("--move_step", default=1.0, type=float, help="Scale of each day's random-walk step in spatial mode.")
+    parser.add_argument("--transmission_log", action="store_true", help="Log who infected whom on which day to output/run-N/<name>-transmissions.bin (see transmission_log.py).")
+    parser.add_argument("--contact_log", action="store_true", help="With --transmission_log, also log every day's contacts to output/run-N/<name>-contacts.bin.")
+    return parser
+
+def configure_llm_from_args(args):
+    '''
+    Apply the LLM call options of a parsed command line to utils
+    '''
+    configure_llm(request_timeout=args.request_timeout, max_retry_time=args.max_retry_time,
+                  breaker_threshold=args.breaker_threshold, breaker_cooldown=args.breaker_cooldown,
+                  adaptive_concurrency=args.adaptive_concurrency, max_concurrency=args.max_concurrency,
+                  tokens_per_minute=args.tokens_per_minute, rate_coordinator=args.rate_coordinator,
+                  requests_per_minute=args.requests_per_minute, backend=args.backend,
+                  local_model=args.local_model, local_batch_size=args.local_batch_size,
+                  local_max_new_tokens=args.local_max_new_tokens, base_url=args.base_url,
+                  endpoints=args.endpoints, model_tiers=args.model_tiers.split(",") if args.model_tiers else None,
+                  confidence_threshold=args.confidence_threshold)
+
+def run_replicate(args, i):
+    '''
+    Run (or resume) run number i+1 with its checkpoint and output folders, evaluate it and return the model
+    '''
+    print(f"--------Run - {i+1}---------")
+    #creates more folders for organization purposes
+    checkpoint_path = f"checkpoint/run-{i+1}"
+    output_path = f"output/run-{i+1}"
+    if os.path.exists(checkpoint_path) is not True:
+        os.mkdir(checkpoint_path)
+    if os.path.exists(output_path) is not True:
+        os.mkdir(output_path)
+
+    if args.load_from_run != 0:  # Load specific checkpoint only from the specified run
+        checkpoint_file = f"checkpoint/run-{args.load_from_run+1}/{args.name}-{args.offset}.pkl"
+        if os.path.exists(checkpoint_file):
+            model = World.load_checkpoint(checkpoint_file)
+        else:
+            #Try again if issue prevailed in args
+            print(f"Warning! Checkpoint not found. Initializing new world for run {args.load_from_checkpoint+1}. This is normal if you want to continue from run {args.load_from_checkpoint+1} from scratch")
+            model = World(args, run=i)
+    
+    else:
+        if args.offset !=0:
+            try:
+                model = World.load_checkpoint(f"checkpoint/run-1/{args.name}-{args.offset}.pkl")
+            except Exception as e:
+                sys.exit(e)
+        else:
+            model = World(args, run=i)
+
+    #Replay recorded decisions in a fresh world (a resumed replay keeps its own)
+    if args.replay_from is not None and model.time_step == 0:
+        model.load_replay(args.replay_from)
 
+    #Log who infected whom next to the run's outputs (a resumed world keeps the days before its checkpoint)
+    if args.transmission_log:
+        model.start_transmission_log(f"{output_path}/{args.name}", contacts=args.contact_log)
+
+    #Run model
+    model.run_model(checkpoint_path, args.offset)
+    evaluation.evaluate_simulation(model, args, run_number=i+1, output_path=output_path)
+    model.save_checkpoint(file_path = checkpoint_path + f"/{args.name}-completed.pkl")
+    return model
+
+
+if __name__ == "__main__":
+    parser = get_parser()
     args = parser.parse_args()
     print(f"Parameters: {args}")
+    configure_llm_from_args(args)
 
     #Creating output and checkpoint folders as needed
     if os.path.exists("output") is not True:
@@ -37,35 +156,8 @@ if __name__ == "__main__":
         os.mkdir("checkpoint")
 
 
-    for i in range(args.load_from_run, args.no_of_runs):
-        print(f"--------Run - {i+1}---------")
-        #creates more folders for organization purposes
-        checkpoint_path = f"checkpoint/run-{i+1}"
-        output_path = f"output/run-{i+1}"
-        if os.path.exists(checkpoint_path) is not True:
-            os.mkdir(checkpoint_path)
-        if os.path.exists(output_path) is not True:
-            os.mkdir(output_path)
-
-        if args.load_from_run != 0:  # Load specific checkpoint only from the specified run
-            checkpoint_file = f"checkpoint/run-{args.load_from_run+1}/{args.name}-{args.offset}.pkl"
-            if os.path.exists(checkpoint_file):
-                model = World.load_checkpoint(checkpoint_file)
-            else:
-                #Try again if issue prevailed in args
-                print(f"Warning! Checkpoint not found. Initializing new world for run {args.load_from_checkpoint+1}. This is normal if you want to continue from run {args.load_from_checkpoint+1} from scratch")
-                model = World(args)
-        
-        else:
-            if args.offset !=0:
-                try:
-                    model = World.load_checkpoint(f"checkpoint/run-1/{args.name}-{args.offset}.pkl")
-                except Exception as e:
-                    sys.exit(e)
-            else:
-                model = World(args)
-
-        #Run model
-        model.run_model(checkpoint_path, args.offset)
-        evaluation.evaluate_simulation(model, args, run_number=i+1, output_path=output_path)
-        model.save_checkpoint(file_path = checkpoint_path + f"/{args.name}-completed.pkl")
+    if args.ensemble_precision is not None:
+        run_ensemble(args, run_replicate)
+    else:
+        for i in range(args.load_from_run, args.no_of_runs):
+            run_replicate(args, i)
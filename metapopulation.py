@@ -0,0 +1,240 @@
+# Metapopulation mode: several towns, each a World in its own worker process, e.g.
+# python metapopulation.py --towns towns.json --metapop_days 40
+# towns.json lists the towns and the daily travel matrix:
+# {"towns": [{"name": "Dewberry Hollow", "no_init_healthy": 98, "no_init_infect": 2},
+#            {"name": "Maple Ridge", "no_init_healthy": 100, "no_init_infect": 0}],
+#  "travel": [[0.0, 0.05], [0.03, 0.0]]}
+# travel[i][j] is the probability that an agent of town i who goes outside spends the day in town j.
+# Every town runs its own decision phase (its newspaper reports its own cases) and local contacts.
+# At each day boundary the towns exchange one small array each: infected visitors sent to every other
+# town and the share of infected people among those outside. Other simulation options of main.py apply to every town.
+import contextlib
+import copy
+import io
+import json
+import multiprocessing
+import os
+import traceback
+
+import numpy as np
+import pandas as pd
+
+from agent import Agent
+from citizen import Citizen
+from main import get_parser, configure_llm_from_args
+from transmission_log import OUTSIDE
+from world import World
+
+
+class TownError(RuntimeError):
+    '''
+    Failure of a town in its worker process, sent to the coordinator with the worker's traceback
+    '''
+
+
+class Visitor(Agent):
+    '''
+    Infected visitor from another town, present for one day. Visitors are not in the town's health arrays,
+    so they keep their health on the instance.
+    '''
+    health_condition = "Infected"
+    day_infected = 1
+
+    def is_susceptible(self):
+        return False
+
+    def is_infectious(self):
+        return True
+
+
+class SpatialVisitor(Visitor, Citizen):
+    '''
+    Visitor in a town in spatial mode: it spends the day at a random position of the town's grid
+    '''
+
+
+class Town(World):
+    '''
+    One town of a metapopulation: a World whose outside agents may travel to other towns for the day.
+     - travellers leave the local contacts; susceptible ones are infected at their destination with the
+       probability of contact_rate contacts at the destination's infected share (from the last day boundary)
+     - infected travellers are counted per destination and sent at the day boundary
+     - infected visitors received at the last boundary join the local contacts for the day as
+       temporary agents (they are not in the schedule, so each of their contacts rolls once);
+       in spatial mode they are placed at random on the grid
+    '''
+
+    def __init__(self, args, run, town_name, town_index, travel_row):
+        super().__init__(args, run)
+        self.town_name = town_name
+        self.town_index = town_index
+        self.travel_row = np.asarray(travel_row, dtype=float)
+        self.travel_row[town_index] = 0.0
+        self.incoming_visitors = 0
+        self.destination_prevalence = np.zeros(len(self.travel_row))
+        self.outgoing_visitors = np.zeros(len(self.travel_row), dtype=np.int64)
+        self.outside_prevalence = 0.0
+        self.travellers_today = 0
+
+    def decide_agent_interactions(self):
+        rng = self.random.travel
+        staying = []
+        self.outgoing_visitors = np.zeros(len(self.travel_row), dtype=np.int64)
+        leave_probability = self.travel_row.sum()
+        for agent in self.agents_outside:
+            if rng.random() >= leave_probability:
+                staying.append(agent)
+                continue
+            destination = rng.choice(len(self.travel_row), p=self.travel_row / leave_probability)
+            if agent.is_infectious():
+                self.outgoing_visitors[destination] += 1
+            elif agent.is_susceptible():
+                exposure = self.contact_rate * self.destination_prevalence[destination]
+                if rng.random() < 1 - (1 - self.infection_rate) ** exposure:
+                    agent.health_condition = "To_Be_Infected"
+                    if self.transmission_log is not None:
+                        self.transmission_log.infection(self.time_step + 1, OUTSIDE, agent.unique_id)
+        self.travellers_today = len(self.agents_outside) - len(staying)
+
+        if self.spatial:
+            positions = rng.uniform(size=(self.incoming_visitors, 2)) * (self.grid_width, self.grid_height)
+            visitors = [SpatialVisitor(model=self, unique_id=OUTSIDE - (k + 1), name="Visitor", age=0, traits=[""] * 5, location="outside",
+                                       pos=(x, y), health_condition="Infected", day_infected=1, width=self.grid_width, height=self.grid_height)
+                        for k, (x, y) in enumerate(positions.tolist())]
+        else:
+            visitors = [Visitor(model=self, unique_id=OUTSIDE - (k + 1), name="Visitor", age=0, traits=[""] * 5, location="outside",
+                                health_condition="Infected", day_infected=1) for k in range(self.incoming_visitors)]
+        self.agents_outside = staying + visitors
+        outside = len(self.agents_outside)
+        self.outside_prevalence = sum(a.is_infectious() for a in self.agents_outside) / outside if outside else 0.0
+        super().decide_agent_interactions()
+
+
+def town_worker(connection, args, index, town, travel):
+    '''
+    Own one Town in a worker process. Each message from the coordinator is
+    (incoming visitors, infected share outside per town) for the next day, or None to finish;
+    each reply is (outgoing visitors per town, infected share outside, row of today's data).
+    If the town fails (while being built or during a day), the reply is a TownError with the traceback instead.
+    '''
+    try:
+        run_town(connection, args, index, town, travel)
+    except Exception:
+        connection.send(TownError(f"Town {town['name']} failed:\n{traceback.format_exc()}"))
+    finally:
+        connection.close()
+
+
+def run_town(connection, args, index, town, travel):
+    '''
+    Body of town_worker: build the Town and answer the coordinator's messages until it sends None
+    '''
+    town_args = copy.copy(args)
+    town_args.name = f"{args.name}-{town['name']}"
+    town_args.no_init_healthy = town["no_init_healthy"]
+    town_args.no_init_infect = town["no_init_infect"]
+    model = Town(town_args, run=index, town_name=town["name"], town_index=index, travel_row=travel[index])
+    if args.transmission_log:
+        model.start_transmission_log(f"output/{town_args.name}", contacts=args.contact_log)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        model.incoming_visitors, model.destination_prevalence = message
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.step()
+        model.datacollector.collect(model)
+        row = {
+            "town": town["name"],
+            "Step": model.time_step,
+            "Susceptible": sum(a.health_condition == "Susceptible" for a in model.schedule),
+            "Infected": model.currently_infected,
+            "Recovered": sum(a.health_condition == "Recovered" for a in model.schedule),
+            "# Home": sum(a.location == "home" for a in model.schedule),
+            "Newspaper": model.newspaper_percentage(),
+            "Travellers": model.travellers_today,
+            "Visitors": model.incoming_visitors,
+        }
+        connection.send((model.outgoing_visitors, model.outside_prevalence, row))
+
+
+def receive_reply(connection, worker, poll_interval=1.0):
+    '''
+    Wait for a town's reply, raising if the town failed or its worker process died without replying
+    '''
+    while not connection.poll(poll_interval):
+        if not worker.is_alive():
+            # It may have replied just before exiting
+            if connection.poll():
+                break
+            raise RuntimeError(f"Town worker {worker.name} exited with code {worker.exitcode} without replying.")
+    reply = connection.recv()
+    if isinstance(reply, TownError):
+        raise reply
+    return reply
+
+
+def run_metapopulation(args, towns, travel, days):
+    '''
+    Run the towns in parallel worker processes for `days` days, exchanging visitors at every day boundary.
+    Returns one table with a row per town and day.
+    '''
+    travel = np.asarray(travel, dtype=float)
+    if travel.shape != (len(towns), len(towns)):
+        raise ValueError(f"The travel matrix must be {len(towns)}x{len(towns)}.")
+    if (travel.sum(axis=1) - travel.diagonal() > 1).any():
+        raise ValueError("Travel probabilities of a town may not add up to more than 1.")
+
+    context = multiprocessing.get_context("fork")
+    connections = []
+    workers = []
+    for index, town in enumerate(towns):
+        parent_end, child_end = context.Pipe()
+        worker = context.Process(target=town_worker, args=(child_end, args, index, town, travel))
+        worker.start()
+        connections.append(parent_end)
+        workers.append(worker)
+
+    incoming = np.zeros(len(towns), dtype=np.int64)
+    prevalence = np.zeros(len(towns))
+    rows = []
+    try:
+        for day in range(days):
+            for index, connection in enumerate(connections):
+                connection.send((int(incoming[index]), prevalence))
+            replies = [receive_reply(connection, worker) for connection, worker in zip(connections, workers)]
+            # Visitors sent today arrive tomorrow
+            incoming = np.sum([outgoing for outgoing, _, _ in replies], axis=0)
+            prevalence = np.array([share for _, share, _ in replies])
+            rows.extend(row for _, _, row in replies)
+            print(f"Day {day + 1}: " + ", ".join(f"{row['town']} infected = {row['Infected']}" for _, _, row in replies))
+    finally:
+        for connection, worker in zip(connections, workers):
+            if worker.is_alive():
+                try:
+                    connection.send(None)
+                except OSError:
+                    pass  # The worker closed its end while failing
+        for worker in workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    parser.add_argument("--towns", required=True, help="JSON file with the towns and travel matrix.")
+    parser.add_argument("--metapop_days", default=40, type=int, help="Days to simulate.")
+    parser.add_argument("--metapop_output", default=None, help="CSV for the per-town daily table (default: output/<name>-metapopulation.csv).")
+    args = parser.parse_args()
+    configure_llm_from_args(args)
+
+    with open(args.towns) as file:
+        config = json.load(file)
+    table = run_metapopulation(args, config["towns"], config["travel"], args.metapop_days)
+    output = args.metapop_output or f"output/{args.name}-metapopulation.csv"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    table.to_csv(output, index=False)
+    print(f"Table with {len(table)} rows written to {output}")
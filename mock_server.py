@@ -0,0 +1,251 @@
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+class MockLimits:
+    '''
+    Requests-per-minute and tokens-per-minute budgets of the mock server, kept as one-minute
+    sliding windows like the real API. try_take() returns (allowed, headers) where headers are
+    the x-ratelimit-* (and on rejection retry-after) headers the real API would send.
+    '''
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.lock = threading.Lock()
+        self.history = []  # (time, tokens) of accepted requests in the last minute
+
+    def try_take(self, tokens):
+        with self.lock:
+            now = time.monotonic()
+            self.history = [(t, n) for t, n in self.history if now - t < 60]
+            used_requests = len(self.history)
+            used_tokens = sum(n for _, n in self.history)
+            reset = 60 - (now - self.history[0][0]) if self.history else 0.0
+
+            allowed = True
+            if self.requests_per_minute and used_requests + 1 > self.requests_per_minute:
+                allowed = False
+            if self.tokens_per_minute and used_tokens + tokens > self.tokens_per_minute:
+                allowed = False
+            if allowed:
+                self.history.append((now, tokens))
+                used_requests += 1
+                used_tokens += tokens
+
+            headers = {}
+            if self.requests_per_minute:
+                headers["x-ratelimit-limit-requests"] = str(self.requests_per_minute)
+                headers["x-ratelimit-remaining-requests"] = str(max(0, self.requests_per_minute - used_requests))
+                headers["x-ratelimit-reset-requests"] = f"{reset:.3f}s"
+            if self.tokens_per_minute:
+                headers["x-ratelimit-limit-tokens"] = str(self.tokens_per_minute)
+                headers["x-ratelimit-remaining-tokens"] = str(max(0, self.tokens_per_minute - used_tokens))
+                headers["x-ratelimit-reset-tokens"] = f"{reset:.3f}s"
+            if not allowed:
+                headers["retry-after"] = f"{max(reset, 0.001):.3f}"
+            return allowed, headers
+
+
+def rule_based_answer(prompt):
+    '''
+    Reasoning/Response body derived from the decision prompt: stay home with symptoms
+    or when the newspaper reports at least 1% new infections.
+    '''
+    match = re.search(r"find that\s*([\d.]+)%", prompt)
+    infected_percent = float(match.group(1)) if match else 0.0
+    if "fever" in prompt or "cough" in prompt:
+        return "Reasoning: I am showing symptoms and could infect my coworkers.\nResponse: Yes"
+    if infected_percent >= 1.0:
+        return f"Reasoning: {infected_percent}% new infections is too risky.\nResponse: Yes"
+    return "Reasoning: I feel fine and need to earn money.\nResponse: No"
+
+
+def rule_based_group_answer(prompt):
+    '''
+    JSON-array answer for a multi-agent prompt (group_prompts.build_group_messages), one rule-based entry per person.
+    '''
+    match = re.search(r"find that\s*([\d.]+)%", prompt)
+    newspaper = f"find that {match.group(1)}%" if match else ""
+    entries = []
+    for person_id, persona in re.findall(r"Person (\d+): (.*)", prompt):
+        reasoning, response = rule_based_answer(persona + " " + newspaper).split("\nResponse: ")
+        entries.append({"id": int(person_id), "reasoning": reasoning[len("Reasoning: "):], "response": response})
+    return json.dumps(entries)
+
+
+def rule_based_plan_answer(prompt):
+    '''
+    JSON plan for a plan prompt (Agent.build_plan_messages) following the same rules as rule_based_answer:
+    stay home with symptoms or above 1% new infections, for as many days as allowed.
+    '''
+    match = re.search(r"next (\d+) days", prompt)
+    days = int(match.group(1)) if match else 1
+    return json.dumps({"reasoning": "I stay home when I am sick or the outbreak is large.", "stay_home_if_symptoms": True,
+                       "stay_home_above_percent": 1.0, "days": days, "valid_below_percent": 5.0})
+
+
+class MockState:
+    '''
+    Behavior of the mock server: latency distribution, limits, error rate and answer mode.
+    '''
+
+    def __init__(self, latency_median=0.5, latency_sigma=0.5, latency_max=30.0, error_rate=0.0,
+                 requests_per_minute=None, tokens_per_minute=None, answer="rules", seed=None):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.latency_max = latency_max
+        self.error_rate = error_rate
+        self.answer = answer
+        self.limits = MockLimits(requests_per_minute, tokens_per_minute)
+        self.rng = np.random.default_rng(seed)
+        self.rng_lock = threading.Lock()
+        self.counts = {"requests": 0, "ok": 0, "429": 0, "5xx": 0}
+        self.counts_lock = threading.Lock()
+
+    def draw(self):
+        '''
+        Latency (lognormal around latency_median, capped at latency_max) and whether to fail with a 5xx.
+        '''
+        with self.rng_lock:
+            latency = self.latency_median * float(np.exp(self.latency_sigma * self.rng.standard_normal()))
+            fail = bool(self.rng.random() < self.error_rate)
+        return min(latency, self.latency_max), fail
+
+    def token_logprobs(self, content):
+        '''
+        Whitespace "tokens" of content with logprobs: certain everywhere except a Yes/No answer,
+        whose probability is drawn uniformly from [0.5, 1).
+        '''
+        items = []
+        for token in re.findall(r"\s*\S+", content):
+            logprob = 0.0
+            if token.strip().strip('".,').lower() in ["yes", "no"]:
+                with self.rng_lock:
+                    logprob = float(np.log(self.rng.uniform(0.5, 1.0)))
+            items.append({"token": token, "logprob": logprob, "bytes": None, "top_logprobs": []})
+        return items
+
+    def count(self, key):
+        with self.counts_lock:
+            self.counts[key] += 1
+
+
+def make_handler(state):
+
+    class ChatCompletionsHandler(BaseHTTPRequestHandler):
+        '''
+        Minimal POST /v1/chat/completions endpoint speaking the OpenAI wire format.
+        '''
+
+        def log_message(self, format, *args):
+            pass  # keep the console quiet under load
+
+        def send_json(self, status, body, headers=None):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt = "\n".join(message.get("content", "") for message in request.get("messages", []))
+            prompt_tokens = max(1, len(prompt) // 4)
+            state.count("requests")
+
+            allowed, limit_headers = state.limits.try_take(prompt_tokens)
+            if not allowed:
+                state.count("429")
+                self.send_json(429, {"error": {"message": "Rate limit reached (mock server).", "type": "requests",
+                                               "code": "rate_limit_exceeded"}}, limit_headers)
+                return
+
+            latency, fail = state.draw()
+            time.sleep(latency)
+            if fail:
+                state.count("5xx")
+                self.send_json(500, {"error": {"message": "Injected server error (mock server).", "type": "server_error"}})
+                return
+
+            if "JSON array" in prompt:
+                content = rule_based_group_answer(prompt)
+            elif "stay_home_if_symptoms" in prompt:
+                content = rule_based_plan_answer(prompt)
+            elif state.answer == "rules":
+                content = rule_based_answer(prompt)
+            else:
+                content = "Reasoning: I need to go to work.\nResponse: No"
+            completion_tokens = max(1, len(content) // 4)
+            choice = {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+            if request.get("logprobs"):
+                choice["logprobs"] = {"content": state.token_logprobs(content)}
+            state.count("ok")
+            self.send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [choice],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            }, limit_headers)
+
+    return ChatCompletionsHandler
+
+
+def start_server(state, host="127.0.0.1", port=0):
+    '''
+    Serve the mock API on a background thread. Returns (server, base_url); stop with server.shutdown().
+    port=0 picks a free port.
+    '''
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def add_mock_arguments(parser):
+    parser.add_argument("--latency_median", default=0.5, type=float, help="Median response latency in seconds.")
+    parser.add_argument("--latency_sigma", default=0.5, type=float, help="Lognormal shape of the latency distribution (0 = fixed latency).")
+    parser.add_argument("--latency_max", default=30.0, type=float, help="Cap on a single response latency in seconds.")
+    parser.add_argument("--error_rate", default=0.0, type=float, help="Fraction of requests answered with a 500 error.")
+    parser.add_argument("--mock_rpm", default=None, type=int, help="Requests per minute before the server returns 429s.")
+    parser.add_argument("--mock_tpm", default=None, type=int, help="Tokens per minute before the server returns 429s.")
+    parser.add_argument("--answer", default="rules", choices=["rules", "canned"], help="Rule-based answers from the prompt, or always the same answer.")
+    parser.add_argument("--mock_seed", default=None, type=int, help="Seed for latencies and injected errors.")
+
+
+def state_from_args(args):
+    return MockState(latency_median=args.latency_median, latency_sigma=args.latency_sigma, latency_max=args.latency_max,
+                     error_rate=args.error_rate, requests_per_minute=args.mock_rpm, tokens_per_minute=args.mock_tpm,
+                     answer=args.answer, seed=args.mock_seed)
+
+
+if __name__ == "__main__":
+    # Standalone server; point a simulation at it with: python main.py --base_url http://127.0.0.1:8000/v1
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=8000, type=int)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    server, base_url = start_server(state_from_args(args), args.host, args.port)
+    print(f"Mock OpenAI server listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,82 @@
+# Bundled table of ranked names, so runs do not load NameDataset (seconds and gigabytes of RAM).
+# data/names/<country>-male.npy, -female.npy and -surname.npy hold the most popular names of the country,
+# most popular first, as fixed-width UTF-8 byte strings; they are memory-mapped on first use.
+# The table is built once from NameDataset with, e.g.
+# python name_table.py --country US --top 5000
+import argparse
+import os
+
+import numpy as np
+
+NAME_TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "names")
+KINDS = ["male", "female", "surname"]
+
+_tables = {}
+_ranks = {}
+
+
+def load_names(kind, country_alpha2="US"):
+    '''
+    Ranked names of one kind (male, female or surname) as a memory-mapped byte-string array, loaded once
+    '''
+    key = (kind, country_alpha2)
+    if key not in _tables:
+        path = os.path.join(NAME_TABLE_DIR, f"{country_alpha2}-{kind}.npy")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No name table at {path}; build it with: python name_table.py --country {country_alpha2}")
+        _tables[key] = np.load(path, mmap_mode="r")
+    return _tables[key]
+
+
+def name_rank(name, country_alpha2="US", top=None):
+    '''
+    (gender, rank) of a name's first name in the table: gender 1 for male and 0 for female, rank 1 for the
+    most popular name; (None, None) if it is in neither list (or ranked below top).
+    First names may have several words ("Mary Ann"); for composite "First Last" names
+    (see utils.generate_composite_names) only the appended surname is dropped.
+    '''
+    ranks = _rank_lookup(country_alpha2)
+    for gender, rank in ranks.get(name) or ranks.get(name.rsplit(" ", 1)[0], []):
+        if top is None or rank <= top:
+            return gender, rank
+    return None, None
+
+
+def _rank_lookup(country_alpha2):
+    '''
+    {first name: [(gender, rank), ...]} over both lists (male entry first), built once
+    '''
+    if country_alpha2 not in _ranks:
+        ranks = {}
+        for gender, kind in [(1, "male"), (0, "female")]:
+            for rank, name in enumerate(load_names(kind, country_alpha2)):
+                ranks.setdefault(name.decode(), []).append((gender, rank + 1))
+        _ranks[country_alpha2] = ranks
+    return _ranks[country_alpha2]
+
+
+def build_name_table(country_alpha2="US", top=5000, directory=NAME_TABLE_DIR):
+    '''
+    Write the top names of the country from NameDataset (only needed here, not at run time)
+    '''
+    from names_dataset import NameDataset
+
+    nd = NameDataset()
+    lists = {
+        "male": nd.get_top_names(top, 'Male', country_alpha2)[country_alpha2]['M'],
+        "female": nd.get_top_names(top, 'Female', country_alpha2)[country_alpha2]['F'],
+        "surname": nd.get_top_names(top, use_first_names=False, country_alpha2=country_alpha2)[country_alpha2],
+    }
+    os.makedirs(directory, exist_ok=True)
+    for kind, names in lists.items():
+        encoded = [name.encode() for name in names]
+        np.save(os.path.join(directory, f"{country_alpha2}-{kind}.npy"), np.array(encoded, dtype=f"S{max(map(len, encoded))}"))
+        print(f"{len(names)} {kind} names of {country_alpha2} written")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--country", default="US", help="Two-letter country code.")
+    parser.add_argument("--top", default=5000, type=int, help="Names kept per list.")
+    args = parser.parse_args()
+    build_name_table(args.country, args.top)
@@ -0,0 +1,73 @@
+import numpy as np
+
+
+class RandomStreams:
+    '''
+    Independent np.random.Generator streams of one simulation run, one per purpose, all derived
+    from a single seed with SeedSequence. The streams live on the World, so they are pickled with
+    every checkpoint and a resumed run continues exactly where it stopped.
+     - seed: entropy of the whole experiment (None = fresh entropy, kept in self.seed for reporting)
+     - run: index of the run within the experiment; different runs get independent streams
+    Draws made from worker threads (e.g. the random answer for an unparseable completion) use
+    for_agent(), a stream keyed by purpose, agent and day, so they do not depend on which thread
+    finishes first or how many workers there are.
+    '''
+
+    # New purposes must be appended: a stream's spawn key is its position in this list
+    PURPOSES = ["personas", "names", "contacts", "infection", "schedule", "sampling", "replay", "travel", "network", "movement"]
+    AGENT_PURPOSES = ["fallback"]
+    # Fixed spawn key elements of the per-agent and branch namespaces, so appending a purpose cannot
+    # move their draws. Their keys are longer than the (run, position) keys of the purpose streams,
+    # so the namespaces never collide with those.
+    AGENT_NAMESPACE = 10
+    BRANCH_NAMESPACE = 11
+    # Purposes of the keyed uniform draws used for common random numbers (see uniform)
+    UNIFORM_PURPOSES = ["order", "extra contact", "partner", "transmission", "schedule", "replay", "progression"]
+
+    def __init__(self, seed=None, run=0, spawn_key=()):
+        root = np.random.SeedSequence(seed, spawn_key=(run,) + tuple(spawn_key))
+        self.seed = root.entropy
+        self.run = run
+        self.spawn_key = root.spawn_key
+        for purpose, child in zip(self.PURPOSES, root.spawn(len(self.PURPOSES))):
+            setattr(self, purpose, np.random.Generator(np.random.PCG64(child)))
+        self.uniform_key = int(root.generate_state(1, np.uint64)[0])
+
+    def uniform(self, purpose, *keys):
+        '''
+        Uniform draw in [0, 1) that depends only on the seed, the run, purpose and the integer keys
+        (e.g. day and agent ids), not on how many draws were made before. Two scenarios run from the
+        same seed therefore see the same draw for the same agent, contact and day (common random numbers).
+        '''
+        h = _mix(self.uniform_key ^ self.UNIFORM_PURPOSES.index(purpose))
+        for key in keys:
+            h = _mix(h ^ (key & _MASK))
+        return (h >> 11) * 2.0 ** -53
+
+    def for_agent(self, purpose, unique_id, day):
+        '''
+        Fresh generator for one agent's draws of `purpose` on `day`
+        '''
+        key = self.spawn_key + (self.AGENT_NAMESPACE, self.AGENT_PURPOSES.index(purpose), unique_id, day)
+        return np.random.Generator(np.random.PCG64(np.random.SeedSequence(self.seed, spawn_key=key)))
+
+    def branch(self, index):
+        '''
+        Independent streams for branch `index` of this run (see World.fork), starting from the same seed
+        '''
+        # spawn_key starts with the run index, which the constructor adds back
+        branch_key = self.spawn_key[1:] + (self.BRANCH_NAMESPACE, index)
+        return RandomStreams(self.seed, self.run, branch_key)
+
+
+_MASK = (1 << 64) - 1
+
+
+def _mix(x):
+    '''
+    splitmix64 finalizer: a 64-bit integer hash with good avalanche, used to derive keyed uniforms
+    '''
+    x = (x + 0x9E3779B97F4A7C15) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
@@ -0,0 +1,121 @@
+import json
+import os
+import random
+import sys
+import time
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+class SharedTokenBucket:
+    '''
+    Request and token budgets shared by every simulation process that uses the same state file.
+    The state (available requests and tokens, last refill time, pause) lives in a small JSON file
+    guarded by an exclusive flock, so all main.py processes on a machine, or on a cluster sharing
+    a filesystem with working locks, draw from one org-level budget instead of each running its own.
+    Buckets refill continuously at requests_per_minute / tokens_per_minute and hold at most one minute of budget.
+    '''
+
+    def __init__(self, path, requests_per_minute=None, tokens_per_minute=None, max_sleep=1.0):
+        if fcntl is None:
+            raise RuntimeError("The shared rate coordinator needs fcntl file locks (POSIX systems only).")
+        self.path = path
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_sleep = max_sleep
+
+    def _update(self, change):
+        '''
+        Lock the state file, refill the buckets, apply change(state, now) and write the state back.
+        Returns whatever change returns.
+        '''
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            raw = os.read(fd, 65536)
+            now = time.time()
+            state = json.loads(raw) if raw else {
+                "requests": self.requests_per_minute or 0,
+                "tokens": self.tokens_per_minute or 0,
+                "updated": now,
+                "paused_until": 0.0,
+                "granted": 0,
+            }
+            elapsed = max(0.0, now - state["updated"])
+            if self.requests_per_minute:
+                state["requests"] = min(self.requests_per_minute, state["requests"] + elapsed * self.requests_per_minute / 60)
+            if self.tokens_per_minute:
+                state["tokens"] = min(self.tokens_per_minute, state["tokens"] + elapsed * self.tokens_per_minute / 60)
+            state["updated"] = now
+            state["requests_per_minute"] = self.requests_per_minute
+            state["tokens_per_minute"] = self.tokens_per_minute
+            result = change(state, now)
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, json.dumps(state).encode())
+            return result
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def acquire(self, tokens=0):
+        '''
+        Block until one request and `tokens` tokens can be taken from the shared budget.
+        '''
+        # Requests larger than the whole bucket would never fit; let them through once the bucket is full
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+
+        def take(state, now):
+            waits = []
+            if now < state["paused_until"]:
+                waits.append(state["paused_until"] - now)
+            if self.requests_per_minute and state["requests"] < 1:
+                waits.append((1 - state["requests"]) * 60 / self.requests_per_minute)
+            if self.tokens_per_minute and state["tokens"] < tokens:
+                waits.append((tokens - state["tokens"]) * 60 / self.tokens_per_minute)
+            if waits:
+                return max(waits)
+            if self.requests_per_minute:
+                state["requests"] -= 1
+            if self.tokens_per_minute:
+                state["tokens"] -= tokens
+            state["granted"] += 1
+            return 0.0
+
+        while True:
+            wait = self._update(take)
+            if wait == 0.0:
+                return
+            # Jitter keeps waiting processes from retrying the lock in lockstep
+            time.sleep(min(wait, self.max_sleep) * random.uniform(0.5, 1.0))
+
+    def adjust_tokens(self, difference):
+        '''
+        Correct the token bucket once real usage is known (positive = more tokens were used than estimated).
+        '''
+        if not self.tokens_per_minute or difference == 0:
+            return
+
+        def correct(state, now):
+            state["tokens"] -= difference
+        self._update(correct)
+
+    def pause(self, seconds):
+        '''
+        Stop every process from sending requests for `seconds` (e.g. after a 429 with retry-after).
+        '''
+        def extend(state, now):
+            state["paused_until"] = max(state["paused_until"], now + seconds)
+        self._update(extend)
+
+
+if __name__ == "__main__":
+    # Print the shared budget: python rate_coordinator.py <state file>
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python rate_coordinator.py <state file>")
+    with open(sys.argv[1]) as file:
+        print(json.dumps(json.loads(file.read()), indent=2))
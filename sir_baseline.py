@@ -0,0 +1,170 @@
+# No-behavior SIR baseline for the agent model, e.g.
+# python sir_baseline.py --contact_rates 3,5 --infection_rates 0.05,0.1 --replicates 1000 --baseline_days 60
+# Everyone goes outside every day, so nobody's decisions matter and the model reduces to a discrete-time
+# SIR process with the agent model's timing: each susceptible makes contact_rate contacts with random
+# others, every contact with an infected person rolls infection_rate twice (once from each side, as in
+# Agent.interact), and infected agents recover after time_to_heal days.
+# A whole parameter grid and all replicates are advanced together as NumPy arrays, either
+# deterministically (expected values) or as a chain-binomial process (--replicates > 0).
+# The output has the columns of evaluation.py's population CSV, plus the parameters and replicate.
+import itertools
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from main import get_parser
+
+
+def parameter_grid(contact_rates, infection_rates, times_to_heal):
+    '''
+    Every combination of the given values, as three flat arrays of equal length
+    '''
+    grid = np.array(list(itertools.product(contact_rates, infection_rates, times_to_heal)), dtype=float)
+    return grid[:, 0], grid[:, 1], grid[:, 2].astype(int)
+
+
+def run_baseline(population, initial_infected, contact_rate, infection_rate, time_to_heal, days, replicates=0, seed=None):
+    '''
+    Simulate `days` days for every grid point (contact_rate, infection_rate and time_to_heal are arrays of
+    equal length, or scalars). replicates=0 runs the deterministic model once per point; otherwise
+    `replicates` chain-binomial runs per point. Returns one row per point, replicate and day (Step 0 = initial state).
+    '''
+    contact_rate, infection_rate, time_to_heal = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(contact_rate, dtype=float)),
+        np.atleast_1d(np.asarray(infection_rate, dtype=float)),
+        np.atleast_1d(np.asarray(time_to_heal, dtype=int)))
+    stochastic = replicates > 0
+    points, runs = len(contact_rate), max(replicates, 1)
+    rng = np.random.default_rng(seed)
+
+    longest = int(time_to_heal.max())
+    # Infected by days since infection (index 0 = day_infected 1); cohorts at or past time_to_heal are empty,
+    # with one extra slot for those who just aged out
+    infected = np.zeros((points, runs, longest + 1))
+    infected[:, :, 0] = initial_infected
+    susceptible = np.full((points, runs), float(population - initial_infected))
+    recovered = np.zeros((points, runs))
+    still_infected = np.arange(longest + 1)[None, None, :] < time_to_heal[:, None, None]
+    # Both sides of a contact roll for infection
+    per_contact = (1 - (1 - infection_rate) ** 2)[:, None]
+    contacts = (contact_rate * population)[:, None]
+
+    records = []
+
+    def record(step, new_infections, day_4):
+        records.append({
+            "Step": step,
+            "Susceptible": susceptible.copy(),
+            "Infected": infected.sum(axis=2),
+            "Recovered": recovered.copy(),
+            "New Infections": new_infections,
+            "# Day 4 New Cases": day_4,
+        })
+
+    zeros = np.zeros((points, runs))
+    record(0, zeros + initial_infected, zeros)
+    day_4_yesterday = zeros
+    for step in range(1, days + 1):
+        # Contacts of each susceptible: contact_rate draws among the other population - 1 agents
+        share_infected = infected.sum(axis=2) / (population - 1)
+        probability = 1 - (1 - per_contact * share_infected) ** contact_rate[:, None]
+        if stochastic:
+            new_infections = rng.binomial(susceptible.astype(np.int64), probability).astype(float)
+        else:
+            new_infections = susceptible * probability
+        susceptible = susceptible - new_infections
+
+        # update_day: everyone ages a day, those past time_to_heal recover, new infections start at day 1
+        aged = np.zeros_like(infected)
+        aged[:, :, 1:] = infected[:, :, :-1]
+        recovered = recovered + (aged * ~still_infected).sum(axis=2)
+        aged[~np.broadcast_to(still_infected, aged.shape)] = 0
+        aged[:, :, 0] = new_infections
+        infected = aged
+
+        record(step, new_infections, day_4_yesterday)
+        # Agents on day 4 of their infection, reported the next day like World.day_4_infected_today
+        day_4_yesterday = infected[:, :, 3] if longest > 3 else zeros
+
+    rows = []
+    for entry in records:
+        frame = pd.DataFrame({
+            "contact_rate": np.repeat(contact_rate, runs),
+            "infection_rate": np.repeat(infection_rate, runs),
+            "time_to_heal": np.repeat(time_to_heal, runs),
+            "replicate": np.tile(np.arange(runs), points),
+            "Step": entry["Step"],
+            "Susceptible": entry["Susceptible"].ravel(),
+            "Infected": entry["Infected"].ravel(),
+            "Recovered": entry["Recovered"].ravel(),
+            "# Home": 0,
+            "# Outside": population,
+            "New Infections": entry["New Infections"].ravel(),
+            "# Day 4 New Cases": entry["# Day 4 New Cases"].ravel(),
+            "# Contacts": np.repeat(contacts[:, 0], runs) if entry["Step"] > 0 else 0,
+            "Max # of Potential Contact": np.repeat(contacts[:, 0], runs),
+        })
+        rows.append(frame)
+    table = pd.concat(rows, ignore_index=True).sort_values(["contact_rate", "infection_rate", "time_to_heal", "replicate", "Step"])
+    table["Cumulative Infections"] = table.groupby(["contact_rate", "infection_rate", "time_to_heal", "replicate"])["New Infections"].cumsum()
+    columns = ["contact_rate", "infection_rate", "time_to_heal", "replicate", "Step", "Susceptible", "Infected", "Recovered",
+               "# Home", "# Outside", "New Infections", "Cumulative Infections", "# Day 4 New Cases", "# Contacts",
+               "Max # of Potential Contact"]
+    return table[columns].reset_index(drop=True)
+
+
+def plot_overlay(population_csv, baseline, output_path):
+    '''
+    SIR and Home-vs-Outside plots of a population CSV from evaluation.py (solid) with the
+    replicate mean of a single-point baseline (dashed)
+    '''
+    run = pd.read_csv(population_csv)
+    mean = baseline.groupby("Step").mean(numeric_only=True).reset_index()
+    mean = mean[mean["Step"] <= run["Step"].max()]
+    for title, columns in [("SIR", ["Susceptible", "Infected", "Recovered"]), ("Home_vs_Outside", ["# Outside", "# Home"])]:
+        plt.figure(figsize=(10, 6))
+        for column in columns:
+            line, = plt.plot(run["Step"], run[column], label=column)
+            plt.plot(mean["Step"], mean[column], linestyle="--", color=line.get_color(), label=f"{column} (no-behavior baseline)")
+        plt.xlabel("Step")
+        plt.ylabel("Number of Agents")
+        plt.title(f"{title.replace('_', ' ')} vs. baseline")
+        plt.legend()
+        plt.tight_layout()
+        plt.savefig(os.path.join(output_path, f"{title}_vs_baseline.png"), bbox_inches="tight")
+        plt.close()
+
+
+def parse_values(text, kind):
+    return [kind(value) for value in text.split(",")]
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    parser.add_argument("--contact_rates", default=None, help="Comma-separated contact rates of the grid (default: --contact_rate).")
+    parser.add_argument("--infection_rates", default=None, help="Comma-separated infection rates of the grid (default: --infection_rate).")
+    parser.add_argument("--times_to_heal", default=None, help="Comma-separated times to heal of the grid (default: --time_to_heal).")
+    parser.add_argument("--baseline_days", default=60, type=int, help="Days to simulate.")
+    parser.add_argument("--replicates", default=0, type=int, help="Chain-binomial replicates per grid point (0 = deterministic).")
+    parser.add_argument("--baseline_output", default=None, help="CSV for the baseline table (default: output/<name>-baseline.csv).")
+    parser.add_argument("--overlay", default=None, help="Population CSV of a GABM run to plot against the first grid point's baseline.")
+    args = parser.parse_args()
+
+    contact_rate, infection_rate, time_to_heal = parameter_grid(
+        parse_values(args.contact_rates, float) if args.contact_rates else [args.contact_rate],
+        parse_values(args.infection_rates, float) if args.infection_rates else [args.infection_rate],
+        parse_values(args.times_to_heal, int) if args.times_to_heal else [args.time_to_heal])
+    table = run_baseline(args.no_init_healthy + args.no_init_infect, args.no_init_infect, contact_rate, infection_rate,
+                         time_to_heal, args.baseline_days, args.replicates, args.seed)
+    output = args.baseline_output or f"output/{args.name}-baseline.csv"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    table.to_csv(output, index=False)
+    print(f"{len(contact_rate)} grid points x {max(args.replicates, 1)} runs x {args.baseline_days} days written to {output}")
+
+    if args.overlay:
+        first = table[(table["contact_rate"] == contact_rate[0]) & (table["infection_rate"] == infection_rate[0])
+                      & (table["time_to_heal"] == time_to_heal[0])]
+        plot_overlay(args.overlay, first, os.path.dirname(args.overlay) or ".")
+        print(f"Overlay plots written next to {args.overlay}")
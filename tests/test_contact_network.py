@@ -0,0 +1,43 @@
+import numpy as np
+
+from contact_network import HOUSEHOLD, RANDOM, ContactNetwork
+
+
+def small_network():
+    # Agents 0-1 share a household, 1-2 a workplace and 2-3 a random tie
+    indptr = np.array([0, 1, 3, 5, 6])
+    indices = np.array([1, 0, 2, 1, 3, 2], dtype=np.int32)
+    layer = np.array([HOUSEHOLD, HOUSEHOLD, 1, 1, RANDOM, RANDOM], dtype=np.int8)
+    return ContactNetwork(4, indptr, indices, layer)
+
+
+def test_build_gives_a_symmetric_simple_graph():
+    network = ContactNetwork.build(500, np.random.default_rng(1))
+    sources = np.repeat(np.arange(500), np.diff(network.indptr))
+    edges = set(zip(sources.tolist(), network.indices.tolist()))
+    assert all((target, source) in edges for source, target in edges)
+    assert not any(source == target for source, target in edges)
+    assert len(edges) == len(network.indices)
+    # Every tie is sampled from once
+    assert len(network.edge_sources) * 2 == len(network.indices)
+    assert (network.edge_sources < network.edge_targets).all()
+
+
+def test_household_members_meet_at_home_but_others_only_outside():
+    network = small_network()
+    everyone_home = np.zeros(4, dtype=bool)
+    sources, targets = network.sample(everyone_home, 100, np.random.default_rng(0))
+    assert list(zip(sources.tolist(), targets.tolist())) == [(0, 1)]
+    everyone_outside = np.ones(4, dtype=bool)
+    sources, targets = network.sample(everyone_outside, 100, np.random.default_rng(0))
+    assert sorted(zip(sources.tolist(), targets.tolist())) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_agents_away_use_none_of_their_ties():
+    network = small_network()
+    outside = np.array([False, True, True, True])
+    away = np.array([True, False, False, False])
+    sources, targets = network.sample(outside, 100, np.random.default_rng(0), away=away)
+    pairs = sorted(zip(sources.tolist(), targets.tolist()))
+    assert (0, 1) not in pairs
+    assert pairs == [(1, 2), (2, 3)]
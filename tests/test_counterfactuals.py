@@ -0,0 +1,30 @@
+import argparse
+
+import pytest
+
+from counterfactuals import parse_scenario
+from main import get_parser
+
+
+def test_values_take_the_attribute_type():
+    model = argparse.Namespace(infection_rate=0.1, contact_rate=5, pipeline=True)
+    assert parse_scenario("infection_rate=0.2, contact_rate=3", model) == {"infection_rate": 0.2, "contact_rate": 3}
+    assert parse_scenario("pipeline=False", model) == {"pipeline": False}
+    with pytest.raises(ValueError):
+        parse_scenario("pipeline=maybe", model)
+    with pytest.raises(ValueError):
+        parse_scenario("contact_rate=many", model)
+
+
+def test_none_attributes_take_the_option_type():
+    parser = get_parser()
+    args = parser.parse_args([])
+    assert args.plan_days is None
+    overrides = parse_scenario("plan_days=3,decision_deadline=2.5", args, parser)
+    assert overrides == {"plan_days": 3, "decision_deadline": 2.5}
+    assert isinstance(overrides["plan_days"], int)
+
+
+def test_none_attributes_without_an_option_are_rejected():
+    with pytest.raises(ValueError, match="is None"):
+        parse_scenario("plan_days=3", argparse.Namespace(plan_days=None))
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from disease import COUGH, FEVER, NORMAL, DiseaseModel
+from sir_baseline import run_baseline
+
+
+def no_draws(indices):
+    return np.zeros(len(indices))
+
+
+def infected_counts(model, state, days, steps):
+    counts = [model.count(state, "Infected")]
+    for _ in range(steps):
+        model.progress(state, days, no_draws)
+        counts.append(model.count(state, "Infected"))
+    return counts
+
+
+def test_sir_timing_matches_baseline():
+    # Initially infected agents start on day 1 of Infected, like World does
+    model = DiseaseModel.load("SIR", time_to_heal=6)
+    state = np.full(10, model.healthy, dtype=np.int8)
+    state[8:] = model.initial
+    days = np.zeros(10, dtype=np.int64)
+    days[8:] = 1
+    baseline = run_baseline(10, 2, 0.0, 0.0, 6, 10)
+    assert infected_counts(model, state, days, 10) == baseline["Infected"].tolist()
+    assert model.count(state, "Recovered") == 2
+
+
+def test_pending_agents_are_infected_for_time_to_heal_days():
+    model = DiseaseModel.load("SIR", time_to_heal=3)
+    state = np.array([model.pending, model.healthy], dtype=np.int8)
+    days = np.zeros(2, dtype=np.int64)
+    assert model.progress(state, days, no_draws) == 1
+    assert (state[0], days[0]) == (model.codes["Infected"], 1)
+    assert infected_counts(model, state, days, 3) == [1, 1, 1, 0]
+    assert state[1] == model.healthy
+
+
+def test_symptoms_and_diagnosis_follow_the_day_in_state():
+    model = DiseaseModel.load("SIR", time_to_heal=6)
+    infected = model.codes["Infected"]
+    assert [model.symptom(infected, day) for day in range(1, 8)] == [NORMAL, NORMAL, COUGH, FEVER, FEVER, COUGH, COUGH]
+    assert model.symptom(model.healthy, 1) == NORMAL
+    state = np.array([infected, infected, model.healthy], dtype=np.int8)
+    assert model.diagnosed(state, np.array([4, 3, 4])) == 1
+
+
+def test_branches_are_chosen_by_the_draws():
+    model = DiseaseModel.load("SEIAR", time_to_heal=6)
+    exposed = model.codes["Exposed"]
+    state = np.full(4, exposed, dtype=np.int8)
+    days = np.full(4, 2, dtype=np.int64)
+    model.progress(state, days, lambda indices: np.array([0.1, 0.59, 0.61, 0.9]))
+    names = [model.names[code] for code in state]
+    assert names == ["Infected", "Infected", "Asymptomatic", "Asymptomatic"]
+    assert (days == 1).all()
+
+
+def test_invalid_models_are_rejected():
+    config = {"compartments": ["S", "I"], "susceptible": ["S"], "infectious": ["I"], "infected": ["I"],
+              "infection": "I", "initial": "I", "transitions": [{"from": "I", "to": "S", "days": 0}]}
+    with pytest.raises(ValueError, match="at least one day"):
+        DiseaseModel(config)
+    config["transitions"] = [{"from": "I", "to": "X", "days": 1}]
+    with pytest.raises(ValueError, match="Unknown compartment"):
+        DiseaseModel(config)
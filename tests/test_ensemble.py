@@ -0,0 +1,39 @@
+import argparse
+import math
+
+import pytest
+
+import ensemble
+from utils import confidence_interval, t_quantile
+
+
+def test_t_quantile_small_df_is_exact():
+    assert t_quantile(1) == pytest.approx(12.706, abs=1e-3)
+    assert t_quantile(2) == pytest.approx(4.303, abs=1e-3)
+    assert t_quantile(2.7) == t_quantile(2)  # fractional df rounds down
+
+
+def test_t_quantile_large_df_approaches_normal():
+    assert t_quantile(30) == pytest.approx(2.0423, abs=1e-3)
+    assert t_quantile(31) == pytest.approx(2.0395, abs=1e-3)
+    assert t_quantile(1000) == pytest.approx(1.9623, abs=1e-3)
+    assert t_quantile(31) < t_quantile(30)
+
+
+def test_confidence_interval():
+    mean, half_width = confidence_interval([1.0, 3.0])
+    assert mean == 2.0
+    assert half_width == pytest.approx(12.706205)  # standard error 1, one degree of freedom
+    assert math.isnan(confidence_interval([1.0])[1])
+
+
+def test_ensemble_needs_min_replicates_before_stopping(monkeypatch, tmp_path):
+    # Identical replicates have a zero-width interval, so only MIN_REPLICATES keeps the first wave from stopping
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "output").mkdir()
+    monkeypatch.setattr(ensemble, "ensemble_outcomes", lambda model: {outcome: 5 for outcome in ensemble.OUTCOMES})
+    args = argparse.Namespace(name="test", load_from_run=0, no_of_runs=20, wave_size=1,
+                              ensemble_processes=1, ensemble_precision=0.1)
+    waves = ensemble.run_ensemble(args, lambda args, i: None)
+    assert waves[-1]["replicates"] == ensemble.MIN_REPLICATES
+    assert waves[-1]["stop"].startswith("precision")
@@ -0,0 +1,22 @@
+import json
+import types
+
+from group_prompts import parse_group_output
+
+AGENTS = [types.SimpleNamespace(unique_id=i) for i in (3, 4, 5)]
+
+
+def test_array_answers_are_mapped_to_agents():
+    output = 'Here you go:\n[{"id": 3, "reasoning": "Sick.", "response": "Yes"}, {"id": "4", "response": "no."}]'
+    assert parse_group_output(output, AGENTS) == {3: ("Sick.", "yes"), 4: (None, "no")}
+
+
+def test_bad_entries_are_skipped():
+    entries = [{"id": 9, "response": "yes"}, {"id": 3, "response": "maybe"}, {"response": "no"}, "text",
+               {"id": 4, "response": "yes"}, {"id": 4, "response": "no"}, {"id": 5, "response": "no"}]
+    assert parse_group_output(json.dumps(entries), AGENTS) == {5: (None, "no")}
+
+
+def test_unparseable_answers_give_nothing():
+    for output in [None, "", "no array here", "[{broken", '{"id": 3, "response": "yes"}']:
+        assert parse_group_output(output, AGENTS) == {}
@@ -0,0 +1,136 @@
+import logging
+import types
+
+import openai
+import pytest
+
+import utils
+from llm_control import AIMDController, CircuitBreaker, CircuitOpenError, Endpoint, EndpointPool
+
+
+def api_error(cls, status):
+    # Only the parts of an HTTP response that the error and get_completion_from_messages read
+    response = types.SimpleNamespace(status_code=status, headers={}, request=None)
+    return cls(str(status), response=response, body=None)
+
+
+class FakeClient:
+    '''
+    Stands in for openai.OpenAI: each create() raises or answers with the next scripted outcome
+    '''
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(with_raw_response=self))
+
+    def create(self, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        message = types.SimpleNamespace(content=outcome)
+        parsed = types.SimpleNamespace(usage=None, choices=[types.SimpleNamespace(message=message)])
+        return types.SimpleNamespace(headers={}, parse=lambda: parsed)
+
+
+def test_breaker_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.times_opened == 1
+    breaker.before_call()  # cooldown over: this call is the trial
+    assert breaker.state == "half-open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed" and not breaker.trial_in_flight
+
+
+def test_breaker_release_trial_keeps_state():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.release_trial()
+    assert breaker.state == "half-open"
+    breaker.before_call()  # the slot is free again
+    assert breaker.trial_in_flight
+
+
+def test_rate_limited_trial_does_not_wedge_breaker(monkeypatch):
+    # A 5xx opens the breaker; the half-open trial gets a 429, which must not block later calls
+    client = FakeClient([api_error(openai.InternalServerError, 500), api_error(openai.RateLimitError, 429),
+                         "Reasoning: fine.\nResponse: No"])
+    monkeypatch.setattr(utils, "client", client)
+    monkeypatch.setattr(utils, "circuit_breaker", CircuitBreaker(failure_threshold=1, cooldown=0))
+    monkeypatch.setattr(utils, "endpoint_pool", None)
+    monkeypatch.setattr(utils, "rate_controller", None)
+    monkeypatch.setattr(utils, "shared_bucket", None)
+    monkeypatch.setattr(utils, "local_backend", None)
+    # Keep the expected errors out of errors.txt
+    monkeypatch.setattr(utils, "error_logger", logging.getLogger("tests"))
+    # Without the backoff retries, so every outcome is seen by the test
+    complete = utils.get_completion_from_messages.__wrapped__
+    messages = [{"role": "user", "content": "Stay home?"}]
+
+    with pytest.raises(openai.InternalServerError):
+        complete(messages)
+    assert utils.circuit_breaker.state == "open"
+    with pytest.raises(openai.RateLimitError):
+        complete(messages)
+    assert not utils.circuit_breaker.trial_in_flight
+    assert complete(messages) == "Reasoning: fine.\nResponse: No"
+    assert utils.circuit_breaker.state == "closed"
+    assert client.calls == 3
+
+
+def test_aimd_grows_on_success_and_halves_once_per_round():
+    controller = AIMDController(initial_window=4, max_window=8)
+    sent = controller.acquire()
+    controller.release(sent)
+    assert controller.window == pytest.approx(4.25)
+    # Two 429s from requests sent before the cut only cut once
+    first, second = controller.acquire(), controller.acquire()
+    controller.release(first, rate_limited=True)
+    controller.release(second, rate_limited=True)
+    assert controller.window == pytest.approx(2.125)
+    # A request sent after the cut can cut again
+    third = controller.acquire()
+    controller.release(third, rate_limited=True)
+    assert controller.window == pytest.approx(1.0625)
+    assert controller.in_flight == 0 and controller.rate_limited == 3
+
+
+def test_aimd_failures_do_not_move_the_window():
+    controller = AIMDController(initial_window=4)
+    controller.release(controller.acquire(), failed=True)
+    assert controller.window == 4 and controller.in_flight == 0
+
+
+def test_pool_prefers_the_least_loaded_endpoint_per_weight():
+    heavy, light = Endpoint("heavy", weight=3), Endpoint("light", weight=1)
+    pool = EndpointPool([heavy, light])
+    chosen = [pool.acquire().name for _ in range(4)]
+    assert chosen.count("heavy") == 3 and chosen.count("light") == 1
+
+
+def test_pool_ejects_failing_endpoints_and_readmits_after_a_trial():
+    endpoint = Endpoint("flaky", eject_after=2, readmit_after=0)
+    pool = EndpointPool([endpoint])
+    for _ in range(2):
+        pool.release(pool.acquire(), failed=True)
+    assert endpoint.breaker.state == "open" and endpoint.breaker.times_opened == 1
+    # The half-open trial is rate limited: it gives its slot back instead of wedging the endpoint
+    pool.release(pool.acquire(), rate_limited=True, retry_after=0.01)
+    assert endpoint.breaker.state == "half-open" and not endpoint.breaker.trial_in_flight
+    pool.release(pool.acquire())
+    assert endpoint.breaker.state == "closed" and endpoint.outstanding == 0
+
+
+def test_pool_raises_when_every_endpoint_is_ejected():
+    only = Endpoint("only", eject_after=1, readmit_after=60)
+    pool = EndpointPool([only])
+    only.breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        pool.acquire()
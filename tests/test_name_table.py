@@ -0,0 +1,24 @@
+from name_table import name_rank
+
+
+def test_single_word_names():
+    assert name_rank("Jose") == (1, 1)
+    assert name_rank("Mary") == (0, 2)
+    assert name_rank("Qwxz") == (None, None)
+
+
+def test_multi_word_first_names_keep_their_own_rank():
+    assert name_rank("Jose Luis") == (1, 263)
+    assert name_rank("Mary Ann") == (0, 714)
+
+
+def test_composite_names_drop_only_the_surname():
+    assert name_rank("Jose Smith") == name_rank("Jose")
+    assert name_rank("Jose Luis Garcia") == name_rank("Jose Luis")
+    assert name_rank("Mary Ann Lee") == name_rank("Mary Ann")
+
+
+def test_top_limits_the_ranks():
+    assert name_rank("Jose Luis", top=100) == (None, None)
+    assert name_rank("Jose Luis Garcia", top=100) == (None, None)
+    assert name_rank("Jose Smith", top=100) == (1, 1)
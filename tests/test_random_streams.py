@@ -0,0 +1,43 @@
+from random_streams import RandomStreams
+
+
+def draws(generator, n=5):
+    return generator.random(n).tolist()
+
+
+def test_same_seed_and_run_reproduce():
+    assert draws(RandomStreams(42, 0).contacts) == draws(RandomStreams(42, 0).contacts)
+
+
+def test_purposes_runs_and_branches_are_independent():
+    streams = RandomStreams(42, 0)
+    assert draws(streams.contacts) != draws(RandomStreams(42, 0).infection)
+    assert draws(RandomStreams(42, 0).contacts) != draws(RandomStreams(42, 1).contacts)
+    assert draws(RandomStreams(42, 0).branch(0).contacts) != draws(RandomStreams(42, 0).contacts)
+    assert draws(streams.branch(0).contacts) != draws(streams.branch(1).contacts)
+    assert draws(streams.branch(3).contacts) == draws(RandomStreams(42, 0).branch(3).contacts)
+
+
+def test_a_stream_does_not_depend_on_draws_from_others():
+    streams = RandomStreams(7, 0)
+    streams.contacts.random(1000)
+    assert draws(streams.infection) == draws(RandomStreams(7, 0).infection)
+
+
+def test_agent_streams_are_keyed():
+    streams = RandomStreams(7, 2)
+    first = draws(streams.for_agent("fallback", 3, 5))
+    streams.contacts.random(10)
+    assert draws(streams.for_agent("fallback", 3, 5)) == first
+    assert draws(streams.for_agent("fallback", 4, 5)) != first
+    assert draws(streams.for_agent("fallback", 3, 6)) != first
+    assert draws(RandomStreams(7, 3).for_agent("fallback", 3, 5)) != first
+
+
+def test_keyed_uniforms():
+    streams = RandomStreams(7, 0)
+    value = streams.uniform("transmission", 3, 1, 2)
+    assert 0 <= value < 1
+    assert RandomStreams(7, 0).uniform("transmission", 3, 1, 2) == value
+    assert streams.uniform("transmission", 3, 2, 1) != value
+    assert streams.uniform("partner", 3, 1, 2) != value
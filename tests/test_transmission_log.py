@@ -0,0 +1,34 @@
+import numpy as np
+
+from transmission_log import (OUTSIDE, TransmissionLog, generations, load_records, reproduction_by_generation,
+                              secondary_case_distribution, secondary_cases, serial_intervals)
+
+# Agent 0 is an initial case (day 0); it infects 1 and 2 on day 3, 2 infects 3 on day 7,
+# agent 4 is infected by a visitor on day 5 and agent 5 never
+RECORDS = np.array([[0, OUTSIDE, 0], [3, 0, 1], [3, 0, 2], [5, -2, 4], [7, 2, 3]], dtype=np.int32)
+
+
+def test_generations():
+    assert generations(RECORDS, 6).tolist() == [0, 1, 1, 2, 0, -1]
+
+
+def test_secondary_cases_and_reproduction():
+    assert secondary_cases(RECORDS, 6).tolist() == [2, 0, 1, 0, 0, 0]
+    assert reproduction_by_generation(RECORDS, 6) == {0: (2, 1.0), 1: (2, 0.5), 2: (1, 0.0)}
+    assert secondary_case_distribution(RECORDS, 6).tolist() == [3, 1, 1]
+
+
+def test_serial_intervals_of_local_infections():
+    assert sorted(serial_intervals(RECORDS, 6).tolist()) == [3, 3, 4]
+
+
+def test_flush_and_truncate(tmp_path):
+    log = TransmissionLog(str(tmp_path / "run"), contacts=True)
+    for day, source, target in RECORDS.tolist():
+        log.infection(day, source, target)
+        log.contact_pairs(day, [(source, target)])
+    log.flush()
+    assert (load_records(log.transmissions_path) == RECORDS).all()
+    log.truncate(3)
+    assert load_records(log.transmissions_path).tolist() == RECORDS[:3].tolist()
+    assert len(load_records(log.contacts_path)) == 3
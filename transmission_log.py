@@ -0,0 +1,155 @@
+# Who infected whom: infections (and optionally contacts) of a run, logged with --transmission_log, e.g.
+# python transmission_log.py output/run-1/GABM
+# Both logs are flat files of int32 (day, source, target) records, appended one chunk per day:
+#  - <prefix>-transmissions.bin: every infection; day is the Step of the population CSV in which it is
+#    counted, day 0 records the initially infected, and a negative source means the infection came
+#    from outside the town's population (-1: initial case or travel, -2, -3, ...: visitors)
+#  - <prefix>-contacts.bin (--contact_log): every contact, once per pair (source < target, or a visitor as target)
+# Files are read back with memory mapping, so queries work on logs larger than memory.
+# With reinfection (e.g. --disease SEIRS) the per-agent queries use each agent's latest infection.
+import argparse
+import os
+
+import numpy as np
+
+OUTSIDE = -1
+
+
+class TransmissionLog:
+    '''
+    Buffers today's records in lists and appends them to the files as int32 arrays at the end of the day.
+    Only paths and buffers are kept, so the log is pickled with World checkpoints; a resumed run
+    truncates records of the days it is about to repeat (see truncate).
+    '''
+
+    def __init__(self, prefix, contacts=False):
+        self.transmissions_path = f"{prefix}-transmissions.bin"
+        self.contacts_path = f"{prefix}-contacts.bin" if contacts else None
+        self.infections = []
+        self.contacts = []
+
+    def infection(self, day, source, target):
+        self.infections.append((day, source, target))
+
+    def contact_pairs(self, day, pairs):
+        self.contacts.extend((day, source, target) for source, target in pairs)
+
+    def flush(self):
+        '''
+        Append the buffered records to the files
+        '''
+        for path, records in [(self.transmissions_path, self.infections), (self.contacts_path, self.contacts)]:
+            if path is None:
+                continue
+            with open(path, "ab") as file:
+                file.write(np.asarray(records, dtype=np.int32).reshape(-1, 3).tobytes())
+        self.infections = []
+        self.contacts = []
+
+    def truncate(self, day):
+        '''
+        Drop records of days after `day` (the day of a checkpoint being resumed); days are appended in order
+        '''
+        for path in [self.transmissions_path, self.contacts_path]:
+            if path is None or not os.path.exists(path):
+                continue
+            records = load_records(path)
+            keep = int(np.searchsorted(records[:, 0], day, side="right"))
+            del records
+            with open(path, "r+b") as file:
+                file.truncate(keep * 3 * np.dtype(np.int32).itemsize)
+
+
+def load_records(path):
+    '''
+    (day, source, target) records of a log file as a read-only memory-mapped int32 array of shape (n, 3)
+    '''
+    if os.path.getsize(path) == 0:
+        return np.empty((0, 3), dtype=np.int32)
+    return np.memmap(path, dtype=np.int32, mode="r").reshape(-1, 3)
+
+
+def infection_days(records, population):
+    '''
+    Day every agent was infected (-1 if never), by unique_id
+    '''
+    days = np.full(population, -1, dtype=np.int64)
+    days[records[:, 2]] = records[:, 0]
+    return days
+
+
+def generations(records, population):
+    '''
+    Generation of every infected agent (0 for infections from outside the population, -1 if never infected).
+    Sources are always infected on an earlier day, so one pass per day in order suffices.
+    '''
+    generation = np.full(population, -1, dtype=np.int64)
+    seeds = records[:, 1] < 0
+    generation[records[seeds, 2]] = 0
+    local = records[~seeds]
+    if len(local):
+        bounds = np.flatnonzero(np.diff(local[:, 0])) + 1
+        for chunk in np.split(local, bounds):
+            generation[chunk[:, 2]] = generation[chunk[:, 1]] + 1
+    return generation
+
+
+def secondary_cases(records, population):
+    '''
+    Number of agents each agent infected, by unique_id (0 for agents who infected nobody or were never infected)
+    '''
+    sources = records[:, 1]
+    return np.bincount(sources[sources >= 0], minlength=population)
+
+
+def reproduction_by_generation(records, population):
+    '''
+    Mean secondary cases of the infected agents of every generation, as {generation: (infectors, R)}.
+    The last generations are still infecting when a run ends early, so their R is biased low.
+    '''
+    generation = generations(records, population)
+    cases = secondary_cases(records, population)
+    result = {}
+    for g in range(int(generation.max()) + 1 if len(records) else 0):
+        members = generation == g
+        result[g] = (int(members.sum()), float(cases[members].mean()))
+    return result
+
+
+def serial_intervals(records, population):
+    '''
+    Days between the infection of the source and of the target for every local infection. With the built-in
+    disease models symptoms start a fixed number of days after infection, so this is also the serial interval.
+    '''
+    days = infection_days(records, population)
+    local = records[records[:, 1] >= 0]
+    return local[:, 0].astype(np.int64) - days[local[:, 1]]
+
+
+def secondary_case_distribution(records, population):
+    '''
+    How many infected agents caused 0, 1, 2, ... secondary cases (index = number of cases)
+    '''
+    infected = infection_days(records, population) >= 0
+    return np.bincount(secondary_cases(records, population)[infected])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("prefix", help="Log prefix, e.g. output/run-1/GABM (reads <prefix>-transmissions.bin).")
+    parser.add_argument("--population", default=None, type=int, help="Number of agents (default: highest logged id + 1).")
+    args = parser.parse_args()
+
+    records = load_records(f"{args.prefix}-transmissions.bin")
+    population = args.population or int(records[:, 1:].max()) + 1
+    print(f"{len(records)} infections over {int(records[:, 0].max()) if len(records) else 0} days")
+    for g, (infectors, r) in reproduction_by_generation(records, population).items():
+        print(f"Generation {g}: {infectors} infected, R = {r:.2f}")
+    intervals = serial_intervals(records, population)
+    if len(intervals):
+        print(f"Serial interval: mean = {intervals.mean():.2f} days, median = {np.median(intervals):.1f} days")
+    print(f"Secondary cases (0, 1, 2, ...): {secondary_case_distribution(records, population).tolist()}")
+    contacts_path = f"{args.prefix}-contacts.bin"
+    if os.path.exists(contacts_path):
+        contacts = load_records(contacts_path)
+        print(f"{len(contacts)} contacts, {len(contacts) / max(1, len(np.unique(contacts[:, 0]))):.1f} per day")
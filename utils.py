@@ -1,15 +1,22 @@
 from dotenv import load_dotenv
 load_dotenv() 
 
-from names_dataset import NameDataset
 import numpy as np
 import openai
 import os
+import math
+import itertools
 import shutil
+import json
+import time
 import random
 import logging
 import backoff
 
+from llm_control import AIMDController, CircuitBreaker, Endpoint, EndpointPool, ModelRouter, reset_delay_from_headers
+from rate_coordinator import SharedTokenBucket
+from name_table import load_names
+
 formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 
 backoff_logger = logging.getLogger('backoff')
@@ -24,53 +31,100 @@ file_handler_errors = logging.FileHandler('errors.txt')
 file_handler_errors.setFormatter(formatter)
 error_logger.addHandler(file_handler_errors)
 
-def probability_threshold(threshold):
+def probability_threshold(threshold, rng=None):
     '''
     Generates random number from 0 to 1
+    rng: np.random.Generator to draw from (default: the global numpy state)
     '''
-    
+    if rng is not None:
+        return (rng.random()<threshold)
     return (np.random.rand()<threshold)
 
-def generate_names(n: int, s: int, country_alpha2='US'):
+# 97.5% quantiles of Student's t for 1 to 30 degrees of freedom
+T_QUANTILES_975 = [12.706205, 4.302653, 3.182446, 2.776445, 2.570582, 2.446912, 2.364624, 2.306004, 2.262157, 2.228139,
+                   2.200985, 2.178813, 2.160369, 2.144787, 2.131450, 2.119905, 2.109816, 2.100922, 2.093024, 2.085963,
+                   2.079614, 2.073873, 2.068658, 2.063899, 2.059539, 2.055529, 2.051831, 2.048407, 2.045230, 2.042272]
+
+def t_quantile(df):
+    '''
+    97.5% quantile of Student's t (for 95% intervals): exact from the table up to 30 degrees of freedom
+    (fractional df, e.g. Welch's, are rounded down, which widens the interval), above that from the
+    normal quantile with a Cornish-Fisher expansion (within 0.01%)
+    '''
+    if df < 1:
+        raise ValueError(f"t quantile needs at least 1 degree of freedom, got {df}")
+    if df <= len(T_QUANTILES_975):
+        return T_QUANTILES_975[int(df) - 1]
+    z = 1.959964
+    return z + (z**3 + z) / (4 * df) + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+
+def confidence_interval(values):
+    '''
+    (mean, half width of the 95% interval) of the mean of values; the width is nan for fewer than 2 values
+    '''
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2:
+        return float(values.mean()), math.nan
+    return float(values.mean()), t_quantile(len(values) - 1) * values.std(ddof=1) / math.sqrt(len(values))
+
+def generate_names(n: int, s: int, country_alpha2='US', rng=None):
     '''
     Returns random names as names for agents from top names in the USA
     Used in World.init to initialize agents
+    rng: np.random.Generator to draw from (default: Python's random and the global numpy state)
     '''
 
     # This function will randomly selct n names (n/2 male and n/2 female) without
-    # replacement from the s most popular names in the country defined by country_alpha2
+    # replacement from the s most popular names in the country defined by country_alpha2,
+    # read from the bundled name table (see name_table.py)
     if n % 2 == 1:
         n += 1
     if s % 2 == 1:
         s += 1
-
-    nd = NameDataset()
-    male_names = nd.get_top_names(s//2, 'Male', country_alpha2)[country_alpha2]['M']
-    female_names = nd.get_top_names(s//2, 'Female', country_alpha2)[country_alpha2]['F']
     if s < n:
         raise ValueError(f"Cannot generate {n} unique names from a list of {s} names.")
+
+    male_table = load_names("male", country_alpha2)[:s//2]
+    female_table = load_names("female", country_alpha2)[:s//2]
+    if n//2 > min(len(male_table), len(female_table)):
+        # More agents than names in the table: first names are reused and combined with surnames
+        return generate_composite_names(n, male_table, female_table, load_names("surname", country_alpha2), rng)
+
+    male_names = [name.decode() for name in male_table]
+    female_names = [name.decode() for name in female_table]
     # generate names without repetition
-    names = random.sample(male_names, k=n//2) + random.sample(female_names, k=n//2)
+    if rng is not None:
+        names = [male_names[i] for i in rng.choice(len(male_names), size=n//2, replace=False)]
+        names += [female_names[i] for i in rng.choice(len(female_names), size=n//2, replace=False)]
+    else:
+        names = random.sample(male_names, k=n//2) + random.sample(female_names, k=n//2)
     del male_names
     del female_names
-    np.random.shuffle(names)
+    (rng if rng is not None else np.random).shuffle(names)
     return names
 
-
-def generate_big5_traits():
+def generate_composite_names(n, male_table, female_table, surname_table, rng=None):
     '''
-    Return big 5 traits for each agent
-    Used in World.init to initialize agents
+    "First Last" names for n agents (half male, half female in random order) drawn with replacement,
+    so any population size works; the first name keeps its rank and gender for evaluation
     '''
+    rng = rng if rng is not None else np.random.default_rng()
+    # Index into the male names followed by the female names
+    first_names = [name.decode() for name in male_table] + [name.decode() for name in female_table]
+    surnames = [name.decode() for name in surname_table]
+    male = rng.permutation(n) < n//2
+    first = np.where(male, rng.integers(len(male_table), size=n), len(male_table) + rng.integers(len(female_table), size=n))
+    last = rng.integers(len(surnames), size=n)
+    return [f"{first_names[i]} {surnames[j]}" for i, j in zip(first.tolist(), last.tolist())]
 
-    trait_list = [["extroverted", "introverted"],["agreeable","antagonistic"],["conscientious","unconscientious"],["neurotic","emotionally stable"],["open to experience","closed to experience"]]
-    traits = [np.random.choice(a, replace= False) for a in trait_list]
-    return traits
 
-def generate_age():
+# Big Five traits; each agent gets one of every pair with equal probability
+BIG5_TRAITS = [["extroverted", "introverted"],["agreeable","antagonistic"],["conscientious","unconscientious"],["neurotic","emotionally stable"],["open to experience","closed to experience"]]
+# Every combination of the traits, so agents with the same traits share one list
+TRAIT_COMBINATIONS = [list(combination) for combination in itertools.product(*BIG5_TRAITS)]
 
-    #list of percentage of population by age (18-65) from 2023
-    likelihoods = [
+#list of percentage of population by age (18-65) from 2023
+AGE_LIKELIHOODS = [
     2.0752895752895800,
     2.0752895752895800,
     2.1396396396396400,
@@ -120,53 +174,262 @@ def generate_age():
     1.9948519948519900,
     1.9465894465894500
     ]
-    likelihoods = [l/100 for l in likelihoods] #ensure that percentages are now probabilities
-    assert int(sum(likelihoods)) == 1, f"Sum of likelihoods is not 1! Sum is: {sum(likelihoods)}"
-    age_range = np.arange(18,66) #list of integers from 18-65
-    return int(np.random.choice(age_range,size=1, p = likelihoods)) #specifying probability distribution for choosing age
+AGES = np.arange(18,66) #list of integers from 18-65
+AGE_PROBABILITIES = np.array(AGE_LIKELIHOODS)/100 #ensure that percentages are now probabilities
+assert int(sum(AGE_PROBABILITIES)) == 1, f"Sum of likelihoods is not 1! Sum is: {sum(AGE_PROBABILITIES)}"
+AGE_CUMULATIVE = np.cumsum(AGE_PROBABILITIES/AGE_PROBABILITIES.sum())
 
-def update_day(agent):
-    """
-    Update the agent's day_infected counter.
-    Increment counters for new infections and update the world's currently_infected count.
-    """
-    agent.indiv_contact_rate = 0
-    Time_to_heal = 6
+def generate_personas(n, rng=None):
+    '''
+    Ages and Big Five traits of n agents in two vectorized draws
+    Used in World.init to initialize agents
+    Returns (ages, trait indices into TRAIT_COMBINATIONS) as arrays
+    rng: np.random.Generator to draw from (default: fresh entropy)
+    '''
+    rng = rng if rng is not None else np.random.default_rng()
+    ages = AGES[np.minimum(np.searchsorted(AGE_CUMULATIVE, rng.random(n), side="right"), len(AGES) - 1)]
+    traits = rng.integers(len(TRAIT_COMBINATIONS), size=n)
+    return ages, traits
 
-    if agent.health_condition in ["Susceptible", "Recovered"]:
-        return
 
-    if agent.health_condition == "To_Be_Infected":
-        agent.health_condition = "Infected"
-        agent.day_infected = 0
-        agent.model.daily_new_cases += 1
-        agent.model.currently_infected += 1
 
-    agent.day_infected += 1
+api_key = os.environ.get("OPENAI_API_KEY")
+client = openai.OpenAI(api_key=api_key)
 
-    if agent.day_infected > Time_to_heal:
-        agent.day_infected = None
-        agent.health_condition = "Recovered"
-        agent.model.currently_infected -= 1
+# Process-wide LLM call settings, set once from the command line via configure_llm()
+llm_settings = {
+    "request_timeout": None,  # seconds a single request may take before it is abandoned (None = client default)
+    "max_retry_time": None,   # seconds backoff keeps retrying one request (None = only max_tries applies)
+}
+circuit_breaker = CircuitBreaker()
+rate_controller = None  # AIMDController shared by all requests when adaptive concurrency is enabled
+shared_bucket = None  # SharedTokenBucket shared with other processes when a rate coordinator file is given
+local_backend = None  # LocalBackend answering instead of the API when the local backend is selected
+endpoint_pool = None  # EndpointPool spreading requests over several endpoints when an endpoints file is given
+model_router = None  # ModelRouter with cheap-to-strong model tiers when tiered routing is enabled
 
+def configure_llm(request_timeout=None, max_retry_time=None, breaker_threshold=None, breaker_cooldown=None,
+                  adaptive_concurrency=False, max_concurrency=32, tokens_per_minute=None,
+                  rate_coordinator=None, requests_per_minute=None,
+                  backend="openai", local_model=None, local_batch_size=32, local_max_new_tokens=120,
+                  base_url=None, endpoints=None, model_tiers=None, confidence_threshold=None):
+    '''
+    Set per-request timeout, retry budget, circuit breaker, rate controller, cross-process
+    rate coordinator and backend parameters for get_completion_from_messages
+    Used in main.py
+    '''
+    global client, rate_controller, shared_bucket, local_backend, endpoint_pool, model_router
+    if base_url is not None:
+        # e.g. mock_server.py; it does not check the key, so any placeholder works
+        client = openai.OpenAI(api_key=api_key or "mock-key", base_url=base_url)
+    llm_settings["request_timeout"] = request_timeout
+    llm_settings["max_retry_time"] = max_retry_time
+    circuit_breaker.configure(failure_threshold=breaker_threshold, cooldown=breaker_cooldown)
+    if adaptive_concurrency:
+        rate_controller = AIMDController(max_window=max_concurrency, tokens_per_minute=tokens_per_minute)
+    else:
+        rate_controller = None
+    if rate_coordinator is not None:
+        shared_bucket = SharedTokenBucket(rate_coordinator, requests_per_minute=requests_per_minute,
+                                          tokens_per_minute=tokens_per_minute)
+    else:
+        shared_bucket = None
+    if backend == "local":
+        # Imported here so torch/transformers are only needed for local runs
+        from local_backend import LocalBackend
+        options = {"batch_size": local_batch_size, "max_new_tokens": local_max_new_tokens}
+        if local_model is not None:
+            options["model_name"] = local_model
+        local_backend = LocalBackend(**options)
+    else:
+        local_backend = None
+    endpoint_pool = EndpointPool(load_endpoints(endpoints)) if endpoints is not None else None
+    model_router = ModelRouter(model_tiers, confidence_threshold) if model_tiers else None
 
+def load_endpoints(path):
+    '''
+    Build Endpoints from a JSON list, e.g.
+    [{"name": "key-1", "api_key_env": "OPENAI_API_KEY", "weight": 2, "max_concurrency": 16},
+     {"name": "key-2", "api_key_env": "OPENAI_API_KEY_2"},
+     {"name": "vllm", "base_url": "http://gpu-box:8000/v1", "model": "Qwen2.5-7B-Instruct"},
+     {"name": "cpu", "backend": "local", "model": "HuggingFaceTB/SmolLM2-360M-Instruct", "max_concurrency": 1}]
+    Optional keys: base_url, api_key_env (default OPENAI_API_KEY), model (overrides the requested model),
+    weight (default 1), max_concurrency, eject_after (consecutive failures, default 3),
+    readmit_after (seconds, default 30)
+    '''
+    with open(path) as file:
+        configs = json.load(file)
+    endpoints = []
+    for config in configs:
+        options = {key: config[key] for key in ["model", "weight", "max_concurrency", "eject_after", "readmit_after"] if key in config}
+        if config.get("backend", "openai") == "local":
+            from local_backend import LocalBackend
+            local = LocalBackend(model_name=config["model"]) if "model" in config else LocalBackend()
+            endpoints.append(Endpoint(config["name"], local=local, **options))
+        else:
+            key = os.environ.get(config.get("api_key_env", "OPENAI_API_KEY")) or "no-key"
+            endpoints.append(Endpoint(config["name"], client=openai.OpenAI(api_key=key, base_url=config.get("base_url")), **options))
+    return endpoints
 
-api_key = os.environ.get("OPENAI_API_KEY")
-client = openai.OpenAI(api_key=api_key)
-@backoff.on_exception(backoff.expo, (openai.RateLimitError, openai.APIConnectionError, openai.Timeout), max_tries=20, logger=backoff_logger)
+def endpoint_stats():
+    '''
+    Per-endpoint health and traffic of the endpoint pool, None if it is disabled
+    '''
+    return endpoint_pool.stats() if endpoint_pool is not None else None
+
+def uses_model_routing():
+    return model_router is not None
 
+def router_summary():
+    '''
+    Per-tier calls, latencies and escalation rates of the model router, None if it is disabled
+    '''
+    return model_router.summary() if model_router is not None else None
+
+def route_completion(messages, check, temperature=0):
+    '''
+    Ask the model tiers in order until check(output, logprobs, confidence_threshold) returns None.
+    The last tier's answer is used whatever check says.
+    Returns (output, model that produced it, ["<model>: <reason>" for each escalation])
+    Used in Agent.get_decision
+    '''
+    router = model_router
+    want_logprobs = router.confidence_threshold is not None
+    escalations = []
+    for i, tier in enumerate(router.tiers):
+        begin = time.monotonic()
+        if want_logprobs:
+            output, logprobs = get_completion_from_messages(messages, model=tier, temperature=temperature, return_logprobs=True)
+        else:
+            output, logprobs = get_completion_from_messages(messages, model=tier, temperature=temperature), None
+        latency = time.monotonic() - begin
+        reason = check(output, logprobs, router.confidence_threshold)
+        if reason is None or i == len(router.tiers) - 1:
+            router.record(tier, latency)
+            return output, tier, escalations
+        router.record(tier, latency, escalation_reason=reason)
+        escalations.append(f"{tier}: {reason}")
 
-def get_completion_from_messages(messages, model="gpt-4o-mini", temperature=0):
+def uses_local_backend():
+    return local_backend is not None
+
+def get_completions_batch(messages_list, temperature=0):
+    '''
+    Completions for many chats at once: one batched run on the local backend,
+    otherwise one API request per chat
+    Used in World.decide_locations
+    '''
+    if local_backend is not None:
+        return local_backend.complete_batch(messages_list, temperature=temperature)
+    return [get_completion_from_messages(messages, temperature=temperature) for messages in messages_list]
+
+def estimate_tokens(messages, completion_tokens=150):
+    '''
+    Rough token count of a request (about 4 characters per token) plus room for the completion
+    Used to debit the rate controller's token bucket before the real usage is known
+    '''
+    return sum(len(message["content"]) for message in messages) // 4 + completion_tokens
+
+def llm_stats():
+    '''
+    Current window and throughput of the rate controller, None if it is disabled
+    '''
+    return rate_controller.stats() if rate_controller is not None else None
+
+@backoff.on_exception(backoff.expo, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError), max_tries=20,
+                      max_time=lambda: llm_settings["max_retry_time"], logger=backoff_logger)
+
+
+def get_completion_from_messages(messages, model="gpt-4o-mini", temperature=0, return_logprobs=False):
+    '''
+    Completion text for messages; with return_logprobs, (text, [(token, logprob), ...]) where the
+    logprobs are None if the backend does not provide them
+    '''
+    if local_backend is not None:
+        content = local_backend.complete_batch([messages], temperature=temperature)[0]
+        return (content, None) if return_logprobs else content
+
+    pool = endpoint_pool
+    endpoint = None
+    target_client = client
+    if pool is not None:
+        # Per-endpoint breakers replace the global one, so a bad endpoint is ejected without stopping the day
+        endpoint = pool.acquire()
+        if endpoint.model is not None:
+            model = endpoint.model
+        if endpoint.local is not None:
+            try:
+                content = endpoint.local.complete_batch([messages], temperature=temperature)[0]
+            except Exception:
+                pool.release(endpoint, failed=True)
+                raise
+            pool.release(endpoint)
+            return (content, None) if return_logprobs else content
+        target_client = endpoint.client
+    else:
+        # Fails fast with CircuitOpenError (not retried by backoff) while the API keeps erroring
+        circuit_breaker.before_call()
+
+    request_options = {}
+    if llm_settings["request_timeout"] is not None:
+        request_options["timeout"] = llm_settings["request_timeout"]
+    if return_logprobs:
+        request_options["logprobs"] = True
+
+    controller = rate_controller
+    estimated_tokens = estimate_tokens(messages)
+    sent_at = controller.acquire(estimated_tokens) if controller is not None else None
+    bucket = shared_bucket
+    if bucket is not None:
+        bucket.acquire(estimated_tokens)
     try:
-        response = client.chat.completions.create(
+        # Raw response so the rate controller can read the x-ratelimit-* headers
+        raw_response = target_client.chat.completions.with_raw_response.create(
             model=model,
             messages=messages,
             temperature=temperature,  # this is the degree of randomness of the model's output
+            **request_options
         )
-        return response.choices[0].message.content
+        response = raw_response.parse()
+    except openai.RateLimitError as e:
+        # Rate limits are flow control for the controller, not faults for the circuit breaker
+        if controller is not None:
+            controller.release(sent_at, rate_limited=True, headers=e.response.headers, estimated_tokens=estimated_tokens)
+        if bucket is not None:
+            # Every process backs off, not just this one
+            bucket.pause(reset_delay_from_headers(e.response.headers) or 1.0)
+        if endpoint is not None:
+            pool.release(endpoint, rate_limited=True, retry_after=reset_delay_from_headers(e.response.headers))
+        else:
+            # Not a fault, but a half-open trial must give its slot back
+            circuit_breaker.release_trial()
+        error_logger.error(f"Rate limited. Error: {e}")
+        raise
     except Exception as e:
+        if controller is not None:
+            controller.release(sent_at, failed=True, estimated_tokens=estimated_tokens)
+        if endpoint is not None:
+            pool.release(endpoint, failed=True)
+        else:
+            circuit_breaker.record_failure()
         error_logger.error(f"Something unexpected happened YEET. Error: {e}")
         raise
+    used_tokens = response.usage.total_tokens if response.usage is not None else None
+    if controller is not None:
+        controller.release(sent_at, headers=raw_response.headers, estimated_tokens=estimated_tokens, used_tokens=used_tokens)
+    if bucket is not None and used_tokens is not None:
+        bucket.adjust_tokens(used_tokens - estimated_tokens)
+    if endpoint is not None:
+        pool.release(endpoint)
+    else:
+        circuit_breaker.record_success()
+    content = response.choices[0].message.content
+    if not return_logprobs:
+        return content
+    choice_logprobs = getattr(response.choices[0], "logprobs", None)
+    if choice_logprobs is None or not choice_logprobs.content:
+        return content, None
+    return content, [(item.token, item.logprob) for item in choice_logprobs.content]
         
 
 def clear_cache(): #clear cache for memory efficiency
@@ -0,0 +1,84 @@
+# Compare multi-day plan decisions (--plan_days) with daily querying, e.g.
+# python validate_plans.py --plan_days 7 --validate_days 20 --no_init_healthy 98 --shadow_sample 0.2
+# Runs the same seeded world once asking every agent daily and once with plans, and reports per day
+# the share of agents at home, the infected count and the LLM decisions requested by each mode.
+# In the plan run a --shadow_sample fraction of the agents following a plan are also asked the daily
+# question, and the share whose plan gives the same answer is reported.
+# Starts the mock server in-process unless --base_url is given.
+import contextlib
+import copy
+import io
+
+import numpy as np
+
+import mock_server
+from main import get_parser, configure_llm_from_args
+from utils import get_completion_from_messages
+from world import World
+
+
+def run(args, days, seed, shadow_sample=0.0):
+    '''
+    Simulate `days` days from a seeded world. Returns one dict per day with the share of agents at home,
+    the number infected, the number of LLM decisions requested and the shadow agreement (None without a sample).
+    '''
+    args = copy.copy(args)
+    args.seed = seed
+    model = World(args)
+    rows = []
+    for day in range(days):
+        agreements = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            if shadow_sample > 0 and args.plan_days is not None:
+                # Drawn from a separate generator so the sample does not change the simulation's random streams
+                rng = np.random.default_rng([seed, day])
+                for agent in model.schedule:
+                    if agent.plan_valid() and rng.random() < shadow_sample:
+                        daily = agent.parse_decision(get_completion_from_messages(agent.build_messages()))
+                        agreements.append(daily[1] == agent.plan_decision()[1])
+            model.step()
+        rows.append({
+            "home": sum(agent.location == "home" for agent in model.schedule) / model.population,
+            "infected": model.currently_infected,
+            "requests": model.population - model.carried_forward_today - model.fallbacks_today,
+            "agreement": sum(agreements) / len(agreements) if agreements else None,
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    mock_server.add_mock_arguments(parser)
+    parser.add_argument("--validate_days", default=20, type=int, help="Days to simulate in each mode.")
+    parser.add_argument("--shadow_sample", default=0.2, type=float, help="Fraction of plan-following agents also asked daily.")
+    args = parser.parse_args()
+    if args.plan_days is None:
+        parser.error("--plan_days is required")
+
+    server = None
+    if args.base_url is None:
+        server, args.base_url = mock_server.start_server(mock_server.state_from_args(args))
+    configure_llm_from_args(args)
+
+    daily_args = copy.copy(args)
+    daily_args.plan_days = None
+    seed = args.seed if args.seed is not None else 0
+    daily = run(daily_args, args.validate_days, seed)
+    planned = run(args, args.validate_days, seed, args.shadow_sample)
+
+    print("day | home daily | home plan | infected daily | infected plan | requests daily | requests plan | shadow agreement")
+    for day, (d, p) in enumerate(zip(daily, planned)):
+        agreement = "-" if p["agreement"] is None else f"{p['agreement']:.2f}"
+        print(f"{day + 1:3d} | {d['home']:10.2f} | {p['home']:9.2f} | {d['infected']:14d} | {p['infected']:13d} | "
+              f"{d['requests']:14d} | {p['requests']:13d} | {agreement}")
+
+    daily_requests = sum(d["requests"] for d in daily)
+    plan_requests = sum(p["requests"] for p in planned)
+    home_difference = np.mean([abs(d["home"] - p["home"]) for d, p in zip(daily, planned)])
+    agreements = [p["agreement"] for p in planned if p["agreement"] is not None]
+    print(f"LLM decisions: {daily_requests} daily vs {plan_requests} with plans ({daily_requests / max(plan_requests, 1):.1f}x fewer)")
+    print(f"Mean absolute difference in share at home: {home_difference:.3f}")
+    if agreements:
+        print(f"Mean shadow agreement of plans with daily answers: {np.mean(agreements):.2f}")
+    if server is not None:
+        server.shutdown()
@@ -1,26 +1,42 @@
+import gc
+import os
+import io
 import math
 import time
 import pickle
+import traceback
+import contextlib
+import multiprocessing
 import numpy as np
+import pandas as pd
 import concurrent.futures
 from tqdm import tqdm
 
 from agent import Agent
+from citizen import Citizen
 from datacollector import DataCollector
+from llm_control import LatencyTracker
+from random_streams import RandomStreams
+from contact_network import ContactNetwork
+from disease import DiseaseModel
+from transmission_log import OUTSIDE, TransmissionLog
+from group_prompts import build_group_messages, parse_group_output
 from utils import (
-    generate_age, generate_names, generate_big5_traits,
-    probability_threshold, update_day, clear_cache
+    generate_names, generate_personas, TRAIT_COMBINATIONS,
+    probability_threshold, clear_cache, llm_stats,
+    uses_local_backend, get_completions_batch, get_completion_from_messages, endpoint_stats,
+    router_summary
 )
 
 # DataCollector helper functions
 def compute_num_susceptible(model):
-    return sum(a.health_condition == "Susceptible" for a in model.schedule)
+    return model.disease.count(model.health_state, "Susceptible")
 
 def compute_num_infected(model):
-    return sum(a.health_condition == "Infected" for a in model.schedule)
+    return model.disease.count(model.health_state, "Infected")
 
 def compute_num_recovered(model):
-    return sum(a.health_condition == "Recovered" for a in model.schedule)
+    return model.disease.count(model.health_state, "Recovered")
 
 def compute_num_outside(model):
     return sum(a.location == "outside" for a in model.schedule)
@@ -37,6 +53,72 @@ def get_total_contacts(model):
 def get_day4_infected(model):
     return model.day_4_infected_today
 
+def get_fallbacks(model):
+    return model.fallbacks_today
+
+def get_hedges(model):
+    return model.hedges_today
+
+def get_hedges_won(model):
+    return model.hedges_won_today
+
+def get_batch_agreement(model):
+    return model.batch_agreement_today
+
+def get_escalations(model):
+    # Decisions made today (mems key time_step - 1 once the step is over) that needed a stronger model
+    return sum(bool(a.mems.get(model.time_step - 1, {}).get("escalations")) for a in model.schedule)
+
+def get_carried_forward(model):
+    return model.carried_forward_today
+
+def get_concurrency_window(model):
+    stats = llm_stats()
+    return stats["window"] if stats else None
+
+def get_requests_per_minute(model):
+    stats = llm_stats()
+    return stats["requests_per_minute"] if stats else None
+
+
+# World being forked (see World.fork); forked workers inherit it copy-on-write
+_fork_parent = None
+
+def _run_fork_branch(job):
+    """
+    Continue the inherited world for (branch index, branch, days) in a forked worker and return its rows.
+    """
+    index, branch, days = job
+    model = _fork_parent
+    overrides = {key: value for key, value in branch.items() if key != "seed"}
+    # Branches would all append to the parent's log files
+    model.transmission_log = None
+    for key, value in overrides.items():
+        setattr(model, key, value)
+    if "seed" in branch:
+        model.random = RandomStreams(branch["seed"], model.random.run)
+    else:
+        model.random = model.random.branch(index)
+    seed = model.random.seed
+
+    start = len(model.datacollector.get_model_vars_dataframe())
+    days_without_infected = 0
+    # Agents print every decision; keep the parent's console readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(days):
+            model.step()
+            model.datacollector.collect(model)
+            days_without_infected = days_without_infected + 1 if model.currently_infected == 0 else 0
+            if days_without_infected == 2:
+                break
+    rows = model.datacollector.get_model_vars_dataframe().iloc[start:].copy()
+    rows.insert(0, "Step", rows.index)
+    rows.insert(0, "seed", seed)
+    for key in reversed(list(overrides)):
+        rows.insert(0, key, overrides[key])
+    rows.insert(0, "branch", index)
+    return rows
+
 
 class World:
     """
@@ -47,13 +129,46 @@ class World:
      - Uses concurrency for agent location decisions
      - Implements an offset for checkpoint loading
      - Implements early stopping if no infected remain
+     - Bounds the decision phase with a per-day deadline and falls back for late agents
     """
 
-    def __init__(self, args):
+    # Defaults for options added after older checkpoints were pickled
+    max_workers = 4
+    decision_deadline = None
+    fallback_policy = "previous"
+    decision_retries = 1
+    fallbacks_today = 0
+    hedge_percentile = None
+    hedge_budget = 0.1
+    hedge_min_samples = 20
+    hedges_today = 0
+    hedges_won_today = 0
+    agents_per_request = 1
+    agreement_sample = 0.0
+    batch_agreement_today = None
+    redecide_tolerance = None
+    max_staleness = None
+    carried_forward_today = 0
+    plan_days = None
+    pipeline = False
+    replay_decisions = None
+    common_random_numbers = False
+    town_name = "Dewberry Hollow"
+    network = None
+    spatial = False
+    transmission_log = None
+
+    def __init__(self, args, run=0):
         """
         Initialize the World with the specified arguments.
+        run: index of this run among args.no_of_runs, so each run gets its own random streams
         """
 
+        # Random streams of this run (see random_streams.RandomStreams); with common random numbers,
+        # contacts and transmissions use keyed draws shared by every scenario run from the same seed
+        self.random = RandomStreams(args.seed, run)
+        self.common_random_numbers = args.common_random_numbers
+
         # Basic parameters from command-line or defaults
         self.name = args.name
         self.step_count = args.no_days
@@ -63,10 +178,56 @@ class World:
         self.contact_rate = args.contact_rate
         self.infection_rate = args.infection_rate
 
+        # Disease progression (see disease.DiseaseModel): every agent's compartment as an integer code
+        # and the days spent in it, advanced for everyone at once at the end of each day
+        self.disease = DiseaseModel.load(args.disease, time_to_heal=args.time_to_heal)
+
+        # Decision threads; with adaptive concurrency the rate controller decides how many are in flight
+        self.max_workers = args.max_workers
+        if args.adaptive_concurrency:
+            self.max_workers = max(args.max_workers, args.max_concurrency)
+
+        # Decision phase limits (see decide_locations)
+        self.decision_deadline = args.decision_deadline
+        self.fallback_policy = args.fallback_policy
+        self.decision_retries = args.decision_retries
+
+        # Request hedging (see decide_locations)
+        self.hedge_percentile = args.hedge_percentile
+        self.hedge_budget = args.hedge_budget
+        self.hedge_min_samples = args.hedge_min_samples
+        self.latency_tracker = LatencyTracker()
+
+        # Multi-agent prompts (see group_decisions)
+        self.agents_per_request = args.agents_per_request
+        self.agreement_sample = args.agreement_sample
+
+        # Incremental decisions (see agents_to_decide)
+        self.redecide_tolerance = args.redecide_tolerance
+        self.max_staleness = args.max_staleness
+
+        # Multi-day plans (see agents_to_decide and Agent.get_plan_decision)
+        self.plan_days = args.plan_days
+
+        # Write checkpoints in the background while the next day runs (see run_model)
+        self.pipeline = args.pipeline
+
+        # Spatial mode (see spatial_interactions); the grid size is set with the population below
+        self.spatial = args.spatial
+        self.contact_radius = args.contact_radius
+        self.move_step = args.move_step
+
         # Population setup
         self.initial_healthy = args.no_init_healthy
         self.initial_infected = args.no_init_infect
         self.population = self.initial_healthy + self.initial_infected
+        # By default the town grows with the population, keeping the density of 20 agents on 20 x 20, so an
+        # agent has the same expected number of neighbors within contact_radius at any population size
+        default_side = 20.0 * math.sqrt(self.population / 20)
+        self.grid_width = args.grid_width or default_side
+        self.grid_height = args.grid_height or default_side
+        self.health_state = np.full(self.population, self.disease.healthy, dtype=np.int8)
+        self.days_in_state = np.zeros(self.population, dtype=np.int16)
 
         # We'll keep agents in a list or array
         self.schedule = []
@@ -81,6 +242,11 @@ class World:
         self.total_contacts_today = 0
         self.day_4_infected_today = 0
         self.yesterday_day_4_infected = 0
+        self.fallbacks_today = 0
+        self.hedges_today = 0
+        self.hedges_won_today = 0
+        self.batch_agreement_today = None
+        self.carried_forward_today = 0
 
         # For early stopping: track how many are infected
         self.currently_infected = self.initial_infected  # will be updated in step()
@@ -96,42 +262,383 @@ class World:
                 "DailyNewCases": get_daily_new_cases,
                 "TotalContacts": get_total_contacts,
                 "Day4Infected": get_day4_infected,
+                "Fallbacks": get_fallbacks,
+                "Hedges": get_hedges,
+                "HedgesWon": get_hedges_won,
+                "ConcurrencyWindow": get_concurrency_window,
+                "RequestsPerMinute": get_requests_per_minute,
+                "BatchAgreement": get_batch_agreement,
+                "Escalations": get_escalations,
+                "CarriedForward": get_carried_forward,
             }
         )
 
         # ----- Create Agents -----
-        names = generate_names(self.population, self.population * 2)
-        agent_id = 0
-        for i in range(self.population):
-            # Everyone starts outside by default
-            location = "outside"
-
-            # Decide if healthy or infected
-            if i < self.initial_healthy:
-                health_condition = "Susceptible"
-                day_infected = None
+        # Personas and initial states are drawn for the whole population at once; agents then only wrap them
+        names = generate_names(self.population, self.population * 2, rng=self.random.names)
+        ages, trait_index = generate_personas(self.population, self.random.personas)
+        ages = ages.tolist()
+        traits = [TRAIT_COMBINATIONS[t] for t in trait_index.tolist()]
+
+        # The last initial_infected agents start infected, on their first day
+        self.health_state[self.initial_healthy:] = self.disease.initial
+        self.days_in_state[self.initial_healthy:] = 1
+
+        # Cyclic garbage collection would rescan the growing population over and over while it is built
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            if self.spatial:
+                positions = self.random.movement.uniform(size=(self.population, 2)) * (self.grid_width, self.grid_height)
+                # Everyone starts outside by default; health is already in the arrays
+                self.schedule = [Citizen(self, i, names[i], ages[i], traits[i], "outside", (x, y), None, None, self.grid_width, self.grid_height)
+                                 for i, (x, y) in enumerate(positions.tolist())]
             else:
-                health_condition = "Infected"
-                day_infected = 1
-
-            # Create the agent object
-            citizen = Agent(
-                model=self,
-                unique_id=agent_id,
-                name=names[i],
-                age=generate_age(),
-                traits=generate_big5_traits(),
-                location=location,
-                health_condition=health_condition,
-                day_infected=day_infected
-            )
-            self.schedule.append(citizen)
-            agent_id += 1
+                self.schedule = [Agent(self, i, names[i], ages[i], traits[i], "outside", None, None) for i in range(self.population)]
+        finally:
+            if collecting:
+                gc.enable()
 
-        # Convert to numpy array for convenience (optional)
-        self.schedule = np.array(self.schedule, dtype=object)
-        # Also build self.agents_outside for the first day
-        self.agents_outside = [a for a in self.schedule if a.location == "outside"]
+        # Structured contacts (see network_interactions); agents_by_id maps the network's ids to agents
+        self.agents_by_id = list(self.schedule)
+        if args.network:
+            self.network = ContactNetwork.build(self.population, self.random.network, household_size=args.household_size,
+                                                workplace_size=args.workplace_size, random_ties=args.random_ties)
+
+        # Convert to numpy array for convenience (optional); fromiter skips np.array's per-element sequence checks
+        self.schedule = np.fromiter(self.agents_by_id, dtype=object, count=self.population)
+        # Also build self.agents_outside for the first day (everyone starts outside)
+        self.agents_outside = list(self.agents_by_id)
+
+
+    def timed_decision(self, agent, started):
+        """
+        Run agent.get_decision() in a worker thread and return ((reasoning, response, details), latency in seconds).
+        started[agent.unique_id] is set when the first request for the agent begins running,
+        which is what hedging measures outstanding time against.
+        """
+        begin = time.monotonic()
+        started.setdefault(agent.unique_id, begin)
+        decision = agent.get_decision()
+        return decision, time.monotonic() - begin
+
+    def decide_locations(self):
+        """
+        Ask every agent for its decision concurrently, then apply the decisions in schedule order.
+         - With the local backend all prompts go through one batched run instead (see batch_decisions)
+         - With agents_per_request > 1 agents are asked in groups instead (see group_decisions); plans are always asked individually
+         - Waits at most self.decision_deadline seconds in total (None = wait for everyone)
+         - If hedge_percentile is set, a request running longer than that percentile of recent
+           latencies gets a duplicate; whichever finishes first is used. At most hedge_budget * population
+           duplicates are sent per day, and none before hedge_min_samples latencies were observed
+         - Agents whose request raised are resubmitted while time remains if fallback_policy is "retry"
+           (at most decision_retries extra passes)
+         - Agents still without a decision get Agent.fallback_decision(fallback_policy),
+           which is flagged in their mems entry for the day
+         - With redecide_tolerance set, only agents whose prompt inputs changed are asked; with plan_days set,
+           only agents without a valid plan are; when replaying a prior run, only inputs it never saw are (see agents_to_decide)
+        """
+        agents, carried = self.agents_to_decide()
+        if uses_local_backend():
+            decisions, details = self.batch_decisions(agents)
+            self.apply_decisions(decisions, details, carried)
+            return
+        if self.agents_per_request > 1 and self.plan_days is None:
+            decisions, details = self.group_decisions(agents)
+            self.apply_decisions(decisions, details, carried)
+            return
+
+        max_workers = self.max_workers
+        poll_interval = 0.05
+        start = time.monotonic()
+        decisions = {}
+        details = {}
+        pending = list(agents)
+        passes_left = 1 + (self.decision_retries if self.fallback_policy == "retry" else 0)
+        hedges_left = int(self.hedge_budget * self.population) if self.hedge_percentile is not None else 0
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        # Hedges get their own threads so they do not queue behind the requests they are meant to overtake
+        hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        deadline_hit = False
+        while pending and passes_left > 0 and not deadline_hit:
+            passes_left -= 1
+            started = {}
+            attempts = {executor.submit(self.timed_decision, agent, started): agent for agent in pending}
+            hedged = set()
+            hedge_futures = set()
+            failed = []
+
+            while attempts:
+                timeout = poll_interval if hedges_left > 0 else None
+                if self.decision_deadline is not None:
+                    remaining = max(0.0, self.decision_deadline - (time.monotonic() - start))
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                done, _ = concurrent.futures.wait(attempts, timeout=timeout,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    agent = attempts.pop(future)
+                    if agent.unique_id in decisions:
+                        continue  # the other copy of a hedged request already won
+                    if future.exception() is not None:
+                        # A hedged agent only fails once both copies have failed
+                        if agent in attempts.values():
+                            continue
+                        print(f"Decision for {agent.name} failed: {future.exception()}")
+                        failed.append(agent)
+                        continue
+                    (reasoning, response, agent_details), latency = future.result()
+                    decisions[agent.unique_id] = (reasoning, response)
+                    details[agent.unique_id] = agent_details
+                    self.latency_tracker.record(latency)
+                    if future in hedge_futures:
+                        self.hedges_won_today += 1
+                    # Drop the losing copy; cancel it if it has not started yet
+                    for other, other_agent in list(attempts.items()):
+                        if other_agent is agent:
+                            other.cancel()
+                            del attempts[other]
+
+                if self.decision_deadline is not None and time.monotonic() - start >= self.decision_deadline:
+                    if attempts:
+                        deadline_hit = True
+                        print(f"Decision deadline of {self.decision_deadline}s reached with {len(set(attempts.values()))} agents outstanding.")
+                    break
+
+                # Hedge requests that have been running longer than the latency percentile
+                if hedges_left > 0 and len(self.latency_tracker) >= self.hedge_min_samples:
+                    threshold = self.latency_tracker.percentile(self.hedge_percentile)
+                    now = time.monotonic()
+                    for agent in list(attempts.values()):
+                        if hedges_left == 0:
+                            break
+                        began = started.get(agent.unique_id)
+                        if agent.unique_id in hedged or began is None or now - began <= threshold:
+                            continue
+                        hedge = hedge_executor.submit(self.timed_decision, agent, started)
+                        attempts[hedge] = agent
+                        hedge_futures.add(hedge)
+                        hedged.add(agent.unique_id)
+                        hedges_left -= 1
+                        self.hedges_today += 1
+
+            pending = failed
+        # Do not block on stragglers or losing hedges; their results are ignored
+        executor.shutdown(wait=False, cancel_futures=True)
+        hedge_executor.shutdown(wait=False, cancel_futures=True)
+        self.apply_decisions(decisions, details, carried)
+
+    def newspaper_percentage(self):
+        """
+        Yesterday's new infections as the one-decimal percentage the agents read in the newspaper
+        """
+        return float(f"{(self.yesterday_day_4_infected*100)/self.population:.1f}")
+
+    def agents_to_decide(self):
+        """
+        Split the schedule into agents that need a fresh LLM decision today and agents whose last fresh
+        decision is carried forward. With redecide_tolerance and plan_days unset everyone is asked every day.
+        When replaying (see load_replay), agents whose inputs were seen in the recorded run reuse one of the
+        decisions recorded for them, drawn at random; only unseen inputs are asked.
+        With plan_days, agents whose plan is still valid (Agent.plan_valid) follow it instead of being asked.
+        With redecide_tolerance, an agent is asked again when
+         - it has no fresh decision yet, or its health string changed since the last one
+         - the newspaper percentage moved by more than redecide_tolerance percentage points since then
+         - the last fresh decision is max_staleness or more days old
+        Returns (agents to ask, {unique_id: (reasoning, response) to carry forward})
+        """
+        if self.replay_decisions is not None:
+            agents = []
+            carried = {}
+            for agent in self.schedule:
+                recorded = self.replay_decisions.get(self.replay_key(agent))
+                if recorded:
+                    if self.common_random_numbers:
+                        choice = int(self.random.uniform("replay", self.time_step, agent.unique_id) * len(recorded))
+                    else:
+                        choice = self.random.replay.integers(len(recorded))
+                    carried[agent.unique_id] = recorded[choice]
+                else:
+                    agents.append(agent)
+            return agents, carried
+        if self.plan_days is not None:
+            agents = [agent for agent in self.schedule if not agent.plan_valid()]
+            carried = {agent.unique_id: agent.plan_decision() for agent in self.schedule if agent.plan_valid()}
+            return agents, carried
+        if self.redecide_tolerance is None:
+            return list(self.schedule), {}
+        newspaper = self.newspaper_percentage()
+        agents = []
+        carried = {}
+        for agent in self.schedule:
+            last = getattr(agent, "last_fresh_decision", None)
+            if (last is None
+                    or last["health string"] != agent.get_health_string()
+                    or abs(newspaper - last["newspaper"]) > self.redecide_tolerance
+                    or (self.max_staleness is not None and self.time_step - last["day"] >= self.max_staleness)):
+                agents.append(agent)
+            else:
+                carried[agent.unique_id] = last["decision"]
+        return agents, carried
+
+    def replay_key(self, agent):
+        """
+        Decision-relevant inputs of an agent today: who it is, how it feels and what the newspaper says
+        """
+        return agent.unique_id, agent.get_health_string(), self.newspaper_percentage()
+
+    def load_replay(self, checkpoint_file):
+        """
+        Replay the decisions of a prior run saved in checkpoint_file (any of its daily checkpoints).
+        The agents take over the recorded personas, and every fresh LLM decision in the recorded mems
+        (not a fallback, carried forward or itself replayed) is indexed by replay_key, so the contact and infection process can be
+        re-simulated under a new seed, infection_rate or contact_rate while the LLM is only asked about
+        inputs never seen before. New answers are added to the index as they come in.
+        """
+        recorded = self.load_checkpoint(checkpoint_file)
+        if recorded.population != self.population:
+            raise ValueError(f"Cannot replay a run of {recorded.population} agents with {self.population} agents.")
+        agents = {agent.unique_id: agent for agent in self.schedule}
+        self.replay_decisions = {}
+        for old in recorded.schedule:
+            agent = agents[old.unique_id]
+            agent.name, agent.age, agent.traits = old.name, old.age, old.traits
+            agent.mems = {"name": old.name, "age": old.age, "traits": old.traits}
+            for day, entry in old.mems.items():
+                if not isinstance(day, int) or entry.get("fallback") or entry.get("carried forward") or entry.get("replayed"):
+                    continue
+                if "newspaper" not in entry:
+                    continue  # recorded before the newspaper figure was stored
+                key = (old.unique_id, entry["health string"], entry["newspaper"])
+                self.replay_decisions.setdefault(key, []).append((entry["reasoning"], entry["response"]))
+        print(f"Replaying {sum(len(v) for v in self.replay_decisions.values())} recorded decisions "
+              f"({len(self.replay_decisions)} distinct inputs) from {checkpoint_file}")
+
+    def batch_decisions(self, agents):
+        """
+        Decide for agents with one batched run of the local backend instead of a request per thread.
+        Returns (decisions, details) like group_decisions, with each new plan in details (see Agent.get_decision);
+        both are empty if the backend failed, so everyone falls back.
+        """
+        planning = self.plan_days is not None
+        try:
+            outputs = get_completions_batch([agent.build_plan_messages() if planning else agent.build_messages()
+                                             for agent in agents])
+        except Exception as e:
+            print(f"Batched decisions failed: {e}")
+            return {}, {}
+        decisions = {}
+        details = {}
+        for agent, output in zip(agents, outputs):
+            if planning:
+                reasoning, response, plan = agent.plan_from_output(output)
+                decisions[agent.unique_id] = (reasoning, response)
+                details[agent.unique_id] = {"plan": plan}
+            else:
+                decisions[agent.unique_id] = agent.parse_decision(output)
+        return decisions, details
+
+    def group_decisions(self, agents):
+        """
+        Ask agents in groups of agents_per_request per request (shared scenario, one persona line each, JSON array answer).
+         - Agents missing from or malformed in their group's answer are re-asked individually
+         - A random agreement_sample fraction of agents is also asked individually, and the share of them
+           whose grouped and individual responses agree is stored in batch_agreement_today
+         - decision_deadline bounds the whole phase; agents still undecided fall back in apply_decisions
+        Returns (decisions, details) where details[unique_id] is stored in that agent's mems entry.
+        """
+        start = time.monotonic()
+
+        def remaining():
+            if self.decision_deadline is None:
+                return None
+            return max(0.0, self.decision_deadline - (time.monotonic() - start))
+
+        groups = [agents[i:i + self.agents_per_request] for i in range(0, len(agents), self.agents_per_request)]
+        sampled = [agent for agent in agents if self.random.sampling.random() < self.agreement_sample]
+
+        def ask_group(group):
+            return parse_group_output(get_completion_from_messages(build_group_messages(group, self)), group)
+
+        decisions = {}
+        details = {}
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        group_futures = {executor.submit(ask_group, group): group for group in groups}
+        # Individual answers for the agreement sample are requested alongside the groups
+        sample_futures = {executor.submit(agent.get_decision): agent for agent in sampled}
+
+        done, _ = concurrent.futures.wait(group_futures, timeout=remaining())
+        missing = []
+        for future, group in group_futures.items():
+            answered = {}
+            if future in done and future.exception() is None:
+                answered = future.result()
+            elif future in done:
+                print(f"Group decision failed: {future.exception()}")
+            for agent in group:
+                if agent.unique_id in answered:
+                    decisions[agent.unique_id] = answered[agent.unique_id]
+                    details[agent.unique_id] = {"batched": True}
+                else:
+                    missing.append(agent)
+
+        # Re-ask individually whoever the group answers left out
+        individual_futures = {executor.submit(agent.get_decision): agent for agent in missing}
+        done, _ = concurrent.futures.wait(list(individual_futures) + list(sample_futures), timeout=remaining())
+        for future, agent in individual_futures.items():
+            if future in done and future.exception() is None:
+                reasoning, response, agent_details = future.result()
+                decisions[agent.unique_id] = (reasoning, response)
+                details[agent.unique_id] = {"batched": False, **agent_details}
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        # Only the sampled response is kept; the batched answer's details stay those of the group request
+        agreements = []
+        for future, agent in sample_futures.items():
+            if future in done and future.exception() is None and details.get(agent.unique_id, {}).get("batched"):
+                individual_response = future.result()[1]
+                details[agent.unique_id]["individual response"] = individual_response
+                agreements.append(individual_response == decisions[agent.unique_id][1])
+        self.batch_agreement_today = sum(agreements) / len(agreements) if agreements else None
+        print(f"Grouped decisions: {sum(d['batched'] for d in details.values())} from groups, {len(individual_futures)} re-asked individually, agreement with individual answers = {self.batch_agreement_today}")
+        return decisions, details
+
+    def apply_decisions(self, decisions, details=None, carried=None):
+        """
+        Set every agent's location from decisions ({unique_id: (reasoning, response)}) in schedule order,
+        using Agent.fallback_decision(fallback_policy) for agents without one.
+        details: optional {unique_id: dict} of extra fields for the agent's mems entry; a "plan" field is
+        the agent's new plan (see Agent.get_decision) and is assigned to the agent instead
+        carried: optional {unique_id: (reasoning, response)} carried forward from an earlier day
+        """
+        details = details or {}
+        carried = carried or {}
+        incremental = self.redecide_tolerance is not None or self.plan_days is not None
+        newspaper = self.newspaper_percentage()
+        num_fallbacks = 0
+        for agent in self.schedule:
+            agent_details = dict(details.get(agent.unique_id, {}))
+            if incremental:
+                agent_details["carried forward"] = agent.unique_id in carried
+            if self.replay_decisions is not None:
+                agent_details["replayed"] = agent.unique_id in carried
+            if agent.unique_id in carried:
+                agent.decide_location(carried[agent.unique_id], details=agent_details)
+            elif agent.unique_id in decisions:
+                if "plan" in agent_details:
+                    agent.plan = agent_details.pop("plan")
+                agent.decide_location(decisions[agent.unique_id], details=agent_details)
+                agent.last_fresh_decision = {"day": self.time_step, "health string": agent.get_health_string(),
+                                             "newspaper": newspaper, "decision": decisions[agent.unique_id]}
+                if self.replay_decisions is not None:
+                    self.replay_decisions.setdefault(self.replay_key(agent), []).append(decisions[agent.unique_id])
+            else:
+                reasoning, response, fallback = agent.fallback_decision(self.fallback_policy)
+                agent.decide_location((reasoning, response), fallback=fallback, details=agent_details)
+                num_fallbacks += 1
+        self.fallbacks_today = num_fallbacks
+        self.carried_forward_today = len(carried)
 
 
     def decide_agent_interactions(self):
@@ -139,18 +646,30 @@ class World:
         Decide who interacts with whom among the agents outside.
         The final contact assignments are stored in each agent's 'agent_interaction' list.
         """
+        if self.network is not None:
+            self.network_interactions()
+            return
+        if self.spatial:
+            self.spatial_interactions()
+            return
+
         # If only some fraction of the population is outside, scale contact rate
         fraction_outside = len(self.agents_outside) / self.population
         effective_rate = fraction_outside * self.contact_rate
         prob, base_int = math.modf(effective_rate)
 
+        if self.common_random_numbers:
+            self.common_random_interactions(prob, base_int)
+            return
+
         # Shuffle for randomness
-        np.random.shuffle(self.agents_outside)
+        rng = self.random.contacts
+        rng.shuffle(self.agents_outside)
 
         # Assign each agent's contact rate
         for agent in self.agents_outside:
             # e.g. if effective_rate=3.6 => base_int=3, prob=0.6 => 60% chance for an extra contact
-            agent.indiv_contact_rate = base_int + (1 if probability_threshold(prob) else 0)
+            agent.indiv_contact_rate = base_int + (1 if probability_threshold(prob, rng) else 0)
 
         # Actually pair them up
         for agent in self.agents_outside:
@@ -161,11 +680,135 @@ class World:
             ]
             # Now pick from that list until agent.indiv_contact_rate is reached or we run out
             while len(agent.agent_interaction) < agent.indiv_contact_rate and potential_list:
-                other_agent = np.random.choice(potential_list)
+                other_agent = potential_list[rng.integers(len(potential_list))]
                 agent.add_agent_interaction(other_agent)
                 potential_list.remove(other_agent)
 
 
+    def network_interactions(self):
+        """
+        decide_agent_interactions for the structured network: today's contacts are sampled from
+        the agents' ties (ContactNetwork.sample), so household members meet even when staying home
+        and other ties are only used between agents who are both in agents_outside. Agents outside
+        but not in agents_outside (travellers of a Town) are away and use none of their ties; agents
+        that are not in the network (a Town's visitors) meet contact_rate random agents outside instead.
+        """
+        outside = np.zeros(self.population, dtype=bool)
+        visitors = []
+        for agent in self.agents_outside:
+            if 0 <= agent.unique_id < self.population:
+                outside[agent.unique_id] = True
+            else:
+                visitors.append(agent)
+        away = np.fromiter((agent.location == "outside" for agent in self.agents_by_id), dtype=bool, count=self.population) & ~outside
+        rng = self.random.contacts
+        sources, targets = self.network.sample(outside, self.contact_rate, rng, away=away if away.any() else None)
+        for source, target in zip(sources.tolist(), targets.tolist()):
+            agent, other = self.agents_by_id[source], self.agents_by_id[target]
+            agent.agent_interaction.append(other)
+            other.agent_interaction.append(agent)
+
+        locals_outside = np.flatnonzero(outside)
+        prob, base_int = math.modf(self.contact_rate)
+        for visitor in visitors:
+            count = min(int(base_int) + (1 if probability_threshold(prob, rng) else 0), len(locals_outside))
+            for target in rng.choice(locals_outside, size=count, replace=False).tolist():
+                other = self.agents_by_id[target]
+                visitor.agent_interaction.append(other)
+                other.agent_interaction.append(visitor)
+
+    def spatial_interactions(self):
+        """
+        decide_agent_interactions for the spatial mode: agents on the grid take a random-walk step,
+        then every pair of them within contact_radius of each other (distances wrap at the edges) is a
+        potential contact. Neighbors are found through a cell list with cells of contact_radius, so each
+        agent only checks the 3x3 cells around it. Potential contacts are added in random order, up to
+        contact_rate contacts per agent. With the default grid size the density is the same at any
+        population, so a day costs time linear in the number of agents on the grid; a fixed
+        --grid_width/--grid_height packs more agents into every cell as the population grows.
+        """
+        rng = self.random.movement
+        on_grid = [agent for agent in self.agents_outside if agent.is_on_grid()]
+        for agent in on_grid:
+            agent.move(rng, self.move_step)
+
+        columns = max(1, int(self.grid_width // self.contact_radius))
+        rows = max(1, int(self.grid_height // self.contact_radius))
+
+        def cell_of(agent):
+            x, y = agent.pos
+            return int(x / self.grid_width * columns) % columns, int(y / self.grid_height * rows) % rows
+
+        cells = {}
+        for agent in on_grid:
+            cells.setdefault(cell_of(agent), []).append(agent)
+
+        pairs = []
+        radius_squared = self.contact_radius ** 2
+        for agent in on_grid:
+            column, row = cell_of(agent)
+            neighbor_cells = {((column + dc) % columns, (row + dr) % rows) for dc in (-1, 0, 1) for dr in (-1, 0, 1)}
+            for cell in neighbor_cells:
+                for other in cells.get(cell, []):
+                    if other.unique_id <= agent.unique_id:
+                        continue
+                    dx = abs(agent.pos[0] - other.pos[0])
+                    dy = abs(agent.pos[1] - other.pos[1])
+                    dx = min(dx, self.grid_width - dx)
+                    dy = min(dy, self.grid_height - dy)
+                    if dx * dx + dy * dy <= radius_squared:
+                        pairs.append((agent, other))
+
+        for agent in on_grid:
+            agent.indiv_contact_rate = self.contact_rate
+        for index in rng.permutation(len(pairs)):
+            agent, other = pairs[index]
+            agent.add_agent_interaction(other)
+
+    def common_random_interactions(self, prob, base_int):
+        """
+        decide_agent_interactions with common random numbers: the visiting order, each agent's extra
+        contact and the preference between every pair come from keyed draws (RandomStreams.uniform)
+        instead of a shared stream, so another scenario from the same seed reuses them for the same
+        agents on the same day even after the two runs diverge.
+        """
+        day = self.time_step
+        self.agents_outside.sort(key=lambda a: self.random.uniform("order", day, a.unique_id))
+        for agent in self.agents_outside:
+            extra = self.random.uniform("extra contact", day, agent.unique_id) < prob
+            agent.indiv_contact_rate = base_int + (1 if extra else 0)
+
+        for agent in self.agents_outside:
+            # Partners in order of the pair's draw, which is the same from either side
+            potential_list = sorted(
+                (a for a in self.agents_outside if a is not agent and (a not in agent.agent_interaction)),
+                key=lambda a: self.random.uniform("partner", day, min(a.unique_id, agent.unique_id), max(a.unique_id, agent.unique_id))
+            )
+            for other_agent in potential_list:
+                if len(agent.agent_interaction) >= agent.indiv_contact_rate:
+                    break
+                agent.add_agent_interaction(other_agent)
+
+    def transmits(self, agent, other):
+        """
+        Infection roll of agent.infect(other) for a contact involving an infected agent.
+        With common random numbers the draw is keyed by day and (agent, other), so a scenario with
+        a higher infection_rate infects a superset of the same contacts. Each side of a contact
+        rolls once, as without common random numbers.
+        """
+        if self.common_random_numbers:
+            return self.random.uniform("transmission", self.time_step, agent.unique_id, other.unique_id) < self.infection_rate
+        return probability_threshold(self.infection_rate, self.random.infection)
+
+    def progression_uniforms(self, indices):
+        """
+        Draws choosing the branch of agents (by unique_id) leaving a compartment with several transitions;
+        keyed by day and agent with common random numbers
+        """
+        if self.common_random_numbers:
+            return np.array([self.random.uniform("progression", self.time_step, int(i)) for i in indices])
+        return self.random.infection.random(len(indices))
+
     def step(self):
         """
         Run one "day" of the model:
@@ -173,7 +816,7 @@ class World:
           2. Agents decide location concurrently
           3. Build interaction pairs
           4. Infect
-          5. Update day_infected
+          5. Progress the disease (vectorized over all agents, see DiseaseModel.progress)
           6. Count day-4 infected
           7. time_step++
         """
@@ -182,13 +825,12 @@ class World:
         self.daily_new_cases = 0
         self.total_contacts_today = 0
         self.day_4_infected_today = 0
+        self.hedges_today = 0
+        self.hedges_won_today = 0
+
+        # 2. Agents decide location (parallel, bounded by the decision deadline)
+        self.decide_locations()
 
-        # 2. Agents decide location (parallel)
-        max_workers = 4
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = [executor.submit(agent.decide_location) for agent in self.schedule]
-            concurrent.futures.wait(futures)
-        
         #Code for non_multi-processing.
         # for agent in self.schedule:
         #     agent.decide_location()
@@ -200,7 +842,16 @@ class World:
         self.decide_agent_interactions()
 
         # 4. Interact => Infect (also track total contacts)
-        np.random.shuffle(self.schedule)
+        if self.common_random_numbers:
+            day = self.time_step
+            self.schedule = np.array(sorted(self.schedule, key=lambda a: self.random.uniform("schedule", day, a.unique_id)), dtype=object)
+        else:
+            self.random.schedule.shuffle(self.schedule)
+        if self.transmission_log is not None and self.transmission_log.contacts_path is not None:
+            self.transmission_log.contact_pairs(self.time_step + 1, [
+                (agent.unique_id, other.unique_id) for agent in self.schedule for other in agent.agent_interaction
+                if other.unique_id < 0 or agent.unique_id < other.unique_id
+            ])
         for agent in self.schedule:
             # Tally how many interactions occur
             self.total_contacts_today += len(agent.agent_interaction)
@@ -209,24 +860,42 @@ class World:
             # agent.interact() resets agent.agent_interaction afterwards
 
         for agent in self.schedule:
-            update_day(agent)  # This increments agent.day_infected, sets 'To_Be_Infected' to 'Infected', etc.
+            agent.indiv_contact_rate = 0
 
-        # Recompute how many are infected after the day ends
-        new_infected_count = compute_num_infected(self)
-        self.currently_infected = new_infected_count
+        # 5. Progress the disease: 'To_Be_Infected' agents become infected, the others move on after their compartment's duration
+        self.daily_new_cases += self.disease.progress(self.health_state, self.days_in_state, self.progression_uniforms)
 
-        # self.daily_new_cases is incremented inside agent.infect() (see agent code),
-        # or you can do it here if you prefer. 
-        # Just be sure you do it consistently.
+        # Recompute how many are infected after the day ends
+        self.currently_infected = int(np.count_nonzero(self.disease.infected[self.health_state]))
 
-        # 6. Count day-4 infected
-        for agent in self.schedule:
-            if agent.health_condition == "Infected" and agent.day_infected == 4:
-                self.day_4_infected_today += 1
+        # 6. Count day-4 infected (the disease model's diagnosis day)
+        self.day_4_infected_today = self.disease.diagnosed(self.health_state, self.days_in_state)
 
         # 7. This day is over, increment time_step
         self.time_step += 1
         self.yesterday_day_4_infected = self.day_4_infected_today
+        if self.transmission_log is not None:
+            self.transmission_log.flush()
+
+    def start_transmission_log(self, prefix, contacts=False):
+        """
+        Log infections (and contacts if contacts) to <prefix>-transmissions.bin (and <prefix>-contacts.bin),
+        see transmission_log.py. A fresh world records its initially infected agents as day 0 infections
+        from outside; a resumed one drops records of the days it is about to repeat.
+        The directory of prefix is created if needed.
+        """
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        self.transmission_log = TransmissionLog(prefix, contacts)
+        if self.time_step == 0:
+            for path in [self.transmission_log.transmissions_path, self.transmission_log.contacts_path]:
+                if path is not None and os.path.exists(path):
+                    os.remove(path)
+            for agent in self.schedule:
+                if not agent.is_susceptible():
+                    self.transmission_log.infection(0, OUTSIDE, agent.unique_id)
+            self.transmission_log.flush()
+        else:
+            self.transmission_log.truncate(self.time_step)
 
     def run_model(self, checkpoint_path, offset):
         """
@@ -235,11 +904,49 @@ class World:
          - For each day: step() then collect
          - Possibly stop early if no infected remain
          - Save checkpoint each day
+         - With pipeline, each checkpoint is pickled and written by a forked child process (see
+           start_background_checkpoint): the fork takes a copy-on-write snapshot of the world, so the
+           next day's decisions start right away instead of waiting for pickle.dumps and the disk write.
+           At most one checkpoint is outstanding, and a failed one is raised on the next day. The day's
+           data collection and progress output still run in the day loop before the snapshot, since the
+           checkpoint includes the collected row; they are a pass over the agents, not a serialization.
+           Without os.fork only the disk write is moved to a background thread.
         """
 
         self.offset = offset
         end_program = 0
         start = time.time()
+        print(f"Random seed: {self.random.seed} (run {self.random.run})")
+        background_fork = self.pipeline and hasattr(os, "fork")
+        io_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) if self.pipeline and not background_fork else None
+        pending_write = None
+
+        def wait_for_pending():
+            nonlocal pending_write
+            if pending_write is None:
+                return
+            if background_fork:
+                pid, path = pending_write
+                _, status = os.waitpid(pid, 0)
+                if os.waitstatus_to_exitcode(status) != 0:
+                    raise RuntimeError(f"Writing checkpoint {path} failed (see the error output of the checkpoint process).")
+            else:
+                pending_write.result()
+            pending_write = None
+
+        def checkpoint(path, clear=False):
+            nonlocal pending_write
+            if not self.pipeline:
+                self.save_checkpoint(path)
+                if clear:
+                    clear_cache()
+                return
+            wait_for_pending()
+            if background_fork:
+                pending_write = (self.start_background_checkpoint(path, clear), path)
+            else:
+                # Snapshot now: the next day's decision threads change agents while the file is written
+                pending_write = io_executor.submit(self.write_checkpoint, path, pickle.dumps(self), clear)
 
         # --- 0. Collect initial conditions for "Day 0" ---
         self.datacollector.collect(self)
@@ -255,6 +962,13 @@ class World:
 
             # Print debug info
             print(f"End of Day {self.time_step}: daily_new_cases = {self.daily_new_cases}, infected = {self.currently_infected}, day4inf = {self.day_4_infected_today}")
+            stats = llm_stats()
+            if stats:
+                print(f"LLM rate controller: window = {stats['window']}, in flight = {stats['in_flight']}, requests/min = {stats['requests_per_minute']}, rate limited = {stats['rate_limited']}")
+            for tier in router_summary() or []:
+                print(f"Model tier {tier['model']}: calls = {tier['calls']}, mean latency = {tier['mean_latency']}, p95 latency = {tier['p95_latency']}, escalation rate = {tier['escalation_rate']}, reasons = {tier['escalation_reasons']}")
+            for endpoint in endpoint_stats() or []:
+                print(f"Endpoint {endpoint['name']}: {endpoint['state']}, outstanding = {endpoint['outstanding']}, requests = {endpoint['requests']}, failures = {endpoint['failures']}, rate limited = {endpoint['rate_limited']}, ejections = {endpoint['ejections']}")
 
             # C) Early stopping check
             if self.currently_infected == 0:
@@ -262,24 +976,105 @@ class World:
             if end_program == 2:
                 # Save final checkpoint and break
                 final_path = f"{checkpoint_path}/{self.name}-final_early.pkl"
-                self.save_checkpoint(final_path)
+                checkpoint(final_path)
                 break
 
             # D) Save a checkpoint at the end of each day
             path = f"{checkpoint_path}/{self.name}-{i+1}.pkl"
-            self.save_checkpoint(path)
-            clear_cache()
+            checkpoint(path, clear=True)
 
+        wait_for_pending()
+        if io_executor is not None:
+            io_executor.shutdown(wait=True)
         end = time.time()
         print(f"Time taken for {self.population} agents and {self.time_step} days: {end - start} seconds.")
 
 
+    def fork(self, branches, days, processes=None):
+        """
+        Run counterfactual continuations of this world (typically a loaded checkpoint) in parallel.
+        branches: list of dicts of World attributes to override (e.g. {"infection_rate": 0.2}),
+        optionally with a "seed" for the branch's random streams (default: streams derived from this
+        world's seed and the branch index, see RandomStreams.branch).
+        Each branch runs up to `days` more days (stopping early like run_model) in a forked process,
+        which shares this world's memory copy-on-write instead of reloading or copying it.
+        Returns one table with a row per branch and day: branch, overrides, seed, Step and the collected reporters.
+        Needs the "fork" start method (POSIX only); this world is left unchanged.
+        """
+        global _fork_parent
+        for branch in branches:
+            for key in branch:
+                if key != "seed" and not hasattr(self, key):
+                    raise ValueError(f"Unknown World attribute to override: {key}")
+        _fork_parent = self
+        try:
+            # One branch per worker process, so every branch starts from an untouched copy of this world
+            with multiprocessing.get_context("fork").Pool(processes, maxtasksperchild=1) as pool:
+                tables = pool.map(_run_fork_branch, [(index, branch, days) for index, branch in enumerate(branches)], chunksize=1)
+        finally:
+            _fork_parent = None
+        return pd.concat(tables, ignore_index=True)
+
+    def __setstate__(self, state):
+        """
+        Restore from a pickle, giving checkpoints from older versions fresh
+        instances of stateful helpers they did not have yet.
+        """
+        self.__dict__.update(state)
+        if "latency_tracker" not in state:
+            self.latency_tracker = LatencyTracker()
+        if "random" not in state:
+            # Older checkpoints kept no random state; continue with fresh streams
+            self.random = RandomStreams()
+        if "disease" not in state:
+            # Older checkpoints stored health on the agents, with the previously fixed 6 days to heal
+            self.disease = DiseaseModel.load("SIR", time_to_heal=6)
+            self.health_state = np.full(self.population, self.disease.healthy, dtype=np.int8)
+            self.days_in_state = np.zeros(self.population, dtype=np.int16)
+            for agent in self.schedule:
+                agent.health_condition = agent.__dict__.pop("health_condition")
+                agent.day_infected = agent.__dict__.pop("day_infected")
+
     def save_checkpoint(self, file_path):
         """
         Save a pickle checkpoint of the current model state.
         """
-        with open(file_path, "wb") as file:
-            pickle.dump(self, file)
+        self.write_checkpoint(file_path, pickle.dumps(self))
+
+    def start_background_checkpoint(self, file_path, clear=False):
+        """
+        Fork a child process that pickles this world to file_path and exits; returns its pid.
+        The child works on the fork's copy-on-write snapshot, so the parent can go on changing the
+        world (including from leftover decision threads, which do not exist in the child) right away.
+        The child exits with a non-zero code if the checkpoint could not be written.
+        """
+        pid = os.fork()
+        if pid:
+            return pid
+        code = 0
+        try:
+            self.save_checkpoint(file_path)
+            if clear:
+                clear_cache()
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            # Skip the parent's exit handlers and buffered output
+            os._exit(code)
+
+    @staticmethod
+    def write_checkpoint(file_path, data, clear=False):
+        """
+        Write pickled model bytes to file_path through a temporary file, so an interrupted write
+        never replaces a good checkpoint with a truncated one. Clears the cache afterwards if clear.
+        """
+        temporary_path = f"{file_path}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(data)
+        os.replace(temporary_path, file_path)
+        if clear:
+            clear_cache()
 
     @staticmethod
     def load_checkpoint(file_path):